@@ -0,0 +1,80 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare rendering a precipitation loop from scratch, a new figure and
+PNG file per frame, with streaming one live figure to the encoder.
+
+    python benchmarks/bench_animation.py
+"""
+
+import os
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import cartopy.crs as ccrs
+from PIL import Image
+from dk_met_graphics.plot.util import (
+    new_figure, close_figure, figure_to_bytes)
+from dk_met_graphics.plot.precipitation import draw_precipitation_nws
+from dk_met_graphics.plot.animation import animate_precipitation_nws
+from common import table
+
+
+def benchmark_animation(nframes=12, shape=(741, 1261), outdir=None):
+    """
+    Compare rendering a precipitation loop from scratch (a new figure
+    and PNG file per frame, then encoding) with `animate_precipitation_nws`.
+
+    :param nframes: number of frames.
+    :param shape: (nlat, nlon) grid shape of the synthetic fields.
+    :param outdir: directory of the outputs, default is a temporary
+                   directory.
+    :return: pandas data frame with the frames per second and peak
+             traced memory (MB) of each way.
+    """
+    if outdir is None:
+        outdir = tempfile.mkdtemp()
+    lon = np.linspace(73, 136, shape[1])
+    lat = np.linspace(17, 54, shape[0])
+    frames = [{'lon': lon, 'lat': lat, 'data': np.maximum(
+        0, 60 * np.sin((lon[None, :] + 2 * i) / 4.) *
+        np.cos(lat[:, None] / 3.)).astype(np.float32)}
+        for i in range(nframes)]
+    rows = []
+
+    # every frame from scratch, written to PNG files
+    tracemalloc.start()
+    start = time.perf_counter()
+    pngs = []
+    for i, frame in enumerate(frames):
+        fig = new_figure(figsize=(8.6, 6.2), pyplot=False)
+        ax = fig.add_axes((0.1, 0.14, 0.85, 0.8),
+                          projection=ccrs.PlateCarree())
+        plots = draw_precipitation_nws(ax, frame)
+        fig.colorbar(plots['prep'], cax=fig.add_axes((0.16, 0.06, 0.7, 0.03)),
+                     orientation='horizontal')
+        pngs.append(os.path.join(outdir, 'frame_{:03d}.png'.format(i)))
+        with open(pngs[-1], 'wb') as f:
+            f.write(figure_to_bytes(fig, compress_level=1))
+        close_figure(fig)
+    images = [Image.open(png) for png in pngs]
+    images[0].save(os.path.join(outdir, 'scratch.gif'), save_all=True,
+                   append_images=images[1:], duration=250, loop=0)
+    seconds = time.perf_counter() - start
+    rows.append(['scratch', nframes / seconds,
+                 tracemalloc.get_traced_memory()[1] / 1024. ** 2])
+    tracemalloc.stop()
+
+    # one live figure streamed to the encoder
+    tracemalloc.start()
+    stats = animate_precipitation_nws(
+        frames, os.path.join(outdir, 'animate.gif'))
+    rows.append(['animate', stats['fps'],
+                 tracemalloc.get_traced_memory()[1] / 1024. ** 2])
+    tracemalloc.stop()
+    return table(rows, ['method', 'fps', 'peak MB'])
+
+
+if __name__ == '__main__':
+    print(benchmark_animation().to_string())
@@ -0,0 +1,76 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare the wind sampling of `GeoAxes.barbs` (cartopy
+`vector_scalar_to_grid`) with the cached barb sampler, on a Lambert
+conformal map of China.
+
+    python benchmarks/bench_barbs.py
+"""
+
+import time
+import numpy as np
+import cartopy.crs as ccrs
+from cartopy.vector_transform import vector_scalar_to_grid
+from dk_met_graphics.plot.barbs import (
+    regrid_shape_aspect, cached_sampler, sample_vectors, clear_sampler_cache)
+from common import best_of, table
+
+
+def benchmark_barbs(shape=(361, 721), regrid_shape=20, repeat=3):
+    """
+    Sample the winds of a global grid at the barb positions with both
+    methods.
+
+    :param shape: (nlat, nlon) global grid shape.
+    :param regrid_shape: barbs along the shorter map side.
+    :param repeat: number of samplings of each method.
+    :return: pandas data frame with the seconds per field of both
+             methods and of the first sampler computation, and the
+             maximum difference of the projected components (m/s).
+    """
+    lon = np.linspace(0, 360, shape[1])
+    lat = np.linspace(90, -90, shape[0])
+    u = 20 * np.cos(np.radians(lat[:, None]) * 3) + 0 * lon[None, :]
+    v = 10 * np.sin(np.radians(lon[None, :]) * 4) + 0 * lat[:, None]
+    projection = ccrs.LambertConformal(central_longitude=105,
+                                       standard_parallels=(25, 47))
+    extent = projection.transform_points(
+        ccrs.PlateCarree(), np.array([80., 130.]), np.array([15., 55.]))
+    extent = (extent[0, 0], extent[1, 0], extent[0, 1], extent[1, 1])
+    nx_ny = regrid_shape_aspect(regrid_shape, extent)
+
+    cartopy_seconds, (gx, gy, gu, gv) = best_of(
+        lambda: vector_scalar_to_grid(
+            ccrs.PlateCarree(), projection, nx_ny, lon, lat, u, v,
+            target_extent=extent), repeat)
+
+    clear_sampler_cache()
+    start = time.perf_counter()
+    sampler = cached_sampler(lon, lat, projection, extent,
+                             regrid_shape=nx_ny, cache=False)
+    first_seconds = time.perf_counter() - start
+    sampler_seconds, (su, sv) = best_of(
+        lambda: sample_vectors(cached_sampler(
+            lon, lat, projection, extent, regrid_shape=nx_ny, cache=False),
+            u, v), repeat)
+
+    # the same positions, row-major from the lower left
+    valid = np.isfinite(gu.ravel())
+    reference = np.stack([gu.ravel()[valid], gv.ravel()[valid]])
+    mine = np.full((2, gu.size), np.nan)
+    order = np.round(np.stack([gx.ravel(), gy.ravel()], axis=1), 3)
+    position = {tuple(p): i for i, p in enumerate(order)}
+    for k, p in enumerate(np.round(np.stack(
+            [sampler['x'], sampler['y']], axis=1), 3)):
+        mine[:, position[tuple(p)]] = su[k], sv[k]
+    difference = np.nanmax(np.abs(mine[:, valid] - reference))
+
+    return table([['cartopy', cartopy_seconds, np.nan],
+                  ['first sampler', first_seconds, np.nan],
+                  ['sampler', sampler_seconds, difference]],
+                 ['method', 'seconds', 'max difference'])
+
+
+if __name__ == '__main__':
+    print(benchmark_barbs().to_string())
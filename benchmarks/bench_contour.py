@@ -0,0 +1,66 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare `ax.contour` and `ax.contourf` with `contour.draw_contour` on
+the first and later (cached) draws of the same field.
+
+    python benchmarks/bench_contour.py
+"""
+
+import time
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.contour import draw_contour, clear_contour_cache
+from common import synthetic_field, table
+
+
+def benchmark_contour(shape=(1441, 2881), nlevels=20, repeat=3):
+    """
+    Draw the contour lines (with labels) and filled contours of a
+    global field with both methods.
+
+    :param shape: (nlat, nlon) grid shape of the synthetic field.
+    :param nlevels: number of contour levels.
+    :param repeat: number of draws of each method.
+    :return: pandas data frame with the seconds of the first and best
+             later draw of every method, including the figure
+             rendering.
+    """
+    lon = np.linspace(0, 360, shape[1])
+    lat = np.linspace(-90, 90, shape[0])
+    field = synthetic_field(lon, lat, 5600, 150).astype(np.float32)
+    levels = np.linspace(5450, 5750, nlevels)
+    datacrs = ccrs.PlateCarree()
+
+    def draw(method, filled):
+        fig = new_figure(figsize=(12, 8), pyplot=False)
+        ax = fig.add_subplot(1, 1, 1, projection=datacrs)
+        ax.set_extent((70, 140, 15, 55), crs=datacrs)
+        start = time.perf_counter()
+        if method == 'matplotlib':
+            cs = (ax.contourf if filled else ax.contour)(
+                lon, lat, field, levels, transform=datacrs)
+        else:
+            cs = draw_contour(ax, lon, lat, field, levels, filled=filled,
+                              cache=False)
+        if not filled:
+            ax.clabel(cs, inline=1, fontsize=10, fmt='%.0f')
+        fig.canvas.draw()
+        seconds = time.perf_counter() - start
+        close_figure(fig)
+        return seconds
+
+    rows = []
+    for filled in (False, True):
+        for method in ('matplotlib', 'draw_contour'):
+            clear_contour_cache()
+            times = [draw(method, filled) for _ in range(repeat)]
+            rows.append(['{} {}'.format(
+                method, 'filled' if filled else 'lines'),
+                times[0], min(times[1:])])
+    return table(rows, ['method', 'first', 'cached'])
+
+
+if __name__ == '__main__':
+    print(benchmark_contour().to_string())
@@ -0,0 +1,79 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare the image encoder settings of `util.figure_to_bytes` by output
+size and latency, on a CLDAS temperature map of a synthetic field.
+
+    python benchmarks/bench_encoders.py
+"""
+
+import io
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+from dk_met_graphics.plot.util import figure_to_bytes
+from common import synthetic_field, best_of, table
+
+
+SETTINGS = [
+    {'format': 'png', 'compress_level': 0},
+    {'format': 'png', 'compress_level': 1},
+    {'format': 'png', 'compress_level': 6},
+    {'format': 'png', 'compress_level': 9},
+    {'format': 'png', 'compress_level': 1, 'quantize': 256},
+    {'format': 'png', 'compress_level': 6, 'quantize': 64},
+    {'format': 'webp', 'quality': 80},
+    {'format': 'webp', 'quality': 95},
+    {'format': 'webp', 'lossless': True}]
+
+
+def cldas_figure():
+    """CLDAS temperature map of a synthetic field."""
+    from dk_met_graphics.plot.cldas import fig_cldas_temp
+    lon = np.arange(100, 125.01, 0.0625)
+    lat = np.arange(25, 45.01, 0.0625)
+    field = 20 - 0.8 * (lat[:, None] - 25) + synthetic_field(
+        lon, lat, amplitude=5)
+    return fig_cldas_temp(
+        {'lon': lon, 'lat': lat, 'data': field}, pyplot=False)
+
+
+def benchmark_encoders(fig=None, settings=SETTINGS, repeat=3):
+    """
+    Compare image encoder settings by output size and latency.
+
+    :param fig: figure to encode, default is `cldas_figure`.
+    :param settings: list of `figure_to_bytes` keyword dictionaries.
+    :param repeat: number of timed runs of each setting.
+    :return: pandas data frame with the size (bytes) and the fastest
+             encoding latency (seconds) of every setting; the figure is
+             drawn once beforehand, the time of drawing and of a full
+             savefig are listed for reference.
+    """
+    if fig is None:
+        fig = cldas_figure()
+    if not isinstance(fig.canvas, FigureCanvasAgg):
+        FigureCanvasAgg(fig)
+
+    def savefig():
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+        return buf.getvalue()
+
+    def draw():
+        fig.canvas.draw()
+        return b''
+
+    encoders = [('savefig png (draw + encode)', savefig),
+                ('draw only', draw)] + [
+        (', '.join('{}={}'.format(k, v) for k, v in setting.items()),
+         lambda setting=setting: figure_to_bytes(
+             fig, draw=False, **setting)) for setting in settings]
+    rows = []
+    for name, encoder in encoders:
+        seconds, data = best_of(encoder, repeat)
+        rows.append([name, len(data), seconds])
+    return table(rows, ['encoder', 'bytes', 'seconds'])
+
+
+if __name__ == '__main__':
+    print(benchmark_encoders().to_string())
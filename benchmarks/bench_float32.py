@@ -0,0 +1,69 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare the peak memory of rendering a large grid from float32 and
+float64 wind components (wind speed and raster), each in a fresh
+process.
+
+    python benchmarks/bench_float32.py
+"""
+
+import time
+import multiprocessing
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import (
+    new_figure, close_figure, figure_to_bytes)
+from common import start_memory_trace, peak_memory_mb, table
+
+
+def _float32_pipeline(shape, dtype):
+    """
+    Render a synthetic wind speed raster.
+
+    :return: (peak memory in MB, seconds).
+    """
+    from dk_met_graphics.plot.raster import draw_raster
+    from dk_met_graphics.cmap.cm import guide_cmaps
+
+    start_memory_trace()
+    start = time.perf_counter()
+    lon = np.linspace(70., 140., shape[1])
+    lat = np.linspace(15., 55., shape[0])
+    u = np.empty(shape, dtype=dtype)
+    v = np.empty(shape, dtype=dtype)
+    np.multiply(np.sin(lon[None, :] / 3.), 20. * np.cos(lat[:, None] / 2.),
+                out=u, casting='unsafe')
+    np.multiply(np.cos(lon[None, :] / 5.), 15. * np.sin(lat[:, None] / 3.),
+                out=v, casting='unsafe')
+    u[:100, :100] = np.nan
+
+    fig = new_figure(figsize=(12, 8), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent((70, 140, 15, 55), crs=ccrs.PlateCarree())
+    draw_raster(ax, lon, lat, np.hypot(u, v), cmap=guide_cmaps("2"),
+                vmin=0, vmax=40, cache=False)
+    figure_to_bytes(fig, compress_level=1)
+    close_figure(fig)
+    return peak_memory_mb(), time.perf_counter() - start
+
+
+def benchmark_float32(shape=(4000, 7000)):
+    """
+    Render the wind speed raster from float32 and float64 winds.
+
+    :param shape: (nlat, nlon) grid shape.
+    :return: pandas data frame with the peak memory in MB and the time
+             in seconds for every dtype.
+    """
+    rows = []
+    context = multiprocessing.get_context('spawn')
+    for dtype in ['float32', 'float64']:
+        with context.Pool(1) as pool:
+            peak, seconds = pool.apply(_float32_pipeline, (shape, dtype))
+        rows.append([dtype, peak, seconds])
+    return table(rows, ['dtype', 'peak MB', 'seconds'])
+
+
+if __name__ == '__main__':
+    print(benchmark_float32().to_string())
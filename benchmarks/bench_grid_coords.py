@@ -0,0 +1,66 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare the memory of contour layers drawn with per-layer np.meshgrid
+coordinates and with the shared `util.grid_coords`.
+
+    python benchmarks/bench_grid_coords.py
+"""
+
+import time
+import tracemalloc
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure, grid_coords
+from common import synthetic_field, table
+
+
+def benchmark_grid_coords(shape=(4000, 7000), levels=8):
+    """
+    Draw a filled contour and two contour layers on one grid.
+
+    :param shape: (nlat, nlon) grid shape, the default is a 7000x4000
+                  grid (about 450 MB per float64 coordinate pair).
+    :param levels: number of contour levels.
+    :return: pandas data frame with the peak and retained (while the
+             figure is alive) traced memory in MB and the time in
+             seconds of drawing the layers.
+    """
+    lon = np.linspace(70., 140., shape[1])
+    lat = np.linspace(15., 55., shape[0])
+    field = synthetic_field(lon, lat)
+    datacrs = ccrs.PlateCarree()
+
+    def meshgrid_layers(ax):
+        x, y = np.meshgrid(lon, lat)
+        ax.contourf(x, y, field, levels, transform=datacrs)
+        x, y = np.meshgrid(lon, lat)
+        ax.contour(x, y, field, levels, transform=datacrs)
+        x, y = np.meshgrid(lon, lat)
+        ax.contour(x, y, -field, levels, transform=datacrs)
+
+    def shared_layers(ax):
+        x, y = grid_coords(lon, lat)
+        ax.contourf(x, y, field, levels, transform=datacrs)
+        ax.contour(x, y, field, levels, transform=datacrs)
+        x, y = grid_coords(lon, lat)
+        ax.contour(x, y, -field, levels, transform=datacrs)
+
+    rows = []
+    for name, layers in [('np.meshgrid per layer', meshgrid_layers),
+                         ('shared grid_coords', shared_layers)]:
+        fig = new_figure(pyplot=False)
+        ax = fig.add_subplot(1, 1, 1, projection=datacrs)
+        tracemalloc.start()
+        start = time.perf_counter()
+        layers(ax)
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        close_figure(fig)
+        rows.append([name, peak / 1024 ** 2, current / 1024 ** 2, seconds])
+    return table(rows, ['coordinates', 'peak MB', 'retained MB', 'seconds'])
+
+
+if __name__ == '__main__':
+    print(benchmark_grid_coords().to_string())
@@ -0,0 +1,67 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compare `streamlines.streamlines` and `streamlines.draw_streamlines`
+with `matplotlib.streamplot` on a continental grid.
+
+    python benchmarks/bench_streamlines.py
+"""
+
+import time
+import numpy as np
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.streamlines import streamlines, draw_streamlines
+from common import table
+
+
+def benchmark_streamlines(resolution=0.25, extent=(70, 140, 10, 60),
+                          density=1., repeat=3):
+    """
+    Integrate and draw the streamlines of a vortex field with both
+    methods.
+
+    :param resolution: grid resolution in degrees.
+    :param extent: (lonmin, lonmax, latmin, latmax) of the grid.
+    :param density: streamline density.
+    :param repeat: number of runs of each method.
+    :return: pandas data frame with the seconds of the integration and
+             of the total including the drawing, and the number of
+             lines, of the best run of every method.
+    """
+    lon = np.arange(extent[0], extent[1] + resolution / 2, resolution)
+    lat = np.arange(extent[2], extent[3] + resolution / 2, resolution)
+    x, y = np.radians(lon)[None, :] * 6, np.radians(lat)[:, None] * 6
+    u = 15 * np.sin(x) * np.cos(y) + 5
+    v = -15 * np.cos(x) * np.sin(y)
+
+    rows = []
+    for method in ('streamplot', 'vectorized'):
+        best = None
+        for _ in range(repeat):
+            fig = new_figure(figsize=(12, 8), pyplot=False)
+            ax = fig.add_subplot(1, 1, 1)
+            ax.set_xlim(extent[:2])
+            ax.set_ylim(extent[2:])
+            start = time.perf_counter()
+            if method == 'streamplot':
+                sp = ax.streamplot(lon, lat, u, v, density=density,
+                                   color='k', linewidth=1)
+                # one arrow per streamline
+                count = len(sp.arrows.get_paths())
+                integrated = time.perf_counter() - start
+            else:
+                lines = streamlines(lon, lat, u, v, density=density)
+                count = len(lines)
+                integrated = time.perf_counter() - start
+                draw_streamlines(ax, lines)
+            fig.canvas.draw()
+            total = time.perf_counter() - start
+            close_figure(fig)
+            if best is None or total < best[2]:
+                best = [method, integrated, total, count]
+        rows.append(best)
+    return table(rows, ['method', 'integrate', 'total', 'lines'])
+
+
+if __name__ == '__main__':
+    print(benchmark_streamlines().to_string())
@@ -0,0 +1,86 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Helpers shared by the benchmark scripts.
+
+The scripts are not part of the package or the test suite, run them
+from the repository root with the package importable, like
+
+    python benchmarks/bench_encoders.py
+"""
+
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+
+def synthetic_field(lon, lat, base=0., amplitude=1.):
+    """
+    Smooth synthetic field on a longitude and latitude grid.
+
+    :param lon: 1-D grid longitudes.
+    :param lat: 1-D grid latitudes.
+    :param base: field mean.
+    :param amplitude: field amplitude.
+    :return: 2-D (lat, lon) float64 array.
+    """
+    return base + amplitude * (np.sin(np.radians(lon)[None, :] * 4) *
+                               np.cos(np.radians(lat)[:, None] * 3))
+
+
+def best_of(func, repeat=3):
+    """
+    Time a function, keeping the fastest run.
+
+    :param func: function without arguments.
+    :param repeat: number of runs.
+    :return: (seconds, result of the last run).
+    """
+    best = np.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def table(rows, columns):
+    """
+    Tabulate benchmark rows, indexed by the first column.
+
+    :param rows: list of rows.
+    :param columns: column names.
+    :return: pandas data frame.
+    """
+    return pd.DataFrame(rows, columns=columns).set_index(columns[0])
+
+
+def start_memory_trace():
+    """
+    Start tracing allocations with tracemalloc where the resource
+    module is missing (Windows), see `peak_memory_mb`.
+    """
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        tracemalloc.start()
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process in MB, or the peak traced by
+    tracemalloc since `start_memory_trace` where the resource module
+    is missing (Windows).
+
+    :return: peak memory in MB.
+    """
+    try:
+        import resource
+    except ImportError:
+        return tracemalloc.get_traced_memory()[1] / 1024. ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
@@ -0,0 +1,234 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Caching utilities: a bounded in-memory LRU cache, content hashing
+and the on-disk cache directory shared by the graphic functions.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# environment variable used to relocate the on-disk cache
+CACHE_DIR_ENV = "DK_MET_GRAPHICS_CACHE_DIR"
+
+
+class LRUCache(object):
+    """
+    Least-recently-used cache with a bounded number of entries
+    and an optional memory budget in bytes.
+
+    >>> cache = LRUCache(maxsize=16, maxbytes=100*1024**2)
+    >>> cache.put('key', np.zeros(10))
+    >>> value = cache.get('key')
+    >>> cache.stats()
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None):
+        """
+        :param maxsize: maximum number of entries.
+        :param maxbytes: maximum total size of the entries in bytes,
+                         None for no limit.
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._data = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Get a cached value and mark it as recently used.
+
+        :param key: hashable key.
+        :param default: returned when the key is not cached.
+        :return: cached value.
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key][0]
+
+    def put(self, key, value, nbytes=None):
+        """
+        Store a value, evicting the least recently used entries
+        when the cache is over its limits.
+
+        :param key: hashable key.
+        :param value: value to store.
+        :param nbytes: size of the value in bytes, estimated with
+                       `nbytes_of` if None.
+        :return: None.
+        """
+        if nbytes is None:
+            nbytes = nbytes_of(value)
+        with self._lock:
+            if key in self._data:
+                self._nbytes -= self._data.pop(key)[1]
+            if self.maxbytes is not None and nbytes > self.maxbytes:
+                return
+            self._data[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while (len(self._data) > self.maxsize or (
+                    self.maxbytes is not None and
+                    self._nbytes > self.maxbytes)):
+                self._nbytes -= self._data.popitem(last=False)[1][1]
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics.
+        """
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Cache statistics.
+
+        :return: dictionary with hits, misses, entries and nbytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._data), 'nbytes': self._nbytes}
+
+
+def nbytes_of(value):
+    """
+    Estimate the memory footprint of a cached value.
+
+    :param value: numpy array, bytes or a sequence of them.
+    :return: size in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes_of(v) for v in value.values())
+    return 0
+
+
+def get_cache_dir(*subdirs):
+    """
+    Get (and create) the on-disk cache directory.
+    The root is `DK_MET_GRAPHICS_CACHE_DIR` if the environment
+    variable is set, otherwise ~/.dk_met_graphics/cache.
+
+    :param subdirs: sub directory names.
+    :return: directory path.
+    """
+    root = os.environ.get(CACHE_DIR_ENV)
+    if root is None:
+        root = os.path.join(
+            os.path.expanduser('~'), '.dk_met_graphics', 'cache')
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+_file_hashes = {}
+
+
+def file_hash(*filenames):
+    """
+    Hash the content of files. Results are memorized by file
+    path, size and modification time, so a file is read only once.
+
+    :param filenames: file names, missing files are skipped.
+    :return: hex digest string.
+    """
+    digest = hashlib.sha1()
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            continue
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+        if key not in _file_hashes:
+            file_digest = hashlib.sha1()
+            with open(filename, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    file_digest.update(chunk)
+            _file_hashes[key] = file_digest.hexdigest()
+        digest.update(_file_hashes[key].encode())
+    return digest.hexdigest()
+
+
+def shapefile_hash(shpfile):
+    """
+    Hash the geometry and attribute files of a shapefile.
+
+    :param shpfile: shapefile name, with or without extension.
+    :return: hex digest string.
+    """
+    base = os.path.splitext(shpfile)[0]
+    return file_hash(base + '.shp', base + '.dbf')
+
+
+def array_hash(*arrays):
+    """
+    Hash the content, shape and dtype of numpy arrays.
+
+    :param arrays: array-like objects.
+    :return: hex digest string.
+    """
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def crs_key(crs):
+    """
+    Hashable description of a cartopy coordinate reference system,
+    equal for equivalent projections created separately.
+
+    :param crs: `cartopy.crs.CRS` instance.
+    :return: string.
+    """
+    key = getattr(crs, 'proj4_init', None)
+    if key is None:
+        key = getattr(crs, 'srs', None) or repr(crs)
+    bounds = getattr(crs, 'bounds', None)
+    return key if bounds is None else key + repr(tuple(bounds))
+
+
+def atomic_save(filename, writer):
+    """
+    Write a file atomically, so concurrent jobs never read a
+    partially written cache file.
+
+    :param filename: destination file name.
+    :param writer: function called with an open binary file object.
+    :return: None.
+    """
+    dirname = os.path.dirname(filename)
+    fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer(f)
+        os.replace(tmpname, filename)
+    except BaseException:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
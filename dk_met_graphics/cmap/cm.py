@@ -178,6 +178,83 @@ def grayify_cmap(cmap):
         cmap.name + "_grayscale", cols, cmap.N)
 
 
+def colormap_lut(cmap, norm=None, vmin=None, vmax=None, size=1024,
+                 mask_below=None):
+    """
+    Build a color lookup table of a color map and normalization, so
+    fields are colored with one `np.searchsorted` and one table gather.
+    A `BoundaryNorm` gets one entry per color bin (exact), other
+    normalizations `size` evenly spaced entries between vmin and vmax.
+
+    :param cmap: matplotlib color map.
+    :param norm: matplotlib normalization, like the norm returned by
+                 `ctables.cm_precipitation_nws`.
+    :param vmin: minimum value, if norm is None.
+    :param vmax: maximum value, if norm is None.
+    :param size: number of entries for continuous normalizations.
+    :param mask_below: values below this are transparent, like 0.1 for
+                       precipitation.
+    :return: (edges, table), the increasing bin edges and the (nedge+2, 4)
+             uint8 RGBA table: entry 0 below the first edge, entry i for
+             edges[i-1] <= value < edges[i], entry nedge above the last
+             edge and the last entry for missing values.
+
+    >>> cmap, norm = cm_precipitation_nws()
+    >>> lut = colormap_lut(cmap, norm, mask_below=0.1)
+    >>> rgba = apply_lut(rain, lut)
+    """
+
+    if norm is None:
+        norm = colors.Normalize(vmin=vmin, vmax=vmax)
+    if isinstance(norm, colors.BoundaryNorm):
+        edges = np.asarray(norm.boundaries, dtype=np.float64)
+    else:
+        edges = np.linspace(norm.vmin, norm.vmax, size + 1)
+    if mask_below is not None:
+        edges = np.unique(np.append(edges, mask_below))
+
+    # colors of the bins, under and over ranges and missing values
+    centers = np.concatenate([[edges[0] - 1.], 0.5 * (edges[:-1] + edges[1:]),
+                              [edges[-1] + 1.]])
+    table = cmap(norm(centers), bytes=True)
+    table = np.vstack([table, np.asarray(cmap(np.ma.masked_all(1),
+                                              bytes=True)).reshape(1, 4)])
+    if mask_below is not None:
+        table[:np.searchsorted(edges, mask_below, side='right'), 3] = 0
+    return edges, table
+
+
+def apply_lut(values, lut, index=False):
+    """
+    Color a field with a lookup table of `colormap_lut`.
+
+    :param values: array, NaN or masked values are missing; float32
+                   values are binned without a float64 copy.
+    :param lut: (edges, table) of `colormap_lut`.
+    :param index: return the table indices instead of the colors, to
+                  color many subsets of one field cheaply.
+    :return: RGBA uint8 array of shape values.shape + (4,), or table
+             indices of shape values.shape.
+    """
+    edges, table = lut
+    data = np.ma.asarray(values)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    data = np.ma.filled(data, np.nan)
+    if data.dtype != edges.dtype:
+        # compare in the field precision (float32 fields are not
+        # promoted), rounding the edges up keeps the float64 bins
+        low = edges.astype(data.dtype)
+        below = low < edges
+        low[below] = np.nextafter(low[below], np.inf)
+        edges = low
+    indices = np.searchsorted(edges, data, side='right').astype(np.uint16)
+    indices[np.isnan(data)] = table.shape[0] - 1
+    if index:
+        return indices
+    return table[indices]
+
+
 def show_colormap(cmap):
     """
     Show color map.
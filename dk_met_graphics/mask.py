@@ -15,9 +15,39 @@ import matplotlib.path as mplp
 import shapefile
 from matplotlib.path import Path
 from matplotlib.patches import PathPatch
+from matplotlib.artist import Artist
+from matplotlib.contour import ContourSet
+import cartopy.crs as ccrs
 from cartopy.io import shapereader
 from shapely.geometry import Point, Polygon
-from shapely.ops import cascaded_union
+from shapely.ops import unary_union
+from dk_met_graphics.cache import (
+    LRUCache, get_cache_dir, shapefile_hash, array_hash, atomic_save,
+    crs_key)
+
+
+# in-memory cache of packed grid masks
+_MASK_CACHE = LRUCache(maxsize=64, maxbytes=256 * 1024 ** 2)
+
+# in-memory caches of shapefile records and clip paths
+_SHAPE_RECORDS = LRUCache(maxsize=16)
+_CLIP_PATH_CACHE = LRUCache(maxsize=64)
+
+
+def mask_cache_stats():
+    """
+    Statistics of the in-memory grid mask cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _MASK_CACHE.stats()
+
+
+def clear_mask_cache():
+    """
+    Empty the in-memory grid mask cache.
+    """
+    _MASK_CACHE.clear()
 
 
 def outline_to_mask(line, x, y):
@@ -58,7 +88,153 @@ def _bbox_to_rect(bbox):
     return Polygon([(l, b), (r, b), (r, t), (l, t)])
 
 
-def shp_mask(shp, x, y, m=None):
+def _polygon_rings(shp):
+    """
+    Collect the exterior and interior rings of a (multi)polygon.
+
+    :param shp: shapely geometry.
+    :return: list of (N, 2) vertex arrays, or None if the geometry
+             is not made of polygons.
+    """
+
+    geom_type = getattr(shp, 'geom_type', None)
+    if geom_type == 'Polygon':
+        if shp.is_empty:
+            return []
+        rings = [np.asarray(shp.exterior.coords)[:, :2]]
+        rings += [np.asarray(ring.coords)[:, :2] for ring in shp.interiors]
+        return rings
+    if geom_type in ('MultiPolygon', 'GeometryCollection'):
+        rings = []
+        for geom in shp.geoms:
+            sub_rings = _polygon_rings(geom)
+            if sub_rings is None:
+                return None
+            rings += sub_rings
+        return rings
+    return None
+
+
+def _rings_to_edges(rings):
+    """
+    Convert closed rings to flat edge arrays.
+
+    :param rings: list of (N, 2) closed vertex arrays.
+    :return: x0, y0, x1, y1 edge end point arrays.
+    """
+
+    rings = [ring for ring in rings if ring.shape[0] > 1]
+    if not rings:
+        empty = np.zeros(0)
+        return empty, empty, empty, empty
+    start = np.concatenate([ring[:-1] for ring in rings])
+    stop = np.concatenate([ring[1:] for ring in rings])
+    return start[:, 0], start[:, 1], stop[:, 0], stop[:, 1]
+
+
+def _expand_ranges(start, stop):
+    """
+    Expand [start, stop) index ranges into flat arrays.
+
+    :param start: range start indices.
+    :param stop: range stop indices.
+    :return: (owner, index), the range number and index of each element.
+    """
+
+    count = np.maximum(stop - start, 0)
+    owner = np.repeat(np.arange(count.size), count)
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    return owner, start[owner] + offset
+
+
+def _edge_crossings(edges, x, y):
+    """
+    Intersect polygon edges with the grid rows they span,
+    a row crosses an edge when ylo <= y < yhi.
+
+    :param edges: x0, y0, x1, y1 edge arrays, see `_rings_to_edges`.
+    :param x, y: 1-D ascending grid coordinates.
+    :return: (owner, rows, xc), the edge index, row index and
+             x coordinate of each crossing.
+    """
+
+    x0, y0, x1, y1 = edges
+    owner, rows = _expand_ranges(
+        np.searchsorted(y, np.minimum(y0, y1), side='left'),
+        np.searchsorted(y, np.maximum(y0, y1), side='left'))
+    ex0, ey0 = x0[owner], y0[owner]
+    xc = ex0 + (y[rows] - ey0) * (x1[owner] - ex0) / (y1[owner] - ey0)
+    return owner, rows, xc
+
+
+def _scanline_mask(edges, x, y, border=True):
+    """
+    Even-odd scanline rasterization of polygon edges on a regular grid.
+
+    Every edge is intersected with the grid rows it spans in one
+    vectorized step, the crossings are binned into the grid columns
+    and a running XOR along each row gives the inside/outside state
+    of the cell centres. Cost is linear in the number of crossings
+    plus the number of grid points. Cell centres lying exactly on an
+    edge are outside, as with shapely's ``contains``.
+
+    :param edges: x0, y0, x1, y1 edge arrays, see `_rings_to_edges`.
+    :param x, y: 1-D ascending grid coordinates.
+    :param border: exclude the cell centres lying exactly on an edge.
+                   If False, they follow the half-open rule of the
+                   crossings (a centre on a right or bottom edge is
+                   inside), which assigns the centres on a border
+                   shared by adjacent polygons to exactly one of them.
+    :return: boolean 2-D array, True inside shape.
+    """
+
+    x0, y0, x1, y1 = edges
+    nx, ny = x.size, y.size
+    toggle = np.zeros((ny, nx + 1), dtype=bool)
+    on_border = np.zeros((ny, nx + 1), dtype=np.int32)
+
+    _, rows, xc = _edge_crossings(edges, x, y)
+    if rows.size > 0:
+        # a crossing toggles every grid column on its right side,
+        # only crossings with odd multiplicity change the state
+        cols = np.searchsorted(x, xc, side='right')
+        flat, count = np.unique(rows * (nx + 1) + cols, return_counts=True)
+        toggle.flat[flat[count % 2 == 1]] = True
+    inside = np.logical_xor.accumulate(toggle[:, :nx], axis=1)
+    if not border:
+        return inside
+
+    if rows.size > 0:
+        # cell centres hit exactly by a crossing are on the boundary
+        left = np.searchsorted(x, xc, side='left')
+        hit = left < cols
+        np.add.at(on_border, (rows[hit], left[hit]), 1)
+        np.add.at(on_border, (rows[hit], left[hit] + 1), -1)
+
+    # horizontal edges lying exactly on a grid row are boundary too
+    flat_edge = y0 == y1
+    if np.any(flat_edge):
+        owner, rows = _expand_ranges(
+            np.searchsorted(y, y0[flat_edge], side='left'),
+            np.searchsorted(y, y0[flat_edge], side='right'))
+        xlo = np.minimum(x0[flat_edge], x1[flat_edge])[owner]
+        xhi = np.maximum(x0[flat_edge], x1[flat_edge])[owner]
+        np.add.at(on_border, (rows, np.searchsorted(x, xlo, side='left')), 1)
+        np.add.at(
+            on_border, (rows, np.searchsorted(x, xhi, side='right')), -1)
+
+    # polygon vertices sitting exactly on grid points
+    ix = np.searchsorted(x, x0, side='left')
+    iy = np.searchsorted(y, y0, side='left')
+    hit = (ix < nx) & (iy < ny)
+    hit[hit] = (x[ix[hit]] == x0[hit]) & (y[iy[hit]] == y0[hit])
+    np.add.at(on_border, (iy[hit], ix[hit]), 1)
+    np.add.at(on_border, (iy[hit], ix[hit] + 1), -1)
+
+    return inside & ~(np.cumsum(on_border[:, :nx], axis=1) > 0)
+
+
+def _shp_mask_quadtree(shp, x, y, m=None):
     """Use recursive sub-division of space and shapely
     contains method to create a raster mask on a regular grid.
 
@@ -72,14 +248,6 @@ def shp_mask(shp, x, y, m=None):
     Returns
     -------
     m : boolean 2-D array, True inside shape.
-
-    Examples
-    --------
-    >>> from shapely.geometry import Point
-    >>> poly = Point(0,0).buffer(1)
-    >>> x = np.linspace(-5,5,100)
-    >>> y = np.linspace(-5,5,100)
-    >>> mask = shp_mask(poly, x, y)
     """
     rect = _bbox_to_rect(_grid_bbox(x, y))
 
@@ -99,62 +267,599 @@ def shp_mask(shp, x, y, m=None):
             m[:] = shp.contains(Point(x[0], y[0]))
 
         elif k == 1:
-            m[:, :l // 2] = shp_mask(shp, x[:l // 2], y, m[:, :l // 2])
-            m[:, l // 2:] = shp_mask(shp, x[l // 2:], y, m[:, l // 2:])
+            m[:, :l // 2] = _shp_mask_quadtree(
+                shp, x[:l // 2], y, m[:, :l // 2])
+            m[:, l // 2:] = _shp_mask_quadtree(
+                shp, x[l // 2:], y, m[:, l // 2:])
 
         elif l == 1:
-            m[:k // 2] = shp_mask(shp, x, y[:k // 2], m[:k // 2])
-            m[k // 2:] = shp_mask(shp, x, y[k // 2:], m[k // 2:])
+            m[:k // 2] = _shp_mask_quadtree(shp, x, y[:k // 2], m[:k // 2])
+            m[k // 2:] = _shp_mask_quadtree(shp, x, y[k // 2:], m[k // 2:])
 
         else:
-            m[:k // 2, :l // 2] = shp_mask(
+            m[:k // 2, :l // 2] = _shp_mask_quadtree(
                 shp, x[:l // 2], y[:k // 2], m[:k // 2, :l // 2])
-            m[:k // 2, l // 2:] = shp_mask(
+            m[:k // 2, l // 2:] = _shp_mask_quadtree(
                 shp, x[l // 2:], y[:k // 2], m[:k // 2, l // 2:])
-            m[k // 2:, :l // 2] = shp_mask(
+            m[k // 2:, :l // 2] = _shp_mask_quadtree(
                 shp, x[:l // 2], y[k // 2:], m[k // 2:, :l // 2])
-            m[k // 2:, l // 2:] = shp_mask(
+            m[k // 2:, l // 2:] = _shp_mask_quadtree(
                 shp, x[l // 2:], y[k // 2:], m[k // 2:, l // 2:])
 
     return m
 
 
-def grid_mask_china(lon, lat):
+def shp_mask(shp, x, y, m=None):
+    """Create a raster mask on a regular grid, True where the
+    grid point is contained in the shape.
+
+    Polygons and multi-polygons are rasterized with a vectorized
+    even-odd scanline algorithm, which scales linearly with the
+    number of grid rows plus polygon edges. Other shapes fall back
+    to recursive sub-division of space with shapely's contains method.
+
+    Parameters
+    ----------
+    shp : shapely's Polygon or Polygons (or whatever with
+          a "contains" method and intersects method)
+    x, y : 1-D numpy arrays defining a regular grid
+    m : mask to fill, optional (will be created otherwise)
+
+    Returns
+    -------
+    m : boolean 2-D array, True inside shape.
+
+    Examples
+    --------
+    >>> from shapely.geometry import Point
+    >>> poly = Point(0,0).buffer(1)
+    >>> x = np.linspace(-5,5,100)
+    >>> y = np.linspace(-5,5,100)
+    >>> mask = shp_mask(poly, x, y)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    rings = _polygon_rings(shp)
+    if rings is None:
+        return _shp_mask_quadtree(shp, x, y, m=m)
+
+    if m is None:
+        m = np.zeros((y.size, x.size), dtype=bool)
+
+    # the scanline works on ascending coordinates
+    xorder = np.argsort(x, kind='mergesort')
+    yorder = np.argsort(y, kind='mergesort')
+    mask = _scanline_mask(_rings_to_edges(rings), x[xorder], y[yorder])
+    m[np.ix_(yorder, xorder)] = mask
+
+    return m
+
+
+def _cell_edges(x):
+    """
+    Cell edges of a regular grid, half way between the centres.
+
+    :param x: 1-D ascending grid coordinates, at least two points.
+    :return: 1-D array of x.size + 1 edges.
+    """
+
+    if x.size < 2:
+        raise ValueError("Cell edges need at least two grid points.")
+    mid = (x[1:] + x[:-1]) / 2.
+    return np.concatenate(
+        [[x[0] - (mid[0] - x[0])], mid, [x[-1] + (x[-1] - mid[-1])]])
+
+
+def _fraction_quadtree(shp, xe, ye, frac):
+    """
+    Fill the fraction of every grid cell covered by a shape with
+    recursive sub-division of space. The shape is clipped to each
+    block before subdividing, so blocks fully inside or outside the
+    shape are resolved from one area comparison and only cells
+    crossed by the boundary are clipped individually.
+
+    :param shp: shapely geometry already clipped to the block.
+    :param xe, ye: 1-D ascending cell edges of the block.
+    :param frac: float 2-D array of the block to fill.
+    :return: None.
+    """
+
+    if shp.is_empty:
+        frac[:] = 0.
+        return
+
+    rect_area = (xe[-1] - xe[0]) * (ye[-1] - ye[0])
+    area = shp.area
+    if area <= 1.e-12 * rect_area:
+        frac[:] = 0.
+        return
+    if area >= (1. - 1.e-12) * rect_area:
+        frac[:] = 1.
+        return
+
+    k, l = frac.shape
+    if k == 1 and l == 1:
+        frac[:] = area / rect_area
+        return
+
+    rows = [(0, k)] if k == 1 else [(0, k // 2), (k // 2, k)]
+    cols = [(0, l)] if l == 1 else [(0, l // 2), (l // 2, l)]
+    for r0, r1 in rows:
+        for c0, c1 in cols:
+            sub = shp.intersection(
+                _bbox_to_rect((xe[c0], xe[c1], ye[r0], ye[r1])))
+            _fraction_quadtree(
+                sub, xe[c0:c1 + 1], ye[r0:r1 + 1], frac[r0:r1, c0:c1])
+
+
+def shp_fraction(shp, x, y):
+    """Compute the fraction of each grid cell covered by a shape.
+
+    The cells are centred on the grid points and extend half way to
+    the neighbouring points. Unlike the cell-centre containment of
+    `shp_mask`, this is accurate for coarse grids along coastlines and
+    for small regions. Blocks of cells fully inside or outside the
+    shape are resolved by recursive sub-division, only cells crossed
+    by the boundary are clipped exactly (in longitude/latitude plane).
+
+    Parameters
+    ----------
+    shp : shapely's Polygon or Polygons
+    x, y : 1-D numpy arrays defining a regular grid, at least two
+           points along each axis
+
+    Returns
+    -------
+    frac : float32 2-D array, covered fraction from 0 to 1.
+
+    Examples
+    --------
+    >>> from shapely.geometry import Point
+    >>> poly = Point(0,0).buffer(1)
+    >>> x = np.linspace(-5,5,21)
+    >>> y = np.linspace(-5,5,21)
+    >>> frac = shp_fraction(poly, x, y)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # work on ascending coordinates
+    xorder = np.argsort(x, kind='mergesort')
+    yorder = np.argsort(y, kind='mergesort')
+    xe = _cell_edges(x[xorder])
+    ye = _cell_edges(y[yorder])
+
+    frac = np.zeros((y.size, x.size), dtype=np.float64)
+    shp = shp.intersection(_bbox_to_rect((xe[0], xe[-1], ye[0], ye[-1])))
+    _fraction_quadtree(shp, xe, ye, frac)
+
+    result = np.empty((y.size, x.size), dtype=np.float32)
+    result[np.ix_(yorder, xorder)] = frac
+    return result
+
+
+def shp_members(shps, x, y):
+    """Find the grid points inside each of many shapes, which may
+    overlap.
+
+    Every shape is rasterized with the even-odd scanline on the grid
+    points of its bounding box only, so the cost follows the shape
+    sizes rather than the number of shapes times the grid size. Grid
+    points lying exactly on a border shared by two adjacent shapes are
+    assigned to one of them.
+
+    Parameters
+    ----------
+    shps : sequence of shapely Polygons or MultiPolygons.
+    x, y : 1-D numpy arrays defining a regular grid
+
+    Returns
+    -------
+    zones : int64 1-D array, index in shps of every membership,
+            ascending.
+    cells : int64 1-D array, flat index in the (y.size, x.size) grid of
+            every membership, a grid point inside n shapes appears n
+            times.
+
+    Examples
+    --------
+    >>> from shapely.geometry import Point
+    >>> polys = [Point(0,0).buffer(1), Point(0.5,0).buffer(1)]
+    >>> x = np.linspace(-5,5,100)
+    >>> y = np.linspace(-5,5,100)
+    >>> zones, cells = shp_members(polys, x, y)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # the scanline works on ascending coordinates
+    xorder = np.argsort(x, kind='mergesort')
+    yorder = np.argsort(y, kind='mergesort')
+    xs, ys = x[xorder], y[yorder]
+
+    zones = []
+    cells = []
+    for zone, shp in enumerate(shps):
+        rings = _polygon_rings(shp)
+        if rings is None:
+            raise ValueError(
+                "Label rasters need polygonal shapes, got {}.".format(
+                    getattr(shp, 'geom_type', type(shp).__name__)))
+        if not rings:
+            continue
+
+        # grid points of the bounding box
+        xmin, ymin, xmax, ymax = shp.bounds
+        i0 = np.searchsorted(xs, xmin, side='left')
+        i1 = np.searchsorted(xs, xmax, side='right')
+        j0 = np.searchsorted(ys, ymin, side='left')
+        j1 = np.searchsorted(ys, ymax, side='right')
+        if i0 >= i1 or j0 >= j1:
+            continue
+
+        rows, cols = np.nonzero(_scanline_mask(
+            _rings_to_edges(rings), xs[i0:i1], ys[j0:j1], border=False))
+        cells.append(yorder[rows + j0] * x.size + xorder[cols + i0])
+        zones.append(np.full(rows.size, zone, dtype=np.int64))
+
+    if not cells:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(zones), np.concatenate(cells).astype(np.int64)
+
+
+def members_to_labels(zones, cells, shape, overlap='first', names=None):
+    """Resolve shape memberships into an integer label raster.
+
+    Parameters
+    ----------
+    zones, cells : membership arrays, see `shp_members`.
+    shape : (ny, nx) grid shape.
+    overlap : rule for grid points inside several shapes, 'first'
+              (the shape listed first wins), 'last' (the shape listed
+              last wins) or 'raise' (ValueError on any overlap).
+    names : shape names used in the overlap error message.
+
+    Returns
+    -------
+    labels : int32 2-D array, 0 outside all shapes and i+1 inside
+             shape i.
+    """
+    if overlap not in ('first', 'last', 'raise'):
+        raise ValueError("Unknown overlap rule '{}', should be 'first', "
+                         "'last' or 'raise'.".format(overlap))
+
+    # the zones are ascending, the first (or last) occurrence of every
+    # cell gives its first (or last) shape
+    if overlap == 'last':
+        zones, cells = zones[::-1], cells[::-1]
+    unique, first = np.unique(cells, return_index=True)
+    if overlap == 'raise' and unique.size < cells.size:
+        order = np.argsort(cells, kind='mergesort')
+        dup = np.flatnonzero(cells[order][1:] == cells[order][:-1])
+        pairs = np.unique(np.stack(
+            [zones[order][dup], zones[order][dup + 1]], axis=1), axis=0)
+        if names is None:
+            names = range(pairs.max() + 1)
+        raise ValueError("Overlapping shapes: {}.".format(', '.join(
+            '{}/{}'.format(names[i], names[j]) for i, j in pairs)))
+
+    labels = np.zeros(shape, dtype=np.int32)
+    labels.flat[unique] = zones[first] + 1
+    return labels
+
+
+def shp_labels(shps, x, y, overlap='first'):
+    """Create an integer label raster on a regular grid from many
+    shapes, see `shp_members`.
+
+    Parameters
+    ----------
+    shps : sequence of shapely Polygons or MultiPolygons.
+    x, y : 1-D numpy arrays defining a regular grid
+    overlap : rule for grid points inside several shapes, 'first',
+              'last' or 'raise', see `members_to_labels`.
+
+    Returns
+    -------
+    labels : int32 2-D array, 0 outside all shapes and i+1 inside
+             shps[i]. Grid points lying exactly on a border shared
+             by two shapes are assigned to one of them.
+
+    Examples
+    --------
+    >>> from shapely.geometry import Point
+    >>> polys = [Point(0,0).buffer(1), Point(2,0).buffer(0.5)]
+    >>> x = np.linspace(-5,5,100)
+    >>> y = np.linspace(-5,5,100)
+    >>> labels = shp_labels(polys, x, y)
+    """
+    zones, cells = shp_members(shps, x, y)
+    return members_to_labels(
+        zones, cells, (np.size(y), np.size(x)), overlap=overlap)
+
+
+def _pack_mask(mask):
+    """
+    Pack a boolean mask into bits, label rasters and coverage
+    fractions are kept as they are.
+
+    :param mask: boolean, integer or float 2-D array.
+    :return: dictionary of arrays.
+    """
+    if mask.dtype == bool:
+        return {'bits': np.packbits(mask, axis=None),
+                'shape': np.array(mask.shape)}
+    return {'data': mask}
+
+
+def _unpack_mask(packed):
+    """
+    Unpack a mask packed by `_pack_mask`.
+
+    :param packed: dictionary of arrays.
+    :return: boolean, integer or float 2-D array.
+    """
+    if 'data' in packed:
+        return packed['data'].copy()
+    shape = tuple(packed['shape'])
+    count = int(np.prod(shape))
+    return np.unpackbits(
+        packed['bits'], count=count).view(bool).reshape(shape)
+
+
+def mask_cache_key(shpfile, region, lon, lat):
+    """
+    Construct the mask cache key.
+
+    :param shpfile: shapefile name (or list of names) the mask
+                    is derived from.
+    :param region: region selector, any object with a stable repr.
+    :param lon: grid longitude coordinates.
+    :param lat: grid latitude coordinates.
+    :return: hex digest string.
+    """
+    if isinstance(shpfile, str):
+        shpfile = [shpfile]
+    shp_hash = ''.join(shapefile_hash(name) for name in shpfile)
+    return array_hash(
+        np.frombuffer(shp_hash.encode(), dtype=np.uint8),
+        np.frombuffer(repr(region).encode(), dtype=np.uint8),
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+
+def cached_grid_mask(shpfile, region, lon, lat, builder,
+                     cache=True, cache_dir=None):
+    """
+    Get a grid mask from the in-memory LRU cache or the on-disk
+    cache, building and storing it on a miss. Boolean masks are
+    stored as np.packbits bits, label rasters and coverage fractions
+    compressed, keyed by the shapefile content hash, the region
+    selector and the grid coordinates.
+
+    :param shpfile: shapefile name (or list of names) the mask
+                    is derived from.
+    :param region: region selector, any object with a stable repr.
+    :param lon: grid longitude coordinates.
+    :param lat: grid latitude coordinates.
+    :param builder: function without arguments returning the
+                    boolean 2-D mask (or integer labels, or float
+                    fractions), called on a cache miss.
+    :param cache: use the on-disk cache or not, the in-memory
+                  cache is always used.
+    :param cache_dir: on-disk cache directory, default is
+                      `dk_met_graphics.cache.get_cache_dir('mask')`.
+    :return: boolean (or integer, or float) 2-D array.
+    """
+
+    key = mask_cache_key(shpfile, region, lon, lat)
+
+    # in-memory cache
+    packed = _MASK_CACHE.get(key)
+    if packed is not None:
+        return _unpack_mask(packed)
+
+    # on-disk cache
+    filename = None
+    if cache:
+        if cache_dir is None:
+            cache_dir = get_cache_dir('mask')
+        filename = os.path.join(cache_dir, key + '.npz')
+        if os.path.isfile(filename):
+            with np.load(filename) as f:
+                packed = {name: f[name] for name in f.files}
+            _MASK_CACHE.put(key, packed)
+            return _unpack_mask(packed)
+
+    # build the mask
+    mask = np.asarray(builder())
+    packed = _pack_mask(mask)
+    _MASK_CACHE.put(key, packed)
+    if filename is not None:
+        atomic_save(filename, lambda f: np.savez_compressed(f, **packed))
+    return _unpack_mask(packed)
+
+
+def grid_mask_china(lon, lat, cache=True, fraction=False):
     """
     Getting masked grid in China.
+    The mask is cached in memory and on disk, see `cached_grid_mask`.
 
     :param lon: grid longitude coordinates.
     :param lat: grid latitude coordinates.
-    :return: boolean 2-D array, True inside shape.
+    :param cache: use the on-disk mask cache or not.
+    :param fraction: return the fraction of each grid cell inside
+                     China instead, see `shp_fraction`.
+    :return: boolean 2-D array, True inside shape,
+             or float32 2-D array of covered fractions.
 
 
     >>> lon = np.linspace(0, 359, 360)
     >>> lat = np.linspace(-90, 90 ,181)
     >>> mask = grid_mask_china(lon, lat)
+    >>> frac = grid_mask_china(lon, lat, fraction=True)
+    """
+
+    shpfile = pkg_resources.resource_filename(
+        'dk_met_graphics', "resources/maps/bou1_4p.shp")
+
+    def builder():
+        # read china boundary from shape file
+        shp = shapereader.Reader(shpfile)
+
+        # convert to polygons
+        geoms = shp.geometries()
+        polygons = unary_union(list(geoms))
+
+        # return mask grid
+        if fraction:
+            return shp_fraction(polygons, lon, lat)
+        return shp_mask(polygons, lon, lat)
+
+    return cached_grid_mask(
+        shpfile, ('nation', 'fraction' if fraction else 'mask'),
+        lon, lat, builder, cache=cache)
+
+
+def _read_shape_records(shpfile, encoding='utf-8'):
     """
+    Read the records and geometries of a shapefile, once per file.
+
+    :param shpfile: shapefile name.
+    :param encoding: encoding of the record text fields.
+    :return: list of (record, points, parts), points is a (N, 2) array
+             and parts the start index of every part.
+    """
+
+    stat = os.stat(shpfile)
+    key = (os.path.abspath(shpfile), stat.st_mtime, encoding)
+    records = _SHAPE_RECORDS.get(key)
+    if records is None:
+        sf = shapefile.Reader(shpfile, encoding=encoding)
+        records = [
+            (list(sr.record), np.asarray(sr.shape.points, dtype=np.float64),
+             np.asarray(sr.shape.parts, dtype=np.int64))
+            for sr in sf.shapeRecords()]
+        _SHAPE_RECORDS.put(key, records, nbytes=sum(
+            points.nbytes for _, points, _ in records))
+    return records
+
+
+def _projection_key(m=None, crs=None):
+    """
+    Hashable description of a basemap or cartopy projection.
+
+    :param m: basemap instance.
+    :param crs: `cartopy.crs.CRS` instance.
+    :return: tuple.
+    """
+
+    if m is not None:
+        return ('basemap', getattr(m, 'proj4string', id(m)),
+                getattr(m, 'llcrnrx', None), getattr(m, 'llcrnry', None))
+    if crs is not None:
+        return ('cartopy', crs_key(crs))
+    return None
+
+
+def shp_clip_path(shpfile=None, region_index=3, region_name=None,
+                  m=None, crs=None, encoding='utf-8'):
+    """
+    Build one compound clip path for all matching regions of a
+    shapefile. Vertices of all parts are stacked with numpy and
+    projected in one call, and paths are cached per (shapefile,
+    region set, projection).
+
+    :param shpfile: the shape file, default is resources/maps/country1.shp.
+    :param region_index: the record index of region name.
+    :param region_name: list of region names, default is ["China"].
+    :param m: basemap instance, project vertices with m(lon, lat).
+    :param crs: `cartopy.crs.CRS`, project vertices from longitude and
+                latitude to crs (ignored if m is given).
+    :param encoding: encoding of the record text fields, like 'gbk'
+                     for the bou*.shp files.
+    :return: `matplotlib.path.Path` instance, None if no region matches.
+
+    >>> path = shp_clip_path(region_name=["China", "Taiwan"])
+    """
+
+    # get shape file
+    if shpfile is None:
+        shpfile = pkg_resources.resource_filename(
+            'dk_met_graphics', "resources/maps/country1.shp")
+
+    # get region name
+    if region_name is None:
+        region_name = ["China"]
+    elif isinstance(region_name, str):
+        region_name = [region_name]
+
+    key = (os.path.abspath(shpfile), region_index,
+           tuple(sorted(region_name)), _projection_key(m, crs), encoding)
+    if key in _CLIP_PATH_CACHE:
+        return _CLIP_PATH_CACHE.get(key)
+
+    # collect the parts of all matching records
+    vertices = []
+    codes = []
+    for record, points, parts in _read_shape_records(shpfile, encoding):
+        if record[region_index] not in region_name or points.shape[0] == 0:
+            continue
+        stops = np.append(parts[1:], points.shape[0])
+        code = np.full(points.shape[0], Path.LINETO, dtype=Path.code_type)
+        code[parts] = Path.MOVETO
+        code[stops - 1] = Path.CLOSEPOLY
+        vertices.append(points)
+        codes.append(code)
+
+    if vertices:
+        vertices = np.concatenate(vertices)
+        codes = np.concatenate(codes)
+
+        # project vertices
+        if m is not None:
+            px, py = m(vertices[:, 0], vertices[:, 1])
+            vertices = np.column_stack((px, py))
+        elif crs is not None:
+            vertices = crs.transform_points(
+                ccrs.PlateCarree(), vertices[:, 0], vertices[:, 1])[:, :2]
+        path = Path(vertices, codes)
+    else:
+        path = None
+
+    _CLIP_PATH_CACHE.put(key, path, nbytes=0 if path is None else
+                         path.vertices.nbytes + path.codes.nbytes)
+    return path
 
-    # read china boundary from shape file
-    shp = shapereader.Reader(pkg_resources.resource_filename(
-        'dk_met_graphics', "resources\\maps\\bou1_4p"))
 
-    # convert to polygons
-    geoms = shp.geometries()
-    polygons = cascaded_union(list(geoms))
+def _clip_artists(artists):
+    """
+    Flatten artists to the matplotlib Artist instances to clip.
+
+    :param artists: artist, contour set or a list of them.
+    :return: list of artists.
+    """
 
-    # return mask grid
-    return shp_mask(polygons, lon, lat)
+    if isinstance(artists, (list, tuple)):
+        return [a for artist in artists for a in _clip_artists(artist)]
+    if isinstance(artists, ContourSet) and not isinstance(artists, Artist):
+        # contour sets are collections containers before matplotlib 3.8
+        return list(artists.collections)
+    return [artists]
 
 
 def contour_shp_clip(originfig, ax, m=None, shpfile=None,
-                     region_index=3, region_name=None):
+                     region_index=3, region_name=None, encoding='utf-8'):
     """
     Mask out the unnecessary data outside the interest region
     on a Matplotlib-plotted output instance.
       http://bbs.06climate.com/forum.php?mod=viewthread&tid=42437&extra=page%3D1
 
-    :param originfig: the Matplotlib contour plot instance
+    :param originfig: the Matplotlib contour plot instance, or any
+        artist like pcolormesh and imshow outputs, or a list of them.
     :param ax: the Axes instance
-    :param m: basemap instance, m=Basemap(...)
+    :param m: basemap instance, m=Basemap(...). If None and ax is a
+        cartopy GeoAxes, the clip path is projected to ax.projection.
     :param shpfile: the shape file used for basemap
     :param region_index: the record index of region name.
         If don't know the region index, can explore with:
@@ -162,49 +867,27 @@ def contour_shp_clip(originfig, ax, m=None, shpfile=None,
                            print(sf.shapeRecords()[0].record)
     :param region_name: the name of a region of on the basemap,
         outside the region the data is to be maskout
+    :param encoding: encoding of the shapefile record text fields.
 
-    :return: clip, the the masked-out or clipped matplotlib instance
+    :return: clip, the the masked-out or clipped matplotlib instance,
+        None if the shape file or regions are not found.
     """
 
-    # get shape file
-    if shpfile is None:
-        shpfile = pkg_resources.resource_filename(
-            'dk_met_graphics', "resources\\maps\\country1.shp")
-
-    # get region name
-    if region_name is None:
-        region_name = ["China"]
-
     # check shape file
-    if not os.path.isfile(shpfile):
+    if shpfile is not None and not os.path.isfile(shpfile):
         return None
 
-    # read shape file data
-    sf = shapefile.Reader(shpfile)
-
-    # define vertices and codes
-    vertices = []
-    codes = []
-
-    # loop every records
-    for shape_rec in sf.shapeRecords():
-        if shape_rec.record[region_index] in region_name:
-            pts = shape_rec.shape.points
-            prt = list(shape_rec.shape.parts) + [len(pts)]
-            for i in range(len(prt) - 1):
-                for j in range(prt[i], prt[i + 1]):
-                    if m is not None:
-                        vertices.append(m(pts[j][0], pts[j][1]))
-                    else:
-                        vertices.append((pts[j][0], pts[j][1]))
-                codes += [Path.MOVETO]
-                codes += [Path.LINETO] * (prt[i + 1] - prt[i] - 2)
-                codes += [Path.CLOSEPOLY]
-            clip = Path(vertices, codes)
-            clip = PathPatch(clip, transform=ax.transData)
+    # get the compound clip path
+    crs = getattr(ax, 'projection', None) if m is None else None
+    path = shp_clip_path(shpfile=shpfile, region_index=region_index,
+                         region_name=region_name, m=m, crs=crs,
+                         encoding=encoding)
+    if path is None:
+        return None
+    clip = PathPatch(path, transform=ax.transData)
 
     # clip contour
-    for contour in originfig.collections:
-        contour.set_clip_path(clip)
+    for artist in _clip_artists(originfig):
+        artist.set_clip_path(clip)
 
     return clip
@@ -0,0 +1,276 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Animate forecast sequences.
+
+One figure is kept alive for the whole sequence: the map and color
+bar are drawn once, every frame only replaces the dynamic artists
+(contour sets, barbs `set_UVC`, mesh or raster `set_array`) and the
+rendered RGBA buffer is streamed to the encoder, without writing
+intermediate image files. MP4 (and GIF) frames are piped to ffmpeg;
+without ffmpeg, GIF and WebP loops are encoded with Pillow.
+"""
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+import numpy as np
+import matplotlib as mpl
+import cartopy.crs as ccrs
+from PIL import Image
+from dk_met_graphics.plot.util import new_figure, close_figure
+
+
+def ffmpeg_path():
+    """
+    Find the ffmpeg executable, as set by the matplotlib
+    'animation.ffmpeg_path' setting.
+
+    :return: path, or None if ffmpeg is not found.
+    """
+    return shutil.which(mpl.rcParams['animation.ffmpeg_path'])
+
+
+def _max_rss_mb():
+    """
+    Peak resident memory of the process in MB, None where the
+    resource module is missing (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+
+
+def _render_frames(fig, update, frames):
+    """
+    Update and draw the figure for every frame.
+
+    :return: generator of the RGBA canvas buffer of every frame, valid
+             until the next frame is drawn.
+    """
+    for i, frame in enumerate(frames):
+        update(i, frame)
+        fig.canvas.draw()
+        yield fig.canvas.buffer_rgba()
+
+
+def _encode_ffmpeg(buffers, outfile, size, fps, format):
+    """Pipe raw RGBA frames to ffmpeg."""
+    if format == 'gif':
+        codec = ['-filter_complex',
+                 '[0:v]split[a][b];[a]palettegen[p];[b][p]paletteuse']
+    else:
+        # H.264 needs even frame sizes
+        codec = ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                 '-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+    command = [ffmpeg_path(), '-y', '-loglevel', 'error',
+               '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '{}x{}'.format(*size), '-r', str(fps), '-i', '-'] + \
+        codec + [outfile]
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    nframes = 0
+    try:
+        for buf in buffers:
+            proc.stdin.write(buf)
+            nframes += 1
+    finally:
+        proc.stdin.close()
+        error = proc.stderr.read()
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError("ffmpeg failed: {}".format(
+            error.decode(errors='replace')))
+    return nframes
+
+
+def _encode_pillow(buffers, outfile, size, fps, format):
+    """Encode frames to an animated GIF or WebP with Pillow."""
+    counter = [0]
+
+    def images():
+        for buf in buffers:
+            counter[0] += 1
+            image = Image.frombuffer('RGBA', size, buf, 'raw', 'RGBA', 0, 1)
+            if format == 'gif':
+                # keep 1 byte per pixel frames until the GIF is written
+                yield image.convert('RGB').quantize(
+                    colors=256, method=Image.Quantize.FASTOCTREE)
+            else:
+                yield image.copy()
+
+    frames = images()
+    first = next(frames)
+    kwargs = {'lossless': True} if format == 'webp' else {'optimize': False}
+    first.save(outfile, format=format.upper(), save_all=True,
+               append_images=frames, duration=int(round(1000. / fps)),
+               loop=0, **kwargs)
+    return counter[0]
+
+
+def animate(fig, update, frames, outfile, fps=4, format=None):
+    """
+    Render an animation from a live figure.
+
+    :param fig: figure with an Agg canvas, like `util.new_figure`.
+    :param update: function called with (index, frame) before drawing
+                   every frame, updating the dynamic artists.
+    :param frames: sequence of frame data passed to update.
+    :param outfile: output file name.
+    :param fps: frames per second.
+    :param format: 'mp4', 'gif' or 'webp', default is the outfile
+                   extension. mp4 needs ffmpeg, GIF is encoded by
+                   ffmpeg if found, else by Pillow.
+    :return: statistics dictionary, with the number of frames, the
+             seconds, frames per second and the peak resident memory
+             of the process (MB, None on Windows).
+
+    >>> fig = new_figure(figsize=(10, 8), pyplot=False)
+    >>> ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    >>> plots = draw_precipitation_nws(ax, frames[0])
+    >>> stats = animate(
+    >>>     fig, lambda i, frame: update_precipitation_nws(plots, frame),
+    >>>     frames, 'rain.gif')
+    """
+
+    if format is None:
+        format = os.path.splitext(outfile)[1].lstrip('.').lower()
+    if format not in ('mp4', 'gif', 'webp'):
+        raise ValueError("Unknown animation format '{}'.".format(format))
+    if format == 'mp4' and ffmpeg_path() is None:
+        raise RuntimeError("ffmpeg is needed to encode mp4 animations.")
+
+    fig.canvas.draw()
+    size = fig.canvas.get_width_height(physical=True)
+    start = time.perf_counter()
+    buffers = _render_frames(fig, update, frames)
+    if format == 'webp' or ffmpeg_path() is None:
+        nframes = _encode_pillow(buffers, outfile, size, fps, format)
+    else:
+        nframes = _encode_ffmpeg(buffers, outfile, size, fps, format)
+    seconds = time.perf_counter() - start
+    return {'frames': nframes, 'seconds': seconds,
+            'fps': nframes / seconds if seconds > 0 else np.inf,
+            'max_rss_mb': _max_rss_mb()}
+
+
+def _frame_title(titles, i):
+    """Get the title of a frame."""
+    if titles is None:
+        return ''
+    return titles[i] if not callable(titles) else titles(i)
+
+
+def animate_precipitation_nws(frames, outfile, titles=None,
+                              map_extent=(73, 136, 17, 54), figsize=(8.6, 6.2),
+                              dpi=None, projection=None, fps=4, format=None,
+                              title='Precipitation', **kwargs):
+    """
+    Animate NWS-style precipitation maps of a forecast sequence.
+
+    :param frames: list of precipitation, the first item a
+                   {'lon': 1D array, 'lat': 1D array, 'data': 2D array}
+                   dictionary, later items may be bare 2D data arrays
+                   on the same grid.
+    :param outfile: output file name, .mp4, .gif or .webp.
+    :param titles: right title of every frame, like the valid times.
+    :param map_extent: (lonmin, lonmax, latmin, latmax).
+    :param figsize: figure size in inches.
+    :param dpi: figure resolution.
+    :param projection: map projection, default is PlateCarree.
+    :param fps: frames per second.
+    :param format: animation format, see `animate`.
+    :param title: left title.
+    :param kwargs: keywords passing to `draw_precipitation_nws`.
+    :return: statistics dictionary, see `animate`.
+
+    >>> stats = animate_precipitation_nws(
+    >>>     rains, 'rain.gif', titles=[t.strftime('%m/%dT%H') for t in times])
+    """
+    from dk_met_graphics.plot.precipitation import (
+        draw_precipitation_nws, update_precipitation_nws)
+
+    fig = new_figure(figsize=figsize, dpi=dpi, pyplot=False)
+    try:
+        ax = fig.add_axes((0.1, 0.14, 0.85, 0.8), projection=(
+            ccrs.PlateCarree() if projection is None else projection))
+        # every frame redraws the same map background
+        kwargs.setdefault('cache_background', True)
+        plots = draw_precipitation_nws(
+            ax, frames[0], map_extent=map_extent, **kwargs)
+        # above the grid line labels
+        ax.set_title(title, loc='left', fontsize=14, pad=28)
+        time_title = ax.set_title('', loc='right', fontsize=14, pad=28)
+        cax = fig.add_axes((0.16, 0.06, 0.7, 0.03))
+        cb = fig.colorbar(plots['prep'], cax=cax, orientation='horizontal',
+                          ticks=plots['prep'].norm.boundaries)
+        cb.set_label('Precipitation (mm)', fontsize=10)
+
+        def update(i, frame):
+            if i > 0:
+                update_precipitation_nws(plots, frame)
+            time_title.set_text(_frame_title(titles, i))
+
+        return animate(fig, update, frames, outfile, fps=fps, format=format)
+    finally:
+        close_figure(fig)
+
+
+def animate_gh500_uv850_mslp(frames, outfile, titles=None,
+                             map_extent=(50, 150, 0, 65), figsize=(16, 9),
+                             dpi=None, projection=None, fps=4, format=None,
+                             regrid_shape=20, add_china=True,
+                             title='500hPa GH, 850hPa Wind, MSLP'):
+    """
+    Animate 500-hPa geopotential height, 850-hPa wind barbs and mean
+    sea level pressure maps of a forecast sequence.
+
+    :param frames: list of {'gh500': ..., 'uv850': ..., 'mslp': ...}
+                   dictionaries of the fields of every frame, see
+                   `synoptic.draw_gh500_uv850_mslp`, on the same grids.
+    :param outfile: output file name, .mp4, .gif or .webp.
+    :param titles: right title of every frame, like the valid times.
+    :param map_extent: (lonmin, lonmax, latmin, latmax).
+    :param figsize: figure size in inches.
+    :param dpi: figure resolution.
+    :param projection: map projection, default is PlateCarree.
+    :param fps: frames per second.
+    :param format: animation format, see `animate`.
+    :param regrid_shape: wind barbs density.
+    :param add_china: add china map or not.
+    :param title: left title.
+    :return: statistics dictionary, see `animate`.
+
+    >>> frames = [{'gh500': gh500[i], 'uv850': uv850[i], 'mslp': mslp[i]}
+    >>>           for i in range(len(fhours))]
+    >>> stats = animate_gh500_uv850_mslp(frames, 'synoptic.mp4')
+    """
+    from dk_met_graphics.plot.synoptic import (
+        draw_gh500_uv850_mslp, update_gh500_uv850_mslp)
+
+    fig = new_figure(figsize=figsize, dpi=dpi, pyplot=False)
+    try:
+        ax = fig.add_axes((0.05, 0.05, 0.9, 0.88), projection=(
+            ccrs.PlateCarree() if projection is None else projection))
+        plots = draw_gh500_uv850_mslp(
+            ax, map_extent=map_extent, add_china=add_china,
+            regrid_shape=regrid_shape, cache_background=True, **frames[0])
+        ax.set_title(title, loc='left', fontsize=18)
+        time_title = ax.set_title('', loc='right', fontsize=18)
+
+        def update(i, frame):
+            if i > 0:
+                update_gh500_uv850_mslp(
+                    ax, plots, regrid_shape=regrid_shape, **frame)
+            time_title.set_text(_frame_title(titles, i))
+
+        return animate(fig, update, frames, outfile, fps=fps, format=format)
+    finally:
+        close_figure(fig)
+
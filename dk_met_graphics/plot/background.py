@@ -0,0 +1,247 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Composite cached static map layers under and over the dynamic layers.
+
+Land, coast lines, boundaries and grid lines are the same for every
+forecast hour of a product. In raster outputs they are drawn once per
+(layers, map projection, extent, DPI, axes size in pixels) into RGBA
+buffers, one per z-order, and every later figure only blits the
+buffers at the axes' window extent in their z-order place among the
+data layers. Vector outputs draw the layer artists themselves.
+"""
+
+import math
+import functools
+import numpy as np
+from matplotlib.artist import Artist
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+from matplotlib.backends.backend_agg import FigureCanvasAgg, RendererAgg
+from dk_met_graphics.cache import LRUCache, crs_key
+
+
+# process-wide cache of rendered static layers
+_BACKGROUND_CACHE = LRUCache(maxsize=32, maxbytes=512 * 1024 ** 2)
+
+# room around the axes for the static artists drawn outside of it,
+# like grid line labels, in inches
+_MARGIN = 1.5
+
+
+def background_cache_stats():
+    """
+    Statistics of the static layer image cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _BACKGROUND_CACHE.stats()
+
+
+def clear_background_cache():
+    """
+    Empty the static layer image cache.
+    """
+    _BACKGROUND_CACHE.clear()
+
+
+def layers_key(layers):
+    """
+    Hashable description of static layer functions.
+
+    :param layers: list of functions, or `functools.partial` of
+                   functions, called with an axes to add the layers.
+    :return: tuple.
+    """
+    key = []
+    for layer in layers:
+        if isinstance(layer, functools.partial):
+            key.append((layer.func.__module__, layer.func.__qualname__,
+                        repr(layer.args), repr(sorted(layer.keywords.items()))))
+        else:
+            key.append((layer.__module__, layer.__qualname__))
+    return tuple(key)
+
+
+def _add_layers(ax, layers):
+    """
+    Call static layer functions with an axes.
+
+    :param ax: cartopy GeoAxes instance.
+    :param layers: static layer functions.
+    :return: the artists added by the layers.
+    """
+    children = set(map(id, ax.get_children()))
+    for layer in layers:
+        layer(ax)
+    return [a for a in ax.get_children() if id(a) not in children]
+
+
+def _static_axes(ax, layers, dpi, size, phase):
+    """
+    Add static layers to an offscreen copy of a map axes, with a
+    margin of `_MARGIN` inches around it.
+
+    :param ax: cartopy GeoAxes instance.
+    :param layers: static layer functions.
+    :param dpi: resolution of the offscreen figure.
+    :param size: (width, height) of the axes in pixels.
+    :param phase: (x, y) sub-pixel offset of the axes origin.
+    :return: (fig, artists, margin), the offscreen figure, the artists
+             added by the layers and the margin in pixels.
+    """
+    margin = int(math.ceil(_MARGIN * dpi))
+    width = int(math.ceil(size[0] + phase[0])) + 2 * margin
+    height = int(math.ceil(size[1] + phase[1])) + 2 * margin
+    # a quarter pixel more keeps the canvas from rounding down
+    fig = Figure(figsize=((width + .25) / dpi, (height + .25) / dpi),
+                 dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.patch.set_visible(False)
+    fw, fh = fig.bbox.width, fig.bbox.height
+    static_ax = fig.add_axes(
+        ((margin + phase[0]) / fw, (margin + phase[1]) / fh,
+         size[0] / fw, size[1] / fh), projection=ax.projection)
+    static_ax.set_xlim(ax.get_xlim())
+    static_ax.set_ylim(ax.get_ylim())
+    # the window extent of the map axes already has its aspect
+    static_ax.set_aspect('auto')
+    static_ax.patch.set_visible(False)
+    for spine in static_ax.spines.values():
+        spine.set_visible(False)
+    return fig, _add_layers(static_ax, layers), margin
+
+
+def static_layer_images(ax, layers, dpi):
+    """
+    Get the RGBA images of static layers for a map axes, rendering
+    them on a cache miss.
+
+    :param ax: cartopy GeoAxes instance, with its final window extent
+               at the output resolution.
+    :param layers: static layer functions.
+    :param dpi: output resolution.
+    :return: dictionary {zorder: (x, y, image)}, (height, width, 4)
+             uint8 RGBA images cropped to the drawn pixels, with
+             their lower left corners at (x, y) pixels from the lower
+             left pixel of the axes.
+    """
+
+    bbox = ax.bbox
+    size = (round(float(bbox.width), 2), round(float(bbox.height), 2))
+    phase = (round(float(bbox.x0 % 1), 2), round(float(bbox.y0 % 1), 2))
+    key = (layers_key(layers), crs_key(ax.projection),
+           tuple(np.round(np.concatenate([ax.get_xlim(), ax.get_ylim()]), 3)),
+           round(float(dpi), 4), size, phase)
+    images = _BACKGROUND_CACHE.get(key)
+    if images is not None:
+        return images
+
+    # draw every z-order of the static artists separately, after a
+    # full draw has set up the axes (clip paths, grid line artists)
+    fig, artists, margin = _static_axes(ax, layers, dpi, size, phase)
+    fig.canvas.draw()
+    renderer = fig.canvas.get_renderer()
+    images = {}
+    for zorder in sorted(set(a.get_zorder() for a in artists)):
+        renderer.clear()
+        for artist in artists:
+            if artist.get_zorder() == zorder:
+                artist.draw(renderer)
+        image = np.asarray(renderer.buffer_rgba())
+        rows = np.flatnonzero(image[..., 3].any(axis=1))
+        cols = np.flatnonzero(image[..., 3].any(axis=0))
+        if rows.size == 0:
+            continue
+        image = image[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].copy()
+        images[zorder] = (int(cols[0]) - margin,
+                          int(renderer.height - rows[-1] - 1) - margin,
+                          image)
+    fig.clear()
+    _BACKGROUND_CACHE.put(key, images)
+    return images
+
+
+class StaticLayers(Artist):
+    """
+    Artist drawing the static map layers of one z-order, as a cached
+    image in raster outputs and as the layer artists otherwise.
+    """
+
+    def __init__(self, layers, zorder, artists=()):
+        """
+        :param layers: static layer functions.
+        :param zorder: z-order of the static artists to draw.
+        :param artists: the layer artists of the z-order, taken out
+                        of the axes, drawn by non-raster renderers.
+        """
+        super(StaticLayers, self).__init__()
+        self.layers = list(layers)
+        self.artists = list(artists)
+        self.set_zorder(zorder)
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        if not isinstance(renderer, RendererAgg):
+            for artist in self.artists:
+                artist.draw(renderer)
+            self.stale = False
+            return
+        images = static_layer_images(self.axes, self.layers, renderer.dpi)
+        if self.get_zorder() not in images:
+            return
+        x, y, image = images[self.get_zorder()]
+        bbox = self.axes.bbox
+        gc = renderer.new_gc()
+        gc.set_alpha(self.get_alpha())
+        renderer.draw_image(gc, int(math.floor(bbox.x0)) + x,
+                            int(math.floor(bbox.y0)) + y, image[::-1])
+        gc.restore()
+        self.stale = False
+
+    def get_tightbbox(self, renderer=None):
+        bboxes = [a.get_tightbbox(renderer) for a in self.artists
+                  if a.get_visible() and a.get_in_layout()]
+        bboxes = [b for b in bboxes
+                  if b is not None and 0 < b.width < np.inf]
+        if not bboxes:
+            return None
+        return Bbox.union(bboxes)
+
+
+def add_static_layers(ax, layers):
+    """
+    Add static map layers drawn as cached images in raster outputs,
+    at the same z-orders as the layer artists would be.
+    Vector outputs (pdf, svg) draw the layer artists.
+    Axes titles are not moved above cached top grid line labels,
+    give them a `pad`.
+
+    :param ax: cartopy GeoAxes instance, set its extent first.
+    :param layers: list of functions (or `functools.partial` of
+                   module-level functions, the cache is keyed by their
+                   names and arguments) called with an axes to add
+                   the layers, like adding coast lines or grid lines.
+    :return: list of `StaticLayers` artists.
+
+    >>> layers = [functools.partial(add_china_map_2cartopy,
+    >>>                             name='province', lw=1)]
+    >>> add_static_layers(ax, layers)
+    """
+
+    # the layer artists stay bound to the axes, but out of its
+    # children, and are drawn by the static layers artists
+    artists = _add_layers(ax, layers)
+    for artist in artists:
+        artist.remove()
+        artist.axes = ax
+        artist.set_figure(ax.figure)
+    added = []
+    for zorder in sorted(set(a.get_zorder() for a in artists)):
+        artist = StaticLayers(layers, zorder, [
+            a for a in artists if a.get_zorder() == zorder])
+        ax.add_artist(artist)
+        artist.set_clip_path(None)
+        added.append(artist)
+    return added
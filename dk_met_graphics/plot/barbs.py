@@ -0,0 +1,351 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Thin wind barbs and vectors with precomputed sampling.
+
+`GeoAxes.barbs(..., regrid_shape=n)` interpolates u and v to a regular
+grid in the map projection with scipy griddata (a Delaunay
+triangulation of every source point) on every call. The barb positions
+only depend on the source grid, the map projection and the extent, so
+here they are computed once, with the bilinear interpolation weights
+(or the nearest source point of density-aware thinning) and the
+Jacobian rotating lon/lat vectors to the projection, and cached in
+memory and on disk. Sampling a new u/v field is then a gather.
+"""
+
+import os
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.cache import (
+    LRUCache, get_cache_dir, array_hash, crs_key, atomic_save)
+
+
+# process-wide cache of barb samplers
+_SAMPLER_CACHE = LRUCache(maxsize=64, maxbytes=128 * 1024 ** 2)
+
+# longitude and latitude step of the rotation Jacobian, like cartopy
+_DELTA = 1e-3
+
+
+def sampler_cache_stats():
+    """
+    Statistics of the in-memory barb sampler cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _SAMPLER_CACHE.stats()
+
+
+def clear_sampler_cache():
+    """
+    Empty the in-memory barb sampler cache.
+    """
+    _SAMPLER_CACHE.clear()
+
+
+def regrid_shape_aspect(regrid_shape, extent):
+    """
+    Get the (nx, ny) barb grid shape following the map aspect, like
+    cartopy.
+
+    :param regrid_shape: int, barbs along the shorter map side, or
+                         (nx, ny) tuple.
+    :param extent: (x0, x1, y0, y1) map extent in projection coordinates.
+    :return: (nx, ny) tuple.
+    """
+    if np.ndim(regrid_shape) != 0:
+        return tuple(int(n) for n in regrid_shape)
+    x_range, y_range = np.diff(extent)[::2]
+    aspect = x_range / y_range
+    if x_range >= y_range:
+        return int(regrid_shape * aspect), int(regrid_shape)
+    return int(regrid_shape), int(regrid_shape / aspect)
+
+
+def _fractional_index(coords, values):
+    """
+    Fractional index of values in monotonic 1-D coordinates, NaN outside.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    index = np.arange(coords.size, dtype=np.float64)
+    if coords[0] > coords[-1]:
+        coords, index = coords[::-1], index[::-1]
+    return np.interp(values, coords, index, left=np.nan, right=np.nan)
+
+
+def _to_grid_lon(lon, plon):
+    """Wrap longitudes to a 0-360 grid."""
+    if np.max(lon) > 180.:
+        plon = np.where(plon < np.min(lon), plon + 360., plon)
+    return plon
+
+
+def _rotation(projection, plon, plat):
+    """
+    Jacobian of the projection at lon/lat points, mapping eastward and
+    northward (degree space) components to projected directions.
+
+    :return: (n, 2, 2) array.
+    """
+    datacrs = ccrs.PlateCarree()
+    base = projection.transform_points(datacrs, plon, plat)[:, :2]
+    jacobian = np.empty((plon.size, 2, 2))
+    for k, (dlon, dlat) in enumerate(((_DELTA, 0.), (0., _DELTA))):
+        # step backwards at the domain edges
+        sign = np.where((plon + dlon > 180.) | (plat + dlat > 90.), -1., 1.)
+        moved = projection.transform_points(
+            datacrs, plon + sign * dlon, plat + sign * dlat)[:, :2]
+        jacobian[:, :, k] = (moved - base) * sign[:, None] / _DELTA
+    return jacobian
+
+
+def regrid_sampler(lon, lat, projection, extent, regrid_shape):
+    """
+    Compute the barb positions on a regular grid of the map projection
+    and their bilinear interpolation weights on the source grid.
+
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the map.
+    :param extent: (x0, x1, y0, y1) map extent in projection coordinates.
+    :param regrid_shape: (nx, ny) barb grid shape.
+    :return: sampler dictionary, x and y (n,) barb positions in the
+             projection, index and weights (n, 4) flat grid indices
+             (row-major on (lat, lon)) and weights, rotation (n, 2, 2).
+    """
+    nx, ny = regrid_shape
+    x, y = np.meshgrid(np.linspace(extent[0], extent[1], nx),
+                       np.linspace(extent[2], extent[3], ny))
+    x, y = x.ravel(), y.ravel()
+    points = ccrs.PlateCarree().transform_points(projection, x, y)
+    plon, plat = points[:, 0], points[:, 1]
+
+    # keep the positions inside the grid
+    fx = _fractional_index(lon, _to_grid_lon(lon, plon))
+    fy = _fractional_index(lat, plat)
+    inside = np.isfinite(fx) & np.isfinite(fy)
+    x, y, plon, plat = x[inside], y[inside], plon[inside], plat[inside]
+    fx, fy = fx[inside], fy[inside]
+
+    # bilinear weights of the four surrounding grid points
+    nlon, nlat = np.size(lon), np.size(lat)
+    i0 = np.clip(np.floor(fx).astype(np.int64), 0, nlon - 2)
+    j0 = np.clip(np.floor(fy).astype(np.int64), 0, nlat - 2)
+    wx, wy = fx - i0, fy - j0
+    index = np.stack([j0 * nlon + i0, j0 * nlon + i0 + 1,
+                      (j0 + 1) * nlon + i0, (j0 + 1) * nlon + i0 + 1], axis=1)
+    weights = np.stack([(1 - wx) * (1 - wy), wx * (1 - wy),
+                        (1 - wx) * wy, wx * wy], axis=1)
+    return {'x': x, 'y': y, 'index': index, 'weights': weights,
+            'rotation': _rotation(projection, plon, plat)}
+
+
+def thin_sampler(lon, lat, projection, extent, spacing):
+    """
+    Density-aware thinning: pick at most one source grid point per
+    spacing x spacing cell of the map projection, the nearest to the
+    cell center, so barbs are evenly spaced on the map whatever the
+    grid density (like the converging meridians of lon/lat grids).
+    The barbs show the original grid values, without interpolation.
+
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the map.
+    :param extent: (x0, x1, y0, y1) map extent in projection coordinates.
+    :param spacing: barb spacing in projection coordinates.
+    :return: sampler dictionary, see `regrid_sampler`, with (n, 1) index
+             and weights.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    # grid stride, keeping a few grid points per cell where the map
+    # is most stretched
+    bx, by = np.meshgrid(np.linspace(extent[0], extent[1], 11),
+                         np.linspace(extent[2], extent[3], 11))
+    border = ccrs.PlateCarree().transform_points(
+        projection, bx.ravel(), by.ravel())
+    border = border[np.isfinite(border[:, 0]) & np.isfinite(border[:, 1])]
+    scale = np.max(np.linalg.norm(
+        _rotation(projection, border[:, 0], border[:, 1]), axis=1))
+    step = max(np.min(np.abs(np.diff(lon))), np.min(np.abs(np.diff(lat))))
+    stride = max(int(spacing / scale / step / 3.), 1)
+
+    # source points projected to the map, inside the extent
+    cols = np.arange(0, lon.size, stride)
+    rows = np.arange(0, lat.size, stride)
+    glon, glat = np.meshgrid(lon[cols], lat[rows])
+    points = projection.transform_points(
+        ccrs.PlateCarree(), glon.ravel(), glat.ravel())
+    x, y = points[:, 0], points[:, 1]
+    index = (rows[:, None] * lon.size + cols[None, :]).ravel()
+    inside = ((x >= extent[0]) & (x <= extent[1]) &
+              (y >= extent[2]) & (y <= extent[3]))
+    x, y, index = x[inside], y[inside], index[inside]
+
+    # the point nearest to the center of every cell
+    cx = np.floor((x - extent[0]) / spacing)
+    cy = np.floor((y - extent[2]) / spacing)
+    distance = np.hypot(x - extent[0] - (cx + 0.5) * spacing,
+                        y - extent[2] - (cy + 0.5) * spacing)
+    cell = cy * (np.floor((extent[1] - extent[0]) / spacing) + 1) + cx
+    order = np.lexsort((distance, cell))
+    first = order[np.r_[True, cell[order][1:] != cell[order][:-1]]]
+    x, y, index = x[first], y[first], index[first]
+
+    plon = lon[index % lon.size]
+    plat = lat[index // lon.size]
+    return {'x': x, 'y': y, 'index': index[:, None],
+            'weights': np.ones((index.size, 1)),
+            'rotation': _rotation(projection, plon, plat)}
+
+
+def cached_sampler(lon, lat, projection, extent, regrid_shape=None,
+                   spacing=None, cache=True, cache_dir=None):
+    """
+    Get a barb sampler of `regrid_sampler` (or `thin_sampler` if
+    spacing is given) from the in-memory LRU cache or the on-disk
+    cache, computing and storing it on a miss.
+
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the map.
+    :param extent: (x0, x1, y0, y1) map extent in projection coordinates.
+    :param regrid_shape: (nx, ny) barb grid shape.
+    :param spacing: barb spacing in projection coordinates, for
+                    density-aware thinning.
+    :param cache: use the on-disk cache or not, the in-memory
+                  cache is always used.
+    :param cache_dir: on-disk cache directory, default is
+                      `dk_met_graphics.cache.get_cache_dir('barbs')`.
+    :return: sampler dictionary.
+    """
+
+    target = repr((crs_key(projection),
+                   tuple(np.round(np.asarray(extent, dtype=np.float64), 6)),
+                   None if regrid_shape is None else tuple(regrid_shape),
+                   None if spacing is None else round(float(spacing), 6)))
+    key = array_hash(
+        np.frombuffer(target.encode(), dtype=np.uint8),
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+    # in-memory cache
+    sampler = _SAMPLER_CACHE.get(key)
+    if sampler is not None:
+        return sampler
+
+    # on-disk cache
+    filename = None
+    if cache:
+        if cache_dir is None:
+            cache_dir = get_cache_dir('barbs')
+        filename = os.path.join(cache_dir, key + '.npz')
+        if os.path.isfile(filename):
+            with np.load(filename) as f:
+                sampler = dict(f)
+            _SAMPLER_CACHE.put(key, sampler)
+            return sampler
+
+    if spacing is None:
+        sampler = regrid_sampler(lon, lat, projection, extent, regrid_shape)
+    else:
+        sampler = thin_sampler(lon, lat, projection, extent, spacing)
+    _SAMPLER_CACHE.put(key, sampler)
+    if filename is not None:
+        atomic_save(filename, lambda f: np.savez(f, **sampler))
+    return sampler
+
+
+def sample_vectors(sampler, u, v):
+    """
+    Sample a vector field at the barb positions of a sampler and
+    rotate it to the map projection, keeping the magnitudes.
+
+    :param sampler: sampler dictionary, see `cached_sampler`.
+    :param u: 2-D (lat, lon) eastward component.
+    :param v: 2-D (lat, lon) northward component.
+    :return: (u, v) projected components at the barb positions, NaN
+             where the field is missing.
+    """
+    index, weights = sampler['index'], sampler['weights']
+    u = np.sum(np.ravel(np.ma.filled(u, np.nan))[index] * weights, axis=1)
+    v = np.sum(np.ravel(np.ma.filled(v, np.nan))[index] * weights, axis=1)
+    rotation = sampler['rotation']
+    pu = rotation[:, 0, 0] * u + rotation[:, 0, 1] * v
+    pv = rotation[:, 1, 0] * u + rotation[:, 1, 1] * v
+    projected = np.hypot(pu, pv)
+    scale = np.divide(np.hypot(u, v), projected,
+                      out=np.zeros_like(projected), where=projected > 0)
+    return pu * scale, pv * scale
+
+
+def barb_vectors(ax, lon, lat, u, v, regrid_shape=20, spacing=None,
+                 cache=True):
+    """
+    Sample a wind field at the barb positions of a map, with a cached
+    sampler.
+
+    :param ax: cartopy GeoAxes instance, set its extent first.
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward component.
+    :param v: 2-D (lat, lon) northward component.
+    :param regrid_shape: barbs along the shorter map side, or (nx, ny),
+                         like `GeoAxes.barbs`.
+    :param spacing: minimum barb spacing in points (1/72 inch), for
+                    density-aware thinning instead of regrid_shape.
+    :param cache: keep the sampler in the on-disk cache, see
+                  `cached_sampler`.
+    :return: (x, y, u, v) barb positions in the map projection and
+             projected components.
+    """
+    extent = ax.get_extent(ax.projection)
+    if spacing is None:
+        sampler = cached_sampler(
+            lon, lat, ax.projection, extent,
+            regrid_shape=regrid_shape_aspect(regrid_shape, extent),
+            cache=cache)
+    else:
+        # points to projection coordinates
+        ax.apply_aspect()
+        width = ax.get_position().width * ax.figure.get_size_inches()[0]
+        sampler = cached_sampler(
+            lon, lat, ax.projection, extent,
+            spacing=spacing / 72. * (extent[1] - extent[0]) / width,
+            cache=cache)
+    u, v = sample_vectors(sampler, np.squeeze(u), np.squeeze(v))
+    return sampler['x'], sampler['y'], u, v
+
+
+def draw_barbs(ax, lon, lat, u, v, regrid_shape=20, spacing=None,
+               cache=True, **kwargs):
+    """
+    Draw wind barbs of a field on a regular longitude and latitude
+    grid, thinned with a cached sampler: the fast alternative to
+    `GeoAxes.barbs(..., regrid_shape=n)`.
+
+    :param ax: cartopy GeoAxes instance, set its extent first.
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward component.
+    :param v: 2-D (lat, lon) northward component.
+    :param regrid_shape: barbs along the shorter map side, or (nx, ny),
+                         bilinear interpolated like `GeoAxes.barbs`.
+    :param spacing: minimum barb spacing in points (1/72 inch), for
+                    density-aware thinning of the grid points instead
+                    of regrid_shape.
+    :param cache: keep the sampler in the on-disk cache, see
+                  `cached_sampler`.
+    :param kwargs: keywords passing to `ax.barbs`, like length or zorder.
+    :return: `matplotlib.quiver.Barbs`, update it with
+             `barbs.set_UVC(*barb_vectors(...)[2:])`.
+
+    >>> bb = draw_barbs(ax, lon, lat, u, v, regrid_shape=20, length=6)
+    >>> bb = draw_barbs(ax, lon, lat, u, v, spacing=25, length=6)
+    """
+    x, y, u, v = barb_vectors(ax, lon, lat, u, v, regrid_shape=regrid_shape,
+                              spacing=spacing, cache=cache)
+    kwargs['transform'] = ax.projection
+    return ax.barbs(x, y, np.ma.masked_invalid(u), np.ma.masked_invalid(v),
+                    **kwargs)
+
@@ -4,16 +4,42 @@
 Draw china map.
 """
 
-import pkg_resources
+import numpy as np
+import matplotlib as mpl
 import cartopy.crs as ccrs
+from shapely.geometry import box
 from matplotlib.patches import Polygon
-from cartopy.io.shapereader import Reader
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection, LineCollection
+from dk_met_graphics.cache import LRUCache, crs_key
+from dk_met_graphics.resources.boundary import load_boundary, select_level
+try:
+    from cartopy.mpl.path import shapely_to_path
+except ImportError:
+    # cartopy < 0.23
+    from cartopy.mpl.patch import geos_to_path
+
+    def shapely_to_path(geom):
+        return Path.make_compound_path(*geos_to_path(geom))
+
+
+# process-wide cache of projected map paths, keyed by
+# (map name, target projection, map extent bucket, tolerance)
+_GEOMETRY_CACHE = LRUCache(maxsize=64, maxbytes=256 * 1024 ** 2)
+
+# map extents are rounded outward to multiples of this (degrees)
+EXTENT_BUCKET = 5.
+
+# simplification tolerance, in pixels of the output figure
+SIMPLIFY_PIXELS = 0.5
 
 
 def add_china_map_2basemap(mp, ax, name='province', facecolor='none',
-                           edgecolor='c', lw=2, **kwargs):
+                           edgecolor='c', lw=2, drawbounds=True, **kwargs):
     """
     Add china province boundary to basemap instance.
+    The level of detail of the boundaries is chosen from the map
+    extent and the figure resolution.
 
     :param mp: basemap instance.
     :param ax: matplotlib axes instance.
@@ -21,8 +47,11 @@ def add_china_map_2basemap(mp, ax, name='province', facecolor='none',
     :param facecolor: fill color, default is none.
     :param edgecolor: edge color.
     :param lw: line width.
+    :param drawbounds: also draw the boundary lines (black, 0.5 wide)
+                       and set the axes limits to the map, like
+                       `Basemap.readshapefile`.
     :param kwargs: keywords passing to Polygon.
-    :return: None.
+    :return: list of Polygon patches.
     """
 
     # map name
@@ -30,28 +59,203 @@ def add_china_map_2basemap(mp, ax, name='province', facecolor='none',
              'county': "BOUNT_poly", 'river': "hyd1_4p",
              'river_high': "hyd2_4p"}
 
-    # get shape file and information
-    shpfile = pkg_resources.resource_filename(
-        'dk_met_graphics', "resources\\maps\\"+names[name])
-    _ = mp.readshapefile(shpfile, 'states', drawbounds=True)
+    # select the level of detail for the map extent and resolution
+    extent = (mp.llcrnrlon, mp.urcrnrlon, mp.llcrnrlat, mp.urcrnrlat)
+    layer = load_boundary(
+        names[name], level=select_level(_simplify_tolerance(ax, extent)))
+
+    # add polygons overlapping the map
+    polys = []
+    rings = []
+    for p in layer.query(extent):
+        for r in range(layer.part_offsets[p], layer.part_offsets[p + 1]):
+            ring = layer.ring(r)
+            x, y = mp(ring[:, 0].astype(np.float64),
+                      ring[:, 1].astype(np.float64))
+            rings.append(np.column_stack([x, y]))
+            poly = Polygon(rings[-1], facecolor=facecolor,
+                           edgecolor=edgecolor, lw=lw, **kwargs)
+            ax.add_patch(poly)
+            polys.append(poly)
 
-    for info, shp in zip(mp.states_info, mp.states):
-        poly = Polygon(
-            shp, facecolor=facecolor, edgecolor=edgecolor, lw=lw, **kwargs)
-        ax.add_patch(poly)
+    # boundary lines drawn by readshapefile
+    if drawbounds:
+        lines = LineCollection(rings, antialiaseds=(1,))
+        lines.set_color('k')
+        lines.set_linewidth(0.5)
+        lines.set_label('_nolabels_')
+        ax.add_collection(lines)
+        mp.set_axes_limits(ax=ax)
+    return polys
+
+
+def geometry_cache_stats():
+    """
+    Statistics of the projected map geometry cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _GEOMETRY_CACHE.stats()
+
+
+def set_geometry_cache_limit(maxbytes=None, maxsize=None):
+    """
+    Set the memory budget of the projected map geometry cache.
+
+    :param maxbytes: maximum total size of the cached paths in bytes.
+    :param maxsize: maximum number of cached layers.
+    :return: None.
+    """
+    if maxbytes is not None:
+        _GEOMETRY_CACHE.maxbytes = maxbytes
+    if maxsize is not None:
+        _GEOMETRY_CACHE.maxsize = maxsize
+
+
+def clear_geometry_cache():
+    """
+    Empty the projected map geometry cache.
+    """
+    _GEOMETRY_CACHE.clear()
+
+
+def _extent_bucket(ax):
+    """
+    Round the map extent of a cartopy axes outward to `EXTENT_BUCKET`.
+
+    :param ax: cartopy GeoAxes instance.
+    :return: (lonmin, lonmax, latmin, latmax) tuple.
+    """
+    lon0, lon1, lat0, lat1 = ax.get_extent(ccrs.PlateCarree())
+    return (np.floor(lon0 / EXTENT_BUCKET) * EXTENT_BUCKET,
+            np.ceil(lon1 / EXTENT_BUCKET) * EXTENT_BUCKET,
+            max(np.floor(lat0 / EXTENT_BUCKET) * EXTENT_BUCKET, -90.),
+            min(np.ceil(lat1 / EXTENT_BUCKET) * EXTENT_BUCKET, 90.))
+
+
+def _simplify_tolerance(ax, extent=None):
+    """
+    Get the simplification tolerance (degrees) matching the pixel
+    resolution of the axes, `SIMPLIFY_PIXELS` pixels at the larger of
+    the figure and savefig resolutions, rounded down to a power of 2.
+
+    :param ax: matplotlib axes instance.
+    :param extent: (lonmin, lonmax, latmin, latmax) map extent, default
+                   is the extent of the cartopy GeoAxes.
+    :return: tolerance in degrees.
+    """
+    dpi = ax.figure.dpi
+    if not isinstance(mpl.rcParams['savefig.dpi'], str):
+        dpi = max(dpi, mpl.rcParams['savefig.dpi'])
+    bbox = ax.get_position()
+    width, height = ax.figure.get_size_inches()
+    npixel = max(bbox.width * width, bbox.height * height) * dpi
+    if extent is None:
+        extent = ax.get_extent(ccrs.PlateCarree())
+    lon0, lon1, lat0, lat1 = extent
+    tolerance = SIMPLIFY_PIXELS * max(lon1 - lon0, lat1 - lat0) / npixel
+    return 2. ** np.floor(np.log2(tolerance))
+
+
+def _projected_paths(shpname, projection, extent, tolerance=0.):
+    """
+    Get the map geometries of a boundary layer projected to
+    matplotlib paths, from the process-wide cache if possible.
+    Only the parts found in the extent by the spatial index are
+    clipped to the extent and projected, from the coarsest stored
+    level of detail within the tolerance (see `boundary.select_level`),
+    so neighbouring polygons keep their shared border vertices.
+
+    :param shpname: boundary layer name, like 'bou2_4p'.
+    :param projection: target `cartopy.crs.Projection`.
+    :param extent: (lonmin, lonmax, latmin, latmax) extent bucket.
+    :param tolerance: simplification tolerance in degrees, 0 to keep
+                      all vertices.
+    :return: list of `matplotlib.path.Path` in projection coordinates.
+    """
+
+    level = select_level(tolerance)
+    key = (shpname, crs_key(projection), extent, level)
+    paths = _GEOMETRY_CACHE.get(key)
+    if paths is not None:
+        return paths
+
+    # parts overlapping the extent
+    layer = load_boundary(shpname, level=level)
+    clip = box(extent[0], extent[2], extent[1], extent[3])
+
+    # clip and project geometries
+    datacrs = ccrs.PlateCarree()
+    paths = []
+    for p in layer.query(extent):
+        geom = layer.part_geometry(p)
+        if not clip.contains(geom):
+            # simplified polygons may cross themselves
+            if not geom.is_valid:
+                geom = geom.buffer(0)
+            geom = geom.intersection(clip)
+        if geom.is_empty:
+            continue
+        projected = projection.project_geometry(geom, datacrs)
+        if not projected.is_empty:
+            paths.append(shapely_to_path(projected))
+
+    _GEOMETRY_CACHE.put(key, paths, nbytes=sum(
+        path.vertices.nbytes + (0 if path.codes is None else path.codes.nbytes)
+        for path in paths))
+    return paths
+
+
+class ChinaMapCollection(PathCollection):
+    """
+    Collection of china map paths, selected for the extent and pixel
+    resolution of the map when it is drawn. The paths come from the
+    process-wide projected path cache (see `_projected_paths`), so the
+    map follows later `set_extent` calls and savefig resolutions.
+    """
+
+    def __init__(self, shpname, simplify=True, **kwargs):
+        """
+        :param shpname: boundary layer name, like 'bou2_4p'.
+        :param simplify: simplify the geometries to the resolution.
+        :param kwargs: keywords passing to PathCollection.
+        """
+        super(ChinaMapCollection, self).__init__([], **kwargs)
+        self.shpname = shpname
+        self.simplify = simplify
+
+    def get_paths(self):
+        ax = self.axes
+        if ax is None or not hasattr(ax, 'projection'):
+            return []
+        return _projected_paths(
+            self.shpname, ax.projection, _extent_bucket(ax),
+            tolerance=_simplify_tolerance(ax) if self.simplify else 0.)
 
 
 def add_china_map_2cartopy(ax, name='province', facecolor='none',
-                           edgecolor='c', lw=2, **kwargs):
+                           edgecolor='c', lw=2, simplify=True, **kwargs):
     """
     Draw china boundary on cartopy map.
+    Geometries are served from the compiled boundary store
+    (see `dk_met_graphics.resources.boundary`) and projected once per
+    (map name, projection, extent bucket); the projected paths are
+    kept in a process-wide cache (see `geometry_cache_stats`), so
+    later figures of a batch skip parsing and projection entirely.
+    Only the polygons and lines overlapping the map extent are
+    projected, starting from the level of detail matching the pixel
+    resolution of the figure (see `boundary.LOD_TOLERANCES`). The
+    extent and resolution are taken when the map is drawn, so the
+    extent may be set before or after calling.
 
     :param ax: matplotlib axes instance.
     :param name: map name.
     :param facecolor: fill color, default is none.
     :param edgecolor: edge color.
     :param lw: line width.
-    :return: None
+    :param simplify: simplify the geometries to the figure resolution.
+    :param kwargs: keywords passing to PathCollection, like zorder.
+    :return: `ChinaMapCollection` instance.
     """
 
     # map name
@@ -59,11 +263,10 @@ def add_china_map_2cartopy(ax, name='province', facecolor='none',
              'county': "BOUNT_poly", 'river': "hyd1_4l",
              'river_high': "hyd2_4l"}
 
-    # get shape filename
-    shpfile = pkg_resources.resource_filename(
-        'dk_met_graphics', "resources\\maps\\" + names[name] + ".shp")
-
-    # add map
-    ax.add_geometries(
-        Reader(shpfile).geometries(), ccrs.PlateCarree(),
-        facecolor=facecolor, edgecolor=edgecolor, lw=lw, **kwargs)
+    # add map, above patches and meshes like cartopy features
+    kwargs.setdefault('zorder', 1.5)
+    collection = ChinaMapCollection(
+        names[name], simplify=simplify, facecolor=facecolor,
+        edgecolor=edgecolor, lw=lw, transform=ax.transData, **kwargs)
+    ax.add_collection(collection, autolim=False)
+    return collection
@@ -7,44 +7,49 @@ Draw CLDAS analysis map.
 
 import numpy as np
 import datetime
+import pandas as pd
 import xarray as xr
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 from dk_met_graphics.cmap.ctables import cm_temperature_nws, cm_precipitation_nws
 from dk_met_graphics.plot.china_map import add_china_map_2cartopy
-from dk_met_graphics.plot.util import add_gridlines
+from dk_met_graphics.plot.raster import draw_raster
+from dk_met_graphics.plot.util import (
+    add_gridlines, new_figure, close_figure, encode_figure)
 
 
-def fig_cldas_temp(
-    indata, figsize=12, map_extent=(100, 125, 25, 45),
-    gridlines=False, outfile=None,
-    title="CLDAS Temperature", time=None):
-    """Produce CLDAS temperature map figure.
-    
-    Arguments:
-        indata {dictionary or xarray dataset} -- 
-            {'lon': 1D array, 'lat': 1D array, 'data': 2D array}
-    
-    Keyword Arguments:
-        figsize {tuple or int} -- figure size (default: {12})
-        map_extent {tuple} -- (lonmin, lonmax, latmin, latmax) (default: {(100, 125, 25, 45)})
-        gridlines {bool} -- bool, draw grid lines or not. (default: {False})
-        outfile {string} -- save figure to outfile (default: {None})
-        title {string} -- figure title.
-        time {datetime} -- analysis time.
-    """
+def _cldas_data(indata):
+    """Get the {'lon', 'lat', 'data'} dictionary of a CLDAS field."""
 
-    # check data type
     if isinstance(indata, xr.core.dataarray.DataArray):
-        data = {
+        return {
             'lon':indata.coords['lon'].values,
             'lat':indata.coords['lat'].values,
             'data':np.squeeze(indata.values)}
-    else:
-        data = indata
+    return indata
 
 
+def _cldas_figure(data, product, figsize, map_extent, gridlines, title,
+                  pyplot=True, raster=True):
+    """Build a CLDAS figure: map background, field mesh, titles and color bar.
+    
+    Arguments:
+        data {dictionary} -- {'lon': 1D array, 'lat': 1D array, 'data': 2D array}
+        product {string} -- 'temp' or 'rain01'.
+        figsize {tuple or int} -- figure size, None for the product default.
+        map_extent {tuple} -- (lonmin, lonmax, latmin, latmax)
+        gridlines {bool} -- draw grid lines or not.
+        title {string} -- figure title.
+        pyplot {bool} -- create the figure with pyplot, or as a
+            standalone figure with an Agg canvas.
+        raster {bool} -- draw the field as an RGBA raster warped to the
+            map, or as a pcolormesh.
+    
+    Returns:
+        tuple -- (fig, pm, time_title), the figure, the field image (or
+            QuadMesh) and the right title Text.
+    """
+
     # set data projection
     datacrs = ccrs.PlateCarree()
     plotcrs = ccrs.AlbersEqualArea(
@@ -53,14 +58,16 @@ def fig_cldas_temp(
         standard_parallels=[30., 60.])
     
     # set figure
-    if isinstance(figsize, int):
-        ratio = (map_extent[3]-map_extent[2])/(map_extent[1]-map_extent[0])
+    ratio = (map_extent[3]-map_extent[2])/(map_extent[1]-map_extent[0])
+    if figsize is None:
+        figsize = (16, 16 * 0.85 * ratio)
+    elif isinstance(figsize, int):
         figsize = (figsize, figsize * ratio * 0.8)
-    fig = plt.figure(figsize=figsize)
+    fig = new_figure(figsize=figsize, pyplot=pyplot)
     gs = mpl.gridspec.GridSpec(
         1, 2, width_ratios=[1, .02], bottom=.07, top=.99,
-        hspace=0.01, wspace=0.01)
-    ax = plt.subplot(gs[0], projection=plotcrs)
+        hspace=0.01, wspace=0.01, figure=fig)
+    ax = fig.add_subplot(gs[0], projection=plotcrs)
     
     # plot map background
     ax.set_extent(map_extent, crs=datacrs)
@@ -68,40 +75,100 @@ def fig_cldas_temp(
     add_china_map_2cartopy(ax, name='river', edgecolor='darkcyan', lw=1)
     
     # set color maps
-    pos = np.array([
+    if product == 'temp':
+        pos = np.array([
             -45, -30, -20, -10, -5, 0, 0, 5, 5, 10, 20, 20, 30, 30, 40, 45])
-    colormap = cm_temperature_nws(pos)
+        cmap_kwargs = {'cmap': cm_temperature_nws(pos),
+                       'vmin': pos.min(), 'vmax': pos.max()}
+        cb_kwargs = {'extendrect': 'True'}
+        label = 'Temperature'
+    else:
+        cmap, norm = cm_precipitation_nws(atime=1)
+        cmap_kwargs = {'cmap': cmap, 'norm': norm}
+        cb_kwargs = {}
+        label = 'Precipitation (mm)'
     
-    # draw CLDAS temperature
-    x, y = np.meshgrid(data['lon'], data['lat'])
-    pm = ax.pcolormesh(x, y, np.squeeze(data['data']), cmap=colormap,
-                       vmin=pos.min(), vmax=pos.max(), transform=datacrs)
+    # draw CLDAS field
+    if raster:
+        pm = draw_raster(ax, data['lon'], data['lat'], data['data'],
+                         transform=datacrs, **cmap_kwargs)
+    else:
+        pm = ax.pcolormesh(data['lon'], data['lat'],
+                           np.squeeze(data['data']),
+                           transform=datacrs, **cmap_kwargs)
     
     # add title
-    plt.title(title,loc='left', fontsize=18)
-    if time is not None:
-        plt.title(time.strftime("%Y-%m-%dT%H"), loc='right', fontsize=18)
+    ax.set_title(title, loc='left', fontsize=18)
+    time_title = ax.set_title('', loc='right', fontsize=18)
     
     # add grid lines
     if gridlines:
         add_gridlines(ax)
     
     # add color bar
-    cax = plt.subplot(gs[1])
-    cb = plt.colorbar(pm, cax=cax, orientation='vertical', extendrect='True')
-    cb.set_label('Temperature', size=12)
+    cax = fig.add_subplot(gs[1])
+    cb = fig.colorbar(pm, cax=cax, orientation='vertical', **cb_kwargs)
+    cb.set_label(label, size=12)
+    return fig, pm, time_title
+
+
+def fig_cldas_temp(
+    indata, figsize=12, map_extent=(100, 125, 25, 45),
+    gridlines=False, outfile=None,
+    title="CLDAS Temperature", time=None, pyplot=True, encode=None,
+    raster=True):
+    """Produce CLDAS temperature map figure.
+    
+    Arguments:
+        indata {dictionary or xarray dataset} -- 
+            {'lon': 1D array, 'lat': 1D array, 'data': 2D array}
+    
+    Keyword Arguments:
+        figsize {tuple or int} -- figure size (default: {12})
+        map_extent {tuple} -- (lonmin, lonmax, latmin, latmax) (default: {(100, 125, 25, 45)})
+        gridlines {bool} -- bool, draw grid lines or not. (default: {False})
+        outfile {string} -- save figure to outfile (default: {None})
+        title {string} -- figure title.
+        time {datetime} -- analysis time.
+        pyplot {bool} -- create the figure with pyplot (default: {True}),
+            False for a standalone figure with an Agg canvas, safe to
+            render in threads and returned to the caller.
+        encode {string or dict} -- return the figure encoded in memory,
+            'png', 'webp' or `util.figure_to_bytes` keywords like
+            {'format': 'png', 'compress_level': 1, 'quantize': 256}.
+        raster {bool} -- draw the field as an RGBA raster warped to the
+            map projection (default: {True}), False for a pcolormesh.
+    
+    Returns:
+        bytes or figure -- the encoded image if encode is given, else
+            the standalone figure if pyplot is False, else None.
+    """
+
+    fig, _, time_title = _cldas_figure(
+        _cldas_data(indata), 'temp', figsize, map_extent, gridlines, title,
+        pyplot=pyplot, raster=raster)
+    if time is not None:
+        time_title.set_text(time.strftime("%Y-%m-%dT%H"))
     
     # return
+    if encode is not None:
+        image = encode_figure(fig, encode)
+        if outfile is not None:
+            with open(outfile, 'wb') as f:
+                f.write(image)
+        close_figure(fig)
+        return image
     if outfile is not None:
         fig.savefig(outfile)
-        plt.close(fig)
-    return None
+        close_figure(fig)
+    return None if pyplot else fig
 
 
 def fig_cldas_rain01(
     indata, figsize=None, map_extent=(80, 125, 16, 54),
     gridlines=False, outfile=None,
-    title="CLDAS 1h Rainfall", time=None):
+    title="CLDAS 1h Rainfall", time=None, pyplot=True, encode=None,
+    raster=True):
     """Produce CLDAS temperature map figure.
     
     Arguments:
@@ -115,63 +182,138 @@ def fig_cldas_rain01(
         outfile {string} -- save figure to outfile (default: {None})
         title {string} -- figure title.
         time {datetime} -- analysis time.
+        pyplot {bool} -- create the figure with pyplot (default: {True}),
+            False for a standalone figure with an Agg canvas, safe to
+            render in threads and returned to the caller.
+        encode {string or dict} -- return the figure encoded in memory,
+            'png', 'webp' or `util.figure_to_bytes` keywords like
+            {'format': 'png', 'compress_level': 1, 'quantize': 256}.
+        raster {bool} -- draw the field as an RGBA raster warped to the
+            map projection (default: {True}), False for a pcolormesh.
+    
+    Returns:
+        bytes or figure -- the encoded image if encode is given, else
+            the standalone figure if pyplot is False, else None.
     """
 
-    # check data type
-    if isinstance(indata, xr.core.dataarray.DataArray):
-        data = {
-            'lon':indata.coords['lon'].values,
-            'lat':indata.coords['lat'].values,
-            'data':np.squeeze(indata.values)}
-    else:
-        data = indata
-
-
-    # set data projection
-    datacrs = ccrs.PlateCarree()
-    plotcrs = ccrs.AlbersEqualArea(
-        central_latitude=(map_extent[2]+map_extent[3])/2.0,
-        central_longitude=(map_extent[0]+map_extent[1])/2.0,
-        standard_parallels=[30., 60.])
-    
-    # set figure
-    fig_ratio = (map_extent[3]-map_extent[2])/(map_extent[1]-map_extent[0])
-    width = 16
-    height = width * 0.85 * fig_ratio
-    fig = plt.figure(figsize=(width, height))
-    gs = mpl.gridspec.GridSpec(
-        1, 2, width_ratios=[1, .02], bottom=.07, top=.99,
-        hspace=0.01, wspace=0.01)
-    ax = plt.subplot(gs[0], projection=plotcrs)
-    
-    # plot map background
-    ax.set_extent(map_extent, crs=datacrs)
-    add_china_map_2cartopy(ax, name='province', edgecolor='k', lw=1)
-    add_china_map_2cartopy(ax, name='river', edgecolor='darkcyan', lw=1)
-    
-    # draw CLDAS temperature
-    cmap, norm = cm_precipitation_nws(atime=1)
-    x, y = np.meshgrid(data['lon'], data['lat'])
-    pm = ax.pcolormesh(x, y, np.squeeze(data['data']),
-                       norm=norm, cmap=cmap, transform=datacrs)
-    
-    # add title
-    plt.title(title,loc='left', fontsize=18)
+    fig, _, time_title = _cldas_figure(
+        _cldas_data(indata), 'rain01', figsize, map_extent, gridlines, title,
+        pyplot=pyplot, raster=raster)
     if time is not None:
-        plt.title(time.strftime("%Y-%m-%dT%H"), loc='right', fontsize=18)
-    
-    # add grid lines
-    if gridlines:
-        add_gridlines(ax)
-    
-    # add color bar
-    cax = plt.subplot(gs[1])
-    cb = plt.colorbar(pm, cax=cax, orientation='vertical')
-    cb.set_label('Precipitation (mm)', size=12)
+        time_title.set_text(time.strftime("%Y-%m-%dT%H"))
     
     # return
+    if encode is not None:
+        image = encode_figure(fig, encode)
+        if outfile is not None:
+            with open(outfile, 'wb') as f:
+                f.write(image)
+        close_figure(fig)
+        return image
     if outfile is not None:
         fig.savefig(outfile)
-        plt.close(fig)
-    return None
+        close_figure(fig)
+    return None if pyplot else fig
+
+
+def fig_cldas_batch(
+    frames, outfile, product='temp', times=None, figsize=None,
+    map_extent=None, gridlines=False, title=None, encode=None, raster=True):
+    """Produce CLDAS map figures of many time steps on the same grid.
+    The figure, map background and color bar are built once, then
+    every time step only replaces the field values and the time title
+    before saving.
+    
+    Arguments:
+        frames {xarray dataarray or list} -- (time, lat, lon) data array
+            with 'lon', 'lat' (and 'time') coordinates, or a list of
+            {'lon': 1D array, 'lat': 1D array, 'data': 2D array}
+            dictionaries (later items may be bare 2D data arrays).
+        outfile {string or list} -- output file names, or a file name
+            pattern formatted with the time step index and time, like
+            "cldas_temp_{time:%Y%m%d%H}.png" or "frame_{index:04d}.png",
+            None to return encoded images only.
+    
+    Keyword Arguments:
+        product {string} -- 'temp' or 'rain01'. (default: {'temp'})
+        times {list} -- datetime of every time step, default is the
+            'time' coordinate of the data array.
+        figsize {tuple or int} -- figure size, default is the product default.
+        map_extent {tuple} -- (lonmin, lonmax, latmin, latmax), default
+            is the product default.
+        gridlines {bool} -- bool, draw grid lines or not. (default: {False})
+        title {string} -- figure title, default is the product title.
+        encode {string or dict} -- encode the frames in memory, see
+            `fig_cldas_temp`.
+        raster {bool} -- draw the fields as RGBA rasters, the pixel
+            to grid cell warp is computed once for all frames.
+            (default: {True})
+    
+    Returns:
+        list -- output file names, or encoded images if encode is given.
+
+    >>> outfiles = fig_cldas_batch(
+    >>>     temp, "cldas_temp_{time:%Y%m%d%H}.png", product='temp')
+    """
+
+    # product defaults
+    defaults = {
+        'temp': (12, (100, 125, 25, 45), "CLDAS Temperature"),
+        'rain01': (None, (80, 125, 16, 54), "CLDAS 1h Rainfall")}
+    if product not in defaults:
+        raise ValueError("Unknown CLDAS product '{}', should be one of {}."
+                         .format(product, sorted(defaults)))
+    if figsize is None:
+        figsize = defaults[product][0]
+    if map_extent is None:
+        map_extent = defaults[product][1]
+    if title is None:
+        title = defaults[product][2]
+
+    # time steps
+    if isinstance(frames, xr.core.dataarray.DataArray):
+        if times is None and 'time' in frames.coords:
+            times = pd.to_datetime(frames.coords['time'].values)
+        frames = [frames[i] for i in range(frames.shape[0])]
+    if times is None:
+        times = [None] * len(frames)
+    if outfile is None:
+        if encode is None:
+            raise ValueError("Give output files or an encode format.")
+        outfiles = [None] * len(frames)
+    elif isinstance(outfile, str):
+        outfiles = [outfile.format(index=i, time=time)
+                    for i, time in enumerate(times)]
+    else:
+        outfiles = list(outfile)
+    if not (len(frames) == len(times) == len(outfiles)):
+        raise ValueError("Frames, times and output files do not match.")
+    if len(frames) == 0:
+        return []
 
+    # build the figure once with the first time step
+    first = _cldas_data(frames[0])
+    fig, pm, time_title = _cldas_figure(
+        first, product, figsize, map_extent, gridlines, title, pyplot=False,
+        raster=raster)
+    images = []
+    try:
+        for frame, time, filename in zip(frames, times, outfiles):
+            if isinstance(frame, dict) or isinstance(
+                    frame, xr.core.dataarray.DataArray):
+                values = _cldas_data(frame)['data']
+            else:
+                values = frame
+            pm.set_array(np.squeeze(values))
+            time_title.set_text(
+                '' if time is None else time.strftime("%Y-%m-%dT%H"))
+            if encode is not None:
+                images.append(encode_figure(fig, encode))
+                if filename is not None:
+                    with open(filename, 'wb') as f:
+                        f.write(images[-1])
+            else:
+                fig.savefig(filename)
+    finally:
+        close_figure(fig)
+    return outfiles if encode is None else images
@@ -0,0 +1,242 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Generate and draw contours of gridded fields with cached paths.
+
+The isolines (or filled bands) of all levels are computed in one batch
+call of contourpy on the 1-D grid coordinates, without the meshgrid
+matplotlib builds, and the resulting level paths are cached in memory
+(and optionally on disk) by a hash of the field, coordinates and
+levels. The same paths are drawn and used to place the contour labels,
+and as cached paths are the same objects, cartopy's projected path
+cache also hits when a product is drawn again.
+"""
+
+import os
+import numpy as np
+import numpy.ma as ma
+import contourpy
+from matplotlib.contour import ContourSet
+from matplotlib.path import Path
+import cartopy.crs as ccrs
+from dk_met_graphics.cache import (
+    LRUCache, get_cache_dir, array_hash, atomic_save)
+
+
+# process-wide cache of contour level paths
+_CONTOUR_CACHE = LRUCache(maxsize=64, maxbytes=256 * 1024 ** 2)
+
+
+def contour_cache_stats():
+    """
+    Statistics of the in-memory contour path cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _CONTOUR_CACHE.stats()
+
+
+def clear_contour_cache():
+    """
+    Empty the in-memory contour path cache.
+    """
+    _CONTOUR_CACHE.clear()
+
+
+def _fill_levels(data, levels):
+    """
+    Filled contour band limits, including the field minimum in the
+    lowest band like matplotlib.
+    """
+    bounds = np.array(levels, dtype=np.float64)
+    if np.nanmin(data) == bounds[0]:
+        bounds[0] -= 1
+    return bounds
+
+
+def contour_arrays(lon, lat, data, levels, filled=False):
+    """
+    Compute the contour lines (or filled bands) of all levels in one
+    contourpy batch pass.
+
+    :param lon: 1-D grid longitudes (or 2-D for curvilinear grids).
+    :param lat: 1-D grid latitudes (or 2-D for curvilinear grids).
+    :param data: 2-D (lat, lon) field, NaN or masked values are
+                 left out.
+    :param levels: contour levels, increasing.
+    :param filled: compute the filled bands between adjacent levels.
+    :return: (vertices, codes, offsets), the (n, 2) vertices and path
+             codes of all levels concatenated, level i (band i between
+             levels i and i + 1 if filled) is vertices[offsets[i]:
+             offsets[i + 1]].
+    """
+    z = ma.masked_invalid(np.squeeze(data), copy=False)
+    generator = contourpy.contour_generator(
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64),
+        z, line_type=contourpy.LineType.ChunkCombinedCode,
+        fill_type=contourpy.FillType.ChunkCombinedCode, chunk_size=0)
+    if filled:
+        results = generator.multi_filled(_fill_levels(z, levels))
+    else:
+        results = generator.multi_lines(np.asarray(levels, dtype=np.float64))
+
+    vertices, codes, sizes = [], [], []
+    for points, kinds in results:
+        # a single chunk, None if the level has no contours
+        if points[0] is None:
+            sizes.append(0)
+            continue
+        vertices.append(points[0])
+        codes.append(kinds[0])
+        sizes.append(len(points[0]))
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    if not vertices:
+        return np.empty((0, 2)), np.empty(0, dtype=np.uint8), offsets
+    return np.concatenate(vertices), np.concatenate(codes), offsets
+
+
+def contour_cache_key(lon, lat, data, levels, filled=False):
+    """
+    Construct the contour cache key.
+
+    :param lon: grid longitudes.
+    :param lat: grid latitudes.
+    :param data: 2-D field.
+    :param levels: contour levels.
+    :param filled: filled bands or lines.
+    :return: hex digest string.
+    """
+    data = np.squeeze(data)
+    if ma.isMaskedArray(data):
+        data = ma.filled(data.astype(np.float64), np.nan)
+    return array_hash(
+        np.asarray([filled], dtype=np.uint8),
+        np.asarray(levels, dtype=np.float64),
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64),
+        data)
+
+
+def contour_paths(lon, lat, data, levels, filled=False, cache=False,
+                  cache_dir=None):
+    """
+    Get the contour paths of every level from the in-memory LRU cache
+    or the on-disk cache, computing and storing them on a miss. The
+    on-disk cache is keyed by the field, so it grows with every new
+    field: it is off by default, use it for fields drawn again by
+    later processes (like re-rendered products) and clean the
+    directory as the fields expire.
+
+    :param lon: 1-D grid longitudes (or 2-D for curvilinear grids).
+    :param lat: 1-D grid latitudes (or 2-D for curvilinear grids).
+    :param data: 2-D (lat, lon) field.
+    :param levels: contour levels, increasing.
+    :param filled: filled bands between adjacent levels, or lines.
+    :param cache: use the on-disk cache or not, the in-memory
+                  cache is always used.
+    :param cache_dir: on-disk cache directory, default is
+                      `dk_met_graphics.cache.get_cache_dir('contour')`.
+    :return: list of read-only `matplotlib.path.Path`, one per level
+             (per band if filled), shared by all the callers.
+    """
+
+    key = contour_cache_key(lon, lat, data, levels, filled=filled)
+
+    # in-memory cache
+    paths = _CONTOUR_CACHE.get(key)
+    if paths is not None:
+        return paths
+
+    # on-disk cache, or compute the contours
+    arrays = None
+    filename = None
+    if cache:
+        if cache_dir is None:
+            cache_dir = get_cache_dir('contour')
+        filename = os.path.join(cache_dir, key + '.npz')
+        if os.path.isfile(filename):
+            with np.load(filename) as f:
+                arrays = (f['vertices'], f['codes'], f['offsets'])
+    if arrays is None:
+        arrays = contour_arrays(lon, lat, data, levels, filled=filled)
+        if filename is not None:
+            atomic_save(filename, lambda f: np.savez(
+                f, vertices=arrays[0], codes=arrays[1], offsets=arrays[2]))
+
+    vertices, codes, offsets = arrays
+    paths = [Path(vertices[i0:i1], codes[i0:i1], readonly=True)
+             for i0, i1 in zip(offsets[:-1], offsets[1:])]
+    _CONTOUR_CACHE.put(key, paths, nbytes=vertices.nbytes + codes.nbytes)
+    return paths
+
+
+class PathContourSet(ContourSet):
+    """
+    Contour set of precomputed level paths, see `draw_contour`.
+    Labels are placed on the same paths, projected to the map first
+    like `cartopy.mpl.contour.GeoContourSet`.
+    """
+
+    def clabel(self, *args, **kwargs):
+        data_t = self.axes.transData
+        col_to_data = self.get_transform() - data_t
+        self.set_paths([col_to_data.transform_path(path)
+                        for path in self.get_paths()])
+        self.set_transform(data_t)
+        return super(PathContourSet, self).clabel(*args, **kwargs)
+
+
+def draw_contour(ax, lon, lat, data, levels, filled=False, transform=None,
+                 cache=False, **kwargs):
+    """
+    Draw contour lines or filled contours of a gridded field from the
+    cached level paths of `contour_paths`, the cached alternative to
+    `ax.contour` and `ax.contourf` (without the extend keyword).
+
+    :param ax: matplotlib axes, or cartopy GeoAxes instance.
+    :param lon: 1-D grid longitudes (or 2-D for curvilinear grids).
+    :param lat: 1-D grid latitudes (or 2-D for curvilinear grids).
+    :param data: 2-D (lat, lon) field.
+    :param levels: contour levels, increasing.
+    :param filled: draw filled contours or lines.
+    :param transform: data coordinate system, default is PlateCarree
+                      on cartopy GeoAxes.
+    :param cache: keep the paths in the on-disk cache, off by default,
+                  see `contour_paths`.
+    :param kwargs: keywords passing to `matplotlib.contour.ContourSet`,
+                   like colors, cmap, linewidths or zorder.
+    :return: `PathContourSet`, use it with clabel and colorbar.
+
+    >>> cs = draw_contour(ax, lon, lat, gh500, np.arange(480, 600, 4),
+    >>>                   colors='purple', linewidths=2, zorder=30)
+    >>> ax.clabel(cs, inline=1, fontsize=16, fmt='%.0f')
+    """
+
+    levels = np.asarray(levels, dtype=np.float64)
+    if transform is None and hasattr(ax, 'projection'):
+        transform = ccrs.PlateCarree()
+    paths = contour_paths(lon, lat, data, levels, filled=filled, cache=cache)
+    if not any(len(path.vertices) for path in paths):
+        # nothing to draw, let matplotlib make the empty contour set
+        if transform is not None:
+            kwargs['transform'] = transform
+        return (ax.contourf if filled else ax.contour)(
+            lon, lat, np.squeeze(data), levels, **kwargs)
+
+    if transform is not None:
+        kwargs['transform'] = transform
+    allsegs = [[path.vertices] for path in paths]
+    allkinds = [[path.codes] for path in paths]
+    cs = PathContourSet(ax, levels, allsegs, allkinds, filled=filled,
+                        **kwargs)
+    # use the shared cached paths, ContourSet builds new ones
+    cs.set_paths(list(paths))
+
+    # data limits in map coordinates, like cartopy
+    if hasattr(ax, 'projection'):
+        datalim = cs.get_datalim(ax.transData)
+        ax.update_datalim(datalim)
+        cs.sticky_edges.x[:] = datalim.xmin, datalim.xmax
+        cs.sticky_edges.y[:] = datalim.ymin, datalim.ymax
+        ax.autoscale_view()
+    return cs
+
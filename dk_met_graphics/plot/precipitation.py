@@ -5,17 +5,21 @@
 Draw rain analysis map.
 """
 
+import functools
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 from dk_met_graphics.cmap.ctables import cm_precipitation_nws
 from dk_met_graphics.plot.china_map import add_china_map_2cartopy
-from dk_met_graphics.plot.util import add_gridlines
+from dk_met_graphics.plot.raster import draw_raster
+from dk_met_graphics.plot.background import add_static_layers
+from dk_met_graphics.plot.util import add_gridlines, grid_coords
 
 
 def draw_precipitation_nws(ax, prep, map_extent=(73, 136, 17, 54),
-                           gridlines=True):
+                           gridlines=True, raster=True,
+                           cache_background=False):
     """
     Draw NWS-style precipitation map.
     http://jjhelmus.github.io/blog/2013/09/17/plotting-nsw-precipitation-data/
@@ -26,6 +30,12 @@ def draw_precipitation_nws(ax, prep, map_extent=(73, 136, 17, 54),
     :param map_extent: (lonmin, lonmax, latmin, latmax),
                        longitude and latitude range.
     :param gridlines: bool, draw grid lines or not.
+    :param raster: bool, draw the precipitation as an RGBA raster warped
+                   to the map projection, or as a pcolormesh.
+    :param cache_background: draw the province, river and grid line
+                             layers as cached images in raster outputs,
+                             for figures drawn many times, see
+                             `background.add_static_layers`.
     :return: plots dictionary.
 
     :Example:
@@ -49,26 +59,53 @@ def draw_precipitation_nws(ax, prep, map_extent=(73, 136, 17, 54),
 
     # plot map background
     ax.set_extent(map_extent, crs=datacrs)
-    add_china_map_2cartopy(ax, name='province', edgecolor='k', lw=1)
-    add_china_map_2cartopy(ax, name='river', edgecolor='blue', lw=1)
+    layers = [
+        functools.partial(add_china_map_2cartopy, name='province',
+                          edgecolor='k', lw=1),
+        functools.partial(add_china_map_2cartopy, name='river',
+                          edgecolor='blue', lw=1)]
+    if gridlines:
+        layers.append(add_gridlines)
+    if cache_background:
+        add_static_layers(ax, layers)
+    else:
+        for layer in layers:
+            layer(ax)
 
     # plots container
     plots = {}
 
     # draw precipitation map
-    x, y = np.meshgrid(prep['lon'], prep['lat'])
     cmap, norm = cm_precipitation_nws()
-    plots['prep'] = ax.pcolormesh(x, y, np.squeeze(prep['data']), norm=norm,
-                                  cmap=cmap, transform=datacrs)
-
-    # add grid lines
-    if gridlines:
-        add_gridlines(ax)
+    if raster:
+        plots['prep'] = draw_raster(ax, prep['lon'], prep['lat'],
+                                    prep['data'], cmap=cmap, norm=norm,
+                                    transform=datacrs)
+    else:
+        plots['prep'] = ax.pcolormesh(
+            prep['lon'], prep['lat'], np.squeeze(prep['data']),
+            norm=norm, cmap=cmap, transform=datacrs)
 
     # return
     return plots
 
 
+def update_precipitation_nws(plots, prep):
+    """
+    Replace the precipitation drawn by `draw_precipitation_nws` with
+    the next time step on the same grid, like for animation frames.
+
+    :param plots: plots dictionary returned by `draw_precipitation_nws`.
+    :param prep: precipitation, {'lon': 1D array, 'lat': 1D array,
+                 'data': 2D array} dictionary or the 2D data array.
+    :return: plots dictionary.
+    """
+    if isinstance(prep, dict):
+        prep = prep['data']
+    plots['prep'].set_array(np.squeeze(prep))
+    return plots
+
+
 def draw_qpf_nmc(ax, prep, stations=None, map_extent=(107., 123, 28, 43.)):
     """
     Draw filled-contour QPF.
@@ -97,7 +134,7 @@ def draw_qpf_nmc(ax, prep, stations=None, map_extent=(107., 123, 28, 43.)):
     plots = {}
 
     # draw precipitation map
-    x, y = np.meshgrid(prep['lon'], prep['lat'])
+    x, y = grid_coords(prep['lon'], prep['lat'])
     if prep.get('clevs') is None:
         clevs = [0.1, 10, 25, 50, 100, 250, 600]
     cmap = plt.get_cmap("YlGnBu")
@@ -0,0 +1,332 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Draw gridded fields as RGBA rasters.
+
+Instead of a pcolormesh QuadMesh with one quad per grid cell, the
+field is colored with a NumPy color lookup table (see
+`cmap.cm.colormap_lut`) and warped to a raster of the axes pixels in
+the map projection when it is drawn, as an image. Fields on
+curvilinear (2-D coordinate) grids fall back to pcolormesh.
+
+The warp (the grid cell under every raster pixel) only depends on the
+grid, the map projection, the extent and the raster size, so it is
+cached in memory and on disk: warping a new field is a single gather.
+"""
+
+import os
+import numpy as np
+import matplotlib as mpl
+from matplotlib.image import AxesImage
+import cartopy.crs as ccrs
+from dk_met_graphics.cache import (
+    LRUCache, get_cache_dir, array_hash, crs_key, atomic_save)
+from dk_met_graphics.cmap.cm import colormap_lut, apply_lut
+from dk_met_graphics.plot.tiles import nearest_index
+
+
+# process-wide cache of warp indices
+_WARP_CACHE = LRUCache(maxsize=32, maxbytes=256 * 1024 ** 2)
+
+
+def warp_cache_stats():
+    """
+    Statistics of the in-memory warp index cache.
+
+    :return: dictionary with hits, misses, entries and nbytes.
+    """
+    return _WARP_CACHE.stats()
+
+
+def clear_warp_cache():
+    """
+    Empty the in-memory warp index cache.
+    """
+    _WARP_CACHE.clear()
+
+
+def _axes_pixels(ax, oversample=1.):
+    """
+    Get the raster size matching the axes at the current figure
+    resolution, which is the savefig resolution while saving.
+
+    :param ax: matplotlib axes instance.
+    :param oversample: raster pixels per output pixel.
+    :return: (width, height) in pixels.
+    """
+    bbox = ax.bbox
+    return (max(int(np.ceil(bbox.width * oversample)), 1),
+            max(int(np.ceil(bbox.height * oversample)), 1))
+
+
+def warp_indices(lon, lat, projection, extent, shape, transform=None):
+    """
+    Find the grid cell under every pixel center of a raster covering
+    an extent in a map projection.
+
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the raster.
+    :param extent: (x0, x1, y0, y1) raster extent in projection
+                   coordinates.
+    :param shape: (height, width) of the raster.
+    :param transform: `cartopy.crs.PlateCarree` of the grid
+                      coordinates, may have a central longitude;
+                      default is PlateCarree().
+    :return: (height, width) int64 array of flat grid indices (row-major
+             on (lat, lon)), -1 outside the grid; raster row 0 is at y0.
+    """
+    if transform is None:
+        transform = ccrs.PlateCarree()
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    height, width = shape
+    x = extent[0] + (np.arange(width) + 0.5) / width * (extent[1] - extent[0])
+    y = extent[2] + (np.arange(height) + 0.5) / height * (
+        extent[3] - extent[2])
+    xx, yy = np.meshgrid(x, y)
+    points = transform.transform_points(projection, xx, yy)
+    plon, plat = points[..., 0], points[..., 1]
+    if lon.max() > 180.:
+        plon = np.where(plon < lon.min(), plon + 360., plon)
+
+    # search increasing coordinates, then index the original order
+    if lon[0] > lon[-1]:
+        cols = nearest_index(lon[::-1], plon)
+        cols[cols >= 0] = lon.size - 1 - cols[cols >= 0]
+    else:
+        cols = nearest_index(lon, plon)
+    if lat[0] > lat[-1]:
+        rows = nearest_index(lat[::-1], plat)
+        rows[rows >= 0] = lat.size - 1 - rows[rows >= 0]
+    else:
+        rows = nearest_index(lat, plat)
+    inside = (cols >= 0) & (rows >= 0)
+    return np.where(inside, rows * lon.size + cols, -1)
+
+
+def warp_cache_key(lon, lat, projection, extent, shape, transform=None):
+    """
+    Construct the warp cache key.
+
+    :param lon: 1-D grid longitudes.
+    :param lat: 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the raster.
+    :param extent: (x0, x1, y0, y1) raster extent.
+    :param shape: (height, width) of the raster.
+    :param transform: coordinate system of the grid, default is
+                      PlateCarree().
+    :return: hex digest string.
+    """
+    if transform is None:
+        transform = ccrs.PlateCarree()
+    target = repr((crs_key(projection), crs_key(transform),
+                   tuple(np.round(np.asarray(extent, dtype=np.float64), 6)),
+                   tuple(int(n) for n in shape)))
+    return array_hash(
+        np.frombuffer(target.encode(), dtype=np.uint8),
+        np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+
+
+def cached_warp_indices(lon, lat, projection, extent, shape,
+                        transform=None, cache=True, cache_dir=None):
+    """
+    Get the warp indices of `warp_indices` from the in-memory LRU
+    cache or the on-disk cache, computing and storing them on a miss.
+
+    :param lon: monotonic 1-D grid longitudes.
+    :param lat: monotonic 1-D grid latitudes.
+    :param projection: `cartopy.crs.Projection` of the raster.
+    :param extent: (x0, x1, y0, y1) raster extent in projection
+                   coordinates.
+    :param shape: (height, width) of the raster.
+    :param transform: coordinate system of the grid, see
+                      `warp_indices`.
+    :param cache: use the on-disk cache or not, the in-memory
+                  cache is always used.
+    :param cache_dir: on-disk cache directory, default is
+                      `dk_met_graphics.cache.get_cache_dir('warp')`.
+    :return: (height, width) array of flat grid indices, -1 outside
+             the grid.
+    """
+
+    key = warp_cache_key(lon, lat, projection, extent, shape,
+                         transform=transform)
+
+    # in-memory cache
+    index = _WARP_CACHE.get(key)
+    if index is not None:
+        return index
+
+    # on-disk cache
+    filename = None
+    if cache:
+        if cache_dir is None:
+            cache_dir = get_cache_dir('warp')
+        filename = os.path.join(cache_dir, key + '.npy')
+        if os.path.isfile(filename):
+            index = np.load(filename)
+            _WARP_CACHE.put(key, index)
+            return index
+
+    # compute the warp, int32 halves the gather index size
+    index = warp_indices(lon, lat, projection, extent, shape,
+                         transform=transform)
+    if np.size(lon) * np.size(lat) < 2 ** 31:
+        index = index.astype(np.int32)
+    _WARP_CACHE.put(key, index)
+    if filename is not None:
+        atomic_save(filename, lambda f: np.save(f, index))
+    return index
+
+
+class RasterField(AxesImage):
+    """
+    Image of a gridded field warped to the axes projection. The warp
+    is taken from the warp index cache (see `cached_warp_indices`)
+    for the extent and pixel size of the axes when the image is drawn,
+    so the raster follows later `set_extent` calls and savefig
+    resolutions. The color map and normalization are kept for color
+    bars, and `set_array` accepts a new field on the same grid, so
+    the raster can replace a pcolormesh QuadMesh in batch rendering.
+    """
+
+    def __init__(self, ax, lon, lat, lut, transform=None, oversample=1.,
+                 cache=True, **kwargs):
+        """
+        :param ax: cartopy GeoAxes instance.
+        :param lon: monotonic 1-D grid longitudes.
+        :param lat: monotonic 1-D grid latitudes.
+        :param lut: (edges, table) of `cmap.cm.colormap_lut`.
+        :param transform: coordinate system of the grid, see
+                          `warp_indices`.
+        :param oversample: raster pixels per output pixel.
+        :param cache: keep the warp indices in the on-disk cache.
+        :param kwargs: keywords passing to `AxesImage`.
+        """
+        super(RasterField, self).__init__(ax, **kwargs)
+        self.lon = lon
+        self.lat = lat
+        self.grid_shape = (np.size(lat), np.size(lon))
+        self.lut = lut
+        self.grid_transform = transform
+        self.oversample = oversample
+        self.cache = cache
+        self.field = None
+        self._lut_index = None
+        self._warp = None
+        # packed 32-bit colors, with an extra transparent entry for
+        # pixels outside the grid
+        self._colors = np.vstack([lut[1], [0, 0, 0, 0]]).astype(
+            np.uint8).view(np.uint32).ravel()
+
+    def set_array(self, A):
+        """
+        Set a new field on the grid, colored when drawn, or the image
+        data.
+
+        :param A: (nlat, nlon) field on the grid, or image data.
+        """
+        if np.ndim(A) == 2 and np.shape(A) == self.grid_shape:
+            self.field = A
+            indices = apply_lut(A, self.lut, index=True).ravel()
+            self._lut_index = np.append(indices, self._colors.size - 1)
+            self._warp = None
+            self.stale = True
+        else:
+            self.set_data(A)
+
+    def get_extent(self):
+        """
+        Get the extent of the raster, the map extent until drawn.
+        """
+        if self._warp is not None:
+            return self._warp[0]
+        return tuple(self.axes.get_extent())
+
+    def _update_raster(self):
+        """
+        Warp the field to the current extent and pixel size of the
+        axes, unless it already is.
+        """
+        ax = self.axes
+        width, height = _axes_pixels(ax, self.oversample)
+        extent = tuple(ax.get_extent())
+        warp = (extent, (height, width))
+        if self._lut_index is None or warp == self._warp:
+            return
+        index = cached_warp_indices(
+            self.lon, self.lat, ax.projection, extent, (height, width),
+            transform=self.grid_transform, cache=self.cache)
+        self.set_data(self._colors[self._lut_index[index]].view(
+            np.uint8).reshape(index.shape + (4,)))
+        self._warp = warp
+
+    def draw(self, renderer, *args, **kwargs):
+        if self.get_visible():
+            self._update_raster()
+        super(RasterField, self).draw(renderer, *args, **kwargs)
+
+
+def draw_raster(ax, lon, lat, data, cmap=None, norm=None, vmin=None,
+                vmax=None, mask_below=None, oversample=1., transform=None,
+                cache=True, **kwargs):
+    """
+    Draw a gridded field on a cartopy map as an RGBA raster, the fast
+    alternative to pcolormesh for regular longitude and latitude grids.
+    The field is warped to the extent and resolution of the map when
+    it is drawn, so the extent may be set before or after calling.
+    Fields with 2-D coordinates, or in other coordinate systems than
+    PlateCarree, fall back to pcolormesh.
+
+    :param ax: cartopy GeoAxes instance.
+    :param lon: 1-D grid longitudes (or 2-D for curvilinear grids).
+    :param lat: 1-D grid latitudes (or 2-D for curvilinear grids).
+    :param data: 2-D (lat, lon) field, NaN or masked values are
+                 drawn with the color map bad color.
+    :param cmap: matplotlib color map.
+    :param norm: matplotlib normalization, or use vmin and vmax.
+    :param vmin: minimum value, if norm is None.
+    :param vmax: maximum value, if norm is None.
+    :param mask_below: values below this are transparent.
+    :param oversample: raster pixels per output pixel.
+    :param transform: data coordinate system, default is PlateCarree,
+                      a central longitude is allowed.
+    :param cache: keep the warp indices in the on-disk cache, see
+                  `cached_warp_indices`.
+    :param kwargs: keywords passing to the image (or pcolormesh), like
+                   zorder or alpha.
+    :return: `RasterField` image, or QuadMesh for curvilinear grids.
+
+    >>> cmap, norm = cm_precipitation_nws(atime=1)
+    >>> im = draw_raster(ax, lon, lat, rain, cmap=cmap, norm=norm)
+    >>> cb = fig.colorbar(im, cax=cax)
+    """
+
+    if cmap is None:
+        cmap = mpl.rcParams['image.cmap']
+    if isinstance(cmap, str):
+        cmap = mpl.colormaps[cmap]
+    if norm is None:
+        if vmin is None or vmax is None:
+            vmin = np.nanmin(data) if vmin is None else vmin
+            vmax = np.nanmax(data) if vmax is None else vmax
+        norm = mpl.colors.Normalize(vmin=vmin, vmax=vmax)
+    if transform is None:
+        transform = ccrs.PlateCarree()
+
+    # curvilinear grids
+    if np.ndim(lon) != 1 or np.ndim(lat) != 1 or not isinstance(
+            transform, ccrs.PlateCarree):
+        return ax.pcolormesh(lon, lat, np.squeeze(data), cmap=cmap,
+                             norm=norm, transform=transform, **kwargs)
+
+    # color the field, it is warped to the axes pixels when drawn
+    lut = colormap_lut(cmap, norm=norm, mask_below=mask_below)
+    kwargs.setdefault('interpolation', 'nearest')
+    im = RasterField(ax, lon, lat, lut, transform=transform,
+                     oversample=oversample, cache=cache, cmap=cmap,
+                     norm=norm, origin='lower', **kwargs)
+    im.set_array(np.squeeze(data))
+    ax.add_image(im)
+    return im
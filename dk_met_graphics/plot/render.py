@@ -0,0 +1,495 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Render plot jobs in a pool of worker processes.
+
+A job is a JSON-compatible dictionary:
+
+    {'function': 'fig_cldas_temp',            # or 'module.function'
+     'data': {'indata': '/data/cldas_tem.nc:TEM'},
+     'kwargs': {'title': 'CLDAS Temperature'},
+     'outfile': '/output/cldas_tem.png',
+     'figure': {'figsize': [12, 9],             # for functions drawing
+                'projection': 'PlateCarree'},   # on an axes, optional
+     'id': 'cldas_tem'}                         # optional
+
+'data' maps function arguments to data references: a file name
+(.npy, .npz or .nc, 'file.nc:variable' selects a variable), a
+dictionary of references, or a value passed as is. Functions whose
+first argument is `ax` get a new figure and cartopy axes, and the
+figure is saved to 'outfile' after drawing; the other functions get
+'outfile' as keyword argument. Figures are standalone (not managed by
+pyplot), see `util.new_figure`. Times in JSON job files are given as
+ISO-8601 strings, see `load_jobs`.
+
+Large arrays given inline are handed to the workers through shared
+memory (see `share_jobs`), and .npy files are memory-mapped, so the
+workers get zero-copy views instead of pickled copies.
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import importlib
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+
+# modules searched for job functions given without module
+PLOT_MODULES = ['dk_met_graphics.plot.cldas',
+                'dk_met_graphics.plot.precipitation',
+                'dk_met_graphics.plot.synoptic']
+
+# inline arrays at least this large (bytes) go through shared memory
+SHARE_MIN_BYTES = 1024 ** 2
+
+# shared memory blocks attached by this process, {name: SharedMemory}
+_attached_blocks = {}
+
+# boundary layers loaded by the workers before the first job
+WARM_LAYERS = ['bou1_4p', 'bou2_4p', 'hyd1_4l', 'hyd1_4p']
+
+# job keywords decoded from ISO-8601 strings in JSON job files
+TIME_KEYS = ['time', 'times', 'initial_time']
+
+
+def resolve_function(name):
+    """
+    Find a plot function by name.
+
+    :param name: function name like 'fig_cldas_temp', searched in
+                 `PLOT_MODULES`, or a full name like
+                 'dk_met_graphics.plot.cldas.fig_cldas_temp'.
+    :return: function.
+    """
+
+    if '.' in name:
+        module, func = name.rsplit('.', 1)
+        return getattr(importlib.import_module(module), func)
+    for module in PLOT_MODULES:
+        module = importlib.import_module(module)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise ValueError("Plot function '{}' not found in {}.".format(
+        name, PLOT_MODULES))
+
+
+def _share_array(array, blocks):
+    """
+    Copy an array into a shared memory block.
+
+    :param array: numpy array.
+    :param blocks: dictionary of the blocks already created,
+                   {id(array): (SharedMemory, reference, array)}.
+    :return: reference dictionary {'shm': name, 'shape', 'dtype'}.
+    """
+    if id(array) not in blocks:
+        block = shared_memory.SharedMemory(
+            create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        # keep the array alive so its id is not reused
+        blocks[id(array)] = (block, {
+            'shm': block.name, 'shape': list(array.shape),
+            'dtype': array.dtype.str}, array)
+    return blocks[id(array)][1]
+
+
+def _share_value(value, blocks, min_bytes):
+    """
+    Replace the large arrays of a data value by shared memory
+    references, recursively.
+
+    :param value: data value.
+    :param blocks: dictionary of the blocks already created.
+    :param min_bytes: smaller arrays are left inline.
+    :return: value with references.
+    """
+
+    import xarray as xr
+    if isinstance(value, dict):
+        return {key: _share_value(v, blocks, min_bytes)
+                for key, v in value.items()}
+    if isinstance(value, list):
+        return [_share_value(v, blocks, min_bytes) for v in value]
+    if isinstance(value, xr.DataArray):
+        if value.nbytes < min_bytes:
+            return value
+        return {'dataarray': {
+            'data': _share_value(value.values, blocks, 0),
+            'dims': list(value.dims),
+            'coords': {name: [list(coord.dims), coord.values]
+                       for name, coord in value.coords.items()},
+            'name': value.name}}
+    if isinstance(value, np.ndarray) and not isinstance(
+            value, np.ma.MaskedArray) and value.nbytes >= min_bytes:
+        return _share_array(value, blocks)
+    return value
+
+
+def share_jobs(jobs, min_bytes=SHARE_MIN_BYTES):
+    """
+    Move the large inline arrays (and xarray data arrays) of job data
+    into shared memory blocks, an array used by several jobs (like
+    longitudes and latitudes) is shared once. Release the blocks with
+    `release_blocks` once the jobs are done.
+
+    :param jobs: list of job dictionaries.
+    :param min_bytes: smaller arrays are left inline.
+    :return: (jobs, blocks), the jobs with shared memory references
+             and the list of created `SharedMemory` blocks.
+    """
+    blocks = {}
+    shared = []
+    for job in jobs:
+        job = dict(job)
+        if 'data' in job:
+            job['data'] = _share_value(job['data'], blocks, min_bytes)
+        shared.append(job)
+    return shared, [value[0] for value in blocks.values()]
+
+
+def release_blocks(blocks):
+    """
+    Close and remove shared memory blocks created by `share_jobs`.
+
+    :param blocks: list of `SharedMemory` blocks.
+    :return: None.
+    """
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_array(ref):
+    """
+    Get a read-only view of a shared memory array.
+
+    :param ref: reference dictionary {'shm': name, 'shape', 'dtype'}.
+    :return: numpy array backed by the shared memory block.
+    """
+    name = ref['shm']
+    if name not in _attached_blocks:
+        # pool workers share the resource tracker of the process
+        # creating the block, which unlinks it in `release_blocks`
+        _attached_blocks[name] = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(tuple(ref['shape']), dtype=np.dtype(ref['dtype']),
+                       buffer=_attached_blocks[name].buf)
+    array.flags.writeable = False
+    return array
+
+
+def _detach_blocks():
+    """
+    Close the shared memory blocks attached by this process, views
+    of them must not be used any more.
+    """
+    for name in list(_attached_blocks):
+        try:
+            _attached_blocks[name].close()
+        except BufferError:
+            # still referenced, keep it for the next job
+            continue
+        del _attached_blocks[name]
+
+
+def load_data(ref):
+    """
+    Load a job data reference.
+
+    :param ref: file name (.npy, .npz or .nc, 'file.nc:variable'
+                selects a variable), shared memory reference (see
+                `share_jobs`), dictionary or list of references,
+                or any other value returned as is.
+    :return: loaded data.
+    """
+
+    if isinstance(ref, dict) and set(ref) == {'shm', 'shape', 'dtype'}:
+        return _attach_array(ref)
+    if isinstance(ref, dict) and set(ref) == {'dataarray'}:
+        import xarray as xr
+        spec = ref['dataarray']
+        return xr.DataArray(
+            load_data(spec['data']), dims=spec['dims'],
+            coords={name: (dims, values) for name, (dims, values)
+                    in spec['coords'].items()}, name=spec['name'])
+    if isinstance(ref, dict):
+        return {key: load_data(value) for key, value in ref.items()}
+    if isinstance(ref, list):
+        return [load_data(value) for value in ref]
+    if not isinstance(ref, str):
+        return ref
+
+    filename, _, variable = ref.partition('.nc:')
+    if variable:
+        import xarray as xr
+        return xr.open_dataset(filename + '.nc')[variable].load()
+    ext = os.path.splitext(ref)[1].lower()
+    if ext == '.npy':
+        return np.load(ref, mmap_mode='r')
+    if ext == '.npz':
+        with np.load(ref) as f:
+            return {key: f[key] for key in f.files}
+    if ext in ('.nc', '.nc4'):
+        import xarray as xr
+        return xr.open_dataarray(ref).load()
+    return ref
+
+
+def _make_projection(projection):
+    """
+    Build a cartopy projection of a job figure.
+
+    :param projection: projection name like 'PlateCarree', or a
+                       dictionary {'name': 'AlbersEqualArea', **kwargs}.
+    :return: `cartopy.crs.Projection`.
+    """
+    import cartopy.crs as ccrs
+    if isinstance(projection, str):
+        return getattr(ccrs, projection)()
+    kwargs = dict(projection)
+    return getattr(ccrs, kwargs.pop('name'))(**kwargs)
+
+
+def warm_caches(layers=None):
+    """
+    Import the plotting libraries and load the boundary layers and
+    color maps, so the first job of a worker does not pay for them.
+    The matplotlib backend is left as it is, jobs draw on standalone
+    Agg figures (see `util.new_figure`).
+
+    :param layers: boundary layers to load, default is `WARM_LAYERS`.
+    :return: None.
+    """
+
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import cartopy.crs  # noqa: F401
+    from dk_met_graphics.resources.boundary import (
+        load_boundary, LOD_TOLERANCES)
+    from dk_met_graphics.cmap.ctables import (
+        cm_precipitation_nws, cm_temperature_nws)
+    from dk_met_graphics.cmap.cm import guide_cmaps
+
+    for name in (WARM_LAYERS if layers is None else layers):
+        try:
+            for level in range(len(LOD_TOLERANCES)):
+                load_boundary(name, level=level)
+        except IOError:
+            continue
+    cm_precipitation_nws()
+    cm_temperature_nws()
+    guide_cmaps(26)
+    for module in PLOT_MODULES:
+        importlib.import_module(module)
+
+
+def run_job(job):
+    """
+    Run one plot job in the current process.
+
+    :param job: job dictionary, see the module documentation.
+    :return: result dictionary with the job 'id', 'outfile', 'ok',
+             'error' (traceback text), 'load_seconds', 'render_seconds',
+             'seconds' and worker 'pid'.
+    """
+
+    from dk_met_graphics.plot.util import new_figure
+
+    data = kwargs = None
+    result = {'id': job.get('id', job.get('outfile')),
+              'outfile': job.get('outfile'), 'ok': False, 'error': None,
+              'load_seconds': 0., 'render_seconds': 0., 'seconds': 0.,
+              'pid': os.getpid()}
+    start = time.perf_counter()
+    try:
+        func = resolve_function(job['function'])
+        data = load_data(job.get('data', {}))
+        kwargs = dict(job.get('kwargs', {}))
+        kwargs.update(data)
+        loaded = time.perf_counter()
+        result['load_seconds'] = loaded - start
+
+        params = list(inspect.signature(func).parameters)
+        if params and params[0] == 'ax':
+            # draw on a new standalone figure and save it
+            figure = dict(job.get('figure', {}))
+            projection = _make_projection(
+                figure.pop('projection', 'PlateCarree'))
+            fig = new_figure(pyplot=False, **figure)
+            ax = fig.add_subplot(1, 1, 1, projection=projection)
+            func(ax, **kwargs)
+            fig.savefig(job['outfile'])
+        else:
+            if 'pyplot' in params:
+                kwargs.setdefault('pyplot', False)
+            func(outfile=job['outfile'], **kwargs)
+        result['render_seconds'] = time.perf_counter() - loaded
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    data = kwargs = None
+    _detach_blocks()
+    return result
+
+
+def _init_worker(layers, warm=True):
+    """
+    Worker initializer, select the non-interactive Agg backend for the
+    jobs drawing with pyplot and warm the caches, see `warm_caches`.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    if warm:
+        warm_caches(layers)
+
+
+def render_jobs(jobs, processes=None, warm=True, layers=None,
+                start_method=None, callback=None, shared=True):
+    """
+    Render plot jobs in a pool of worker processes. Workers import
+    matplotlib and cartopy and warm the boundary and color map caches
+    once; failed jobs are reported, they do not stop the others.
+    Large inline arrays reach the workers through shared memory.
+
+    :param jobs: list of job dictionaries, see the module documentation.
+    :param processes: number of worker processes, default is the
+                      number of CPUs; 0 runs the jobs in this process.
+    :param warm: warm the worker caches before the first job.
+    :param layers: boundary layers to warm, default is `WARM_LAYERS`.
+    :param start_method: multiprocessing start method, like 'spawn',
+                         default is the platform default.
+    :param callback: function called with every result as it arrives.
+    :param shared: hand the large inline arrays to the workers through
+                   shared memory instead of pickling them.
+    :return: list of result dictionaries in job order, see `run_job`.
+
+    >>> jobs = [{'function': 'fig_cldas_temp',
+    >>>          'data': {'indata': f}, 'kwargs': {'time': t},
+    >>>          'outfile': f.replace('.nc', '.png')}
+    >>>         for f, t in zip(files, times)]
+    >>> results = render_jobs(jobs, processes=8)
+    >>> print(render_report(results))
+    """
+
+    jobs = list(jobs)
+    if processes == 0:
+        if warm:
+            warm_caches(layers)
+        results = []
+        for job in jobs:
+            results.append(run_job(job))
+            if callback is not None:
+                callback(results[-1])
+        return results
+
+    blocks = []
+    if shared:
+        jobs, blocks = share_jobs(jobs)
+    context = multiprocessing.get_context(start_method)
+    pool = context.Pool(
+        processes=processes, initializer=_init_worker,
+        initargs=(layers, warm))
+    try:
+        results = []
+        for result in pool.imap(run_job, jobs):
+            results.append(result)
+            if callback is not None:
+                callback(result)
+    finally:
+        pool.close()
+        pool.join()
+        release_blocks(blocks)
+    return results
+
+
+def render_report(results):
+    """
+    Tabulate job results.
+
+    :param results: result dictionaries of `render_jobs`.
+    :return: pandas data frame indexed by job id.
+    """
+    columns = ['outfile', 'ok', 'load_seconds', 'render_seconds',
+               'seconds', 'pid', 'error']
+    return pd.DataFrame(
+        [[result.get(c) for c in columns] for result in results],
+        index=pd.Index([result['id'] for result in results], name='id'),
+        columns=columns)
+
+
+def _decode_datetime(value):
+    """
+    JSON object hook decoding {'$datetime': '2019-07-01T08:00'}.
+    """
+    if set(value) == {'$datetime'}:
+        return pd.Timestamp(value['$datetime']).to_pydatetime()
+    return value
+
+
+def _decode_times(value):
+    """
+    Decode ISO-8601 strings (or lists of them) to datetimes.
+    """
+    if isinstance(value, str):
+        return pd.Timestamp(value).to_pydatetime()
+    if isinstance(value, list):
+        return [_decode_times(v) for v in value]
+    return value
+
+
+def _decode_job(job):
+    """
+    Decode the time keywords of a JSON job, see `TIME_KEYS`.
+    """
+    kwargs = job.get('kwargs')
+    if kwargs:
+        job['kwargs'] = {
+            key: _decode_times(value) if key in TIME_KEYS else value
+            for key, value in kwargs.items()}
+    return job
+
+
+def load_jobs(filename):
+    """
+    Read jobs from a JSON file (a list of jobs) or a JSON lines file
+    (one job per line). JSON has no date type, so the 'kwargs' in
+    `TIME_KEYS` (like 'time' or 'initial_time') given as ISO-8601
+    strings, and values tagged {'$datetime': '...'} anywhere in the
+    job, are decoded to `datetime.datetime`.
+
+    :param filename: job file name.
+    :return: list of job dictionaries.
+
+    >>> # {"function": "fig_cldas_temp", "data": {...},
+    >>> #  "kwargs": {"time": "2019-07-01T08:00"}, "outfile": "t.png"}
+    >>> jobs = load_jobs('jobs.jsonl')
+    """
+    with open(filename) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        jobs = json.loads(text, object_hook=_decode_datetime)
+    else:
+        jobs = [json.loads(line, object_hook=_decode_datetime)
+                for line in text.splitlines() if line.strip()]
+    return [_decode_job(job) for job in jobs]
+
+
+if __name__ == '__main__':
+    # python -m dk_met_graphics.plot.render jobs.json [processes]
+    results = render_jobs(
+        load_jobs(sys.argv[1]),
+        processes=int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    report = render_report(results)
+    print(report.drop(columns='error').to_string())
+    for job_id, error in report.loc[~report['ok'], 'error'].items():
+        print('\n{} failed:\n{}'.format(job_id, error))
+    sys.exit(0 if report['ok'].all() else 1)
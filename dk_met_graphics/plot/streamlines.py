@@ -0,0 +1,385 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Streamlines and particle traces of wind fields.
+
+All seed points are advanced together by a vectorized Runge-Kutta
+(RK2 or RK4) integrator over the regular longitude and latitude grid,
+with the winds sampled by NumPy bilinear interpolation, instead of the
+point by point integration of `matplotlib.streamplot`. Streamlines are
+then made evenly spaced like streamplot: lines are accepted longest
+first and cut where they enter a cell of the seed grid that is already
+taken by an earlier line.
+"""
+
+import numpy as np
+from matplotlib.collections import LineCollection
+import cartopy.crs as ccrs
+
+
+# earth radius (m)
+EARTH_RADIUS = 6371000.
+
+
+def _regular_grid(lon, lat, u, v):
+    """
+    Check a regular longitude and latitude grid and make the
+    coordinates increasing.
+
+    :return: (lon0, dlon, lat0, dlat, uv), the first coordinates,
+             steps and the (nlat, nlon) complex u + iv wind array.
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    uv = np.ma.filled(np.squeeze(u), np.nan) + \
+        1j * np.ma.filled(np.squeeze(v), np.nan)
+    if lon[0] > lon[-1]:
+        lon, uv = lon[::-1], uv[:, ::-1]
+    if lat[0] > lat[-1]:
+        lat, uv = lat[::-1], uv[::-1, :]
+    dlon, dlat = np.diff(lon), np.diff(lat)
+    if not (np.allclose(dlon, dlon[0], rtol=1e-4) and
+            np.allclose(dlat, dlat[0], rtol=1e-4)):
+        raise ValueError("Streamlines need a regular longitude and "
+                         "latitude grid.")
+    return lon[0], dlon[0], lat[0], dlat[0], np.ascontiguousarray(uv)
+
+
+def bilinear_sampler(lon, lat, u, v):
+    """
+    Make a function sampling winds at any points by bilinear
+    interpolation on a regular longitude and latitude grid.
+
+    :param lon: regular 1-D grid longitudes.
+    :param lat: regular 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward wind.
+    :param v: 2-D (lat, lon) northward wind.
+    :return: function of (plon, plat) point arrays returning the
+             complex u + iv winds, NaN outside the grid.
+
+    >>> sample = bilinear_sampler(lon, lat, u, v)
+    >>> uv = sample(np.array([110.2]), np.array([35.7]))
+    """
+    lon0, dlon, lat0, dlat, uv = _regular_grid(lon, lat, u, v)
+    nlat, nlon = uv.shape
+    # u and v packed as complex numbers, one gather per corner
+    flat = uv.ravel()
+
+    def sample(plon, plat):
+        fx = (plon - lon0) / dlon
+        fy = (plat - lat0) / dlat
+        with np.errstate(invalid='ignore'):
+            inside = ((fx >= 0) & (fx <= nlon - 1) &
+                      (fy >= 0) & (fy <= nlat - 1))
+        fx[~inside] = 0.
+        fy[~inside] = 0.
+        i = np.minimum(fx.astype(np.intp), nlon - 2)
+        j = np.minimum(fy.astype(np.intp), nlat - 2)
+        wx = fx - i
+        wy = fy - j
+        k = j * nlon + i
+        w = ((1 - wy) * ((1 - wx) * flat.take(k) + wx * flat.take(k + 1)) +
+             wy * ((1 - wx) * flat.take(k + nlon) +
+                   wx * flat.take(k + nlon + 1)))
+        w[~inside] = np.nan
+        return w
+
+    return sample
+
+
+def integrate(lon, lat, u, v, seed_lon, seed_lat, step, nsteps,
+              method='rk4', normalize=True, extent=None, loop_distance=None):
+    """
+    Advance all seed points together through a wind field.
+
+    :param lon: regular 1-D grid longitudes.
+    :param lat: regular 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward wind (m/s).
+    :param v: 2-D (lat, lon) northward wind (m/s).
+    :param seed_lon: 1-D seed longitudes.
+    :param seed_lat: 1-D seed latitudes.
+    :param step: integration step, the arc length in degrees along the
+                 wind direction if normalize (streamlines, negative to
+                 go upstream), else the time step in seconds (particle
+                 trajectories in the steady field); a scalar or one
+                 step per seed.
+    :param nsteps: number of steps.
+    :param method: 'rk2' (midpoint) or 'rk4' Runge-Kutta.
+    :param normalize: follow the wind direction with a fixed arc length
+                      step, or move with the wind speed.
+    :param extent: (lonmin, lonmax, latmin, latmax), points stop when
+                   leaving it, default is the grid.
+    :param loop_distance: points stop when they come back this close
+                          (degrees) to their seed, closing loops around
+                          vortices, default is never.
+    :return: (nsteps + 1, n, 2) array of the (lon, lat) positions, NaN
+             after a point leaves the grid (or extent) or reaches calm
+             winds.
+    """
+    sample = bilinear_sampler(lon, lat, u, v)
+    scale = 1. if normalize else np.degrees(1. / EARTH_RADIUS)
+
+    # positions as complex lon + i lat
+    def rate(p):
+        w = sample(p.real, p.imag)
+        if normalize:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                w /= np.abs(w)
+        else:
+            w *= scale
+        return w.real / np.cos(np.radians(p.imag)) + 1j * w.imag
+
+    p = np.asarray(seed_lon, dtype=np.float64).ravel() + \
+        1j * np.asarray(seed_lat, dtype=np.float64).ravel()
+    step = np.broadcast_to(np.asarray(step, dtype=np.float64), p.shape)
+    positions = np.full((nsteps + 1, p.size), np.nan, dtype=np.complex128)
+    valid = np.isfinite(rate(p))
+    if extent is not None:
+        x0, x1, y0, y1 = extent
+
+        def within(p):
+            return ((p.real >= x0) & (p.real <= x1) &
+                    (p.imag >= y0) & (p.imag <= y1))
+
+        valid &= within(p)
+    active = np.flatnonzero(valid)
+    p, step = p[valid], step[valid]
+    seeds = p
+    positions[0, active] = p
+    for n in range(1, nsteps + 1):
+        if not active.size:
+            break
+        k1 = rate(p)
+        if method == 'rk2':
+            p = p + step * rate(p + 0.5 * step * k1)
+        elif method == 'rk4':
+            k2 = rate(p + 0.5 * step * k1)
+            k3 = rate(p + 0.5 * step * k2)
+            k4 = rate(p + step * k3)
+            p = p + step / 6. * (k1 + 2 * k2 + 2 * k3 + k4)
+        else:
+            raise ValueError("Unknown method '{}'.".format(method))
+        alive = np.isfinite(p)
+        if extent is not None:
+            alive &= within(p)
+        if loop_distance is not None and n * np.abs(step[0]) > \
+                4 * loop_distance:
+            alive &= np.abs(p - seeds) > loop_distance
+        p, active = p[alive], active[alive]
+        step, seeds = step[alive], seeds[alive]
+        positions[n, active] = p
+    return positions.view(np.float64).reshape(positions.shape + (2,))
+
+
+def _grid_extent(lon, lat, extent):
+    """Extent of the seeds inside the grid, default is the grid."""
+    bounds = (np.min(lon), np.max(lon), np.min(lat), np.max(lat))
+    if extent is None:
+        extent = bounds
+    return (float(max(extent[0], bounds[0])), float(min(extent[1], bounds[1])),
+            float(max(extent[2], bounds[2])), float(min(extent[3], bounds[3])))
+
+
+def _truncate(cells, occupied):
+    """
+    Length of a streamline half before it leaves the map, enters a
+    taken cell or comes back to one of its own cells.
+    """
+    end = np.flatnonzero(cells < 0)
+    cells = cells[:end[0] if end.size else cells.size]
+    taken = np.flatnonzero(occupied[cells])
+    if taken.size:
+        cells = cells[:taken[0]]
+    change = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    _, first = np.unique(cells[change], return_index=True)
+    repeat = np.ones(change.size, dtype=bool)
+    repeat[first] = False
+    if repeat.any():
+        cells = cells[:change[np.argmax(repeat)]]
+    return cells.size
+
+
+def streamlines(lon, lat, u, v, extent=None, density=1., max_length=2.,
+                method='rk4', min_cells=3):
+    """
+    Compute evenly spaced streamlines of a wind field.
+
+    :param lon: regular 1-D grid longitudes.
+    :param lat: regular 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward wind.
+    :param v: 2-D (lat, lon) northward wind.
+    :param extent: (lonmin, lonmax, latmin, latmax) of the
+                   streamlines, in the grid longitude convention,
+                   clipped to the grid, default is the grid.
+    :param density: streamline density, 1 gives 30 streamline cells
+                    along the shorter side, like `matplotlib.streamplot`.
+    :param max_length: maximum length of each streamline half, relative
+                       to the longer side of the extent.
+    :param method: 'rk2' or 'rk4' Runge-Kutta integration.
+    :param min_cells: shortest streamline, in cells.
+    :return: list of (n, 2) arrays of (lon, lat) streamline vertices,
+             in the wind direction.
+
+    >>> lines = streamlines(lon, lat, u, v, extent=(70, 140, 10, 60))
+    """
+
+    # seed at the center of every cell
+    x0, x1, y0, y1 = _grid_extent(lon, lat, extent)
+    spacing = min(x1 - x0, y1 - y0) / (30. * density)
+    nx = int(np.ceil((x1 - x0) / spacing))
+    ny = int(np.ceil((y1 - y0) / spacing))
+    sx, sy = np.meshgrid(x0 + (np.arange(nx) + 0.5) * spacing,
+                         y0 + (np.arange(ny) + 0.5) * spacing)
+    sx, sy = sx.ravel(), sy.ravel()
+
+    # both halves of all streamlines at once, 3 steps per cell
+    step = spacing / 3.
+    nsteps = int(np.ceil(max_length * max(x1 - x0, y1 - y0) / step))
+    positions = integrate(
+        lon, lat, u, v, np.tile(sx, 2), np.tile(sy, 2),
+        np.repeat([step, -step], sx.size), nsteps, method=method,
+        extent=(x0, x1, y0, y1), loop_distance=0.5 * spacing)
+    halves = [positions[:, :sx.size], positions[:, sx.size:]]
+
+    # cell of every vertex, -1 outside the extent
+    cells = []
+    for half in halves:
+        with np.errstate(invalid='ignore'):
+            cx = np.floor((half[..., 0] - x0) / spacing)
+            cy = np.floor((half[..., 1] - y0) / spacing)
+            inside = (cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny)
+        cells.append(np.where(inside, cy * nx + cx, -1).astype(np.intp).T)
+
+    # accept the longest lines first, cut at the taken cells
+    occupied = np.zeros(nx * ny, dtype=bool)
+    lengths = np.sum(cells[0] >= 0, axis=1) + np.sum(cells[1] >= 0, axis=1)
+    lines = []
+    for i in np.argsort(-lengths, kind='stable'):
+        seed = cells[0][i, 0]
+        if seed < 0 or occupied[seed]:
+            continue
+        nf = _truncate(cells[0][i], occupied)
+        nb = _truncate(cells[1][i], occupied)
+        used = np.unique(np.concatenate(
+            [cells[0][i, :nf], cells[1][i, :nb]]))
+        if used.size < min_cells:
+            continue
+        occupied[used] = True
+        lines.append(np.concatenate(
+            [halves[1][nb - 1:0:-1, i], halves[0][:nf, i]]))
+    return lines
+
+
+def particle_traces(lon, lat, u, v, extent=None, density=1.,
+                    duration=6 * 3600., nsteps=24, method='rk2', seed=0):
+    """
+    Compute particle trajectories in a steady wind field.
+
+    :param lon: regular 1-D grid longitudes.
+    :param lat: regular 1-D grid latitudes.
+    :param u: 2-D (lat, lon) eastward wind (m/s).
+    :param v: 2-D (lat, lon) northward wind (m/s).
+    :param extent: (lonmin, lonmax, latmin, latmax) of the particle
+                   starts, default is the grid.
+    :param density: particle density, 1 gives about 40 particles along
+                    the shorter side.
+    :param duration: trajectory duration (s).
+    :param nsteps: number of time steps.
+    :param method: 'rk2' or 'rk4' Runge-Kutta integration.
+    :param seed: random seed of the particle starts.
+    :return: (nsteps + 1, n, 2) array of (lon, lat) positions, NaN
+             after a particle leaves the grid.
+
+    >>> traces = particle_traces(lon, lat, u, v, duration=12 * 3600)
+    """
+    x0, x1, y0, y1 = _grid_extent(lon, lat, extent)
+    spacing = min(x1 - x0, y1 - y0) / (40. * density)
+    count = int((x1 - x0) * (y1 - y0) / spacing ** 2)
+    random = np.random.RandomState(seed)
+    sx = x0 + random.random_sample(count) * (x1 - x0)
+    sy = y0 + random.random_sample(count) * (y1 - y0)
+    return integrate(lon, lat, u, v, sx, sy, duration / nsteps, nsteps,
+                     method=method, normalize=False)
+
+
+def _map_points(ax, points):
+    """Project (..., 2) lon/lat points to the axes data coordinates."""
+    if not hasattr(ax, 'projection'):
+        return points
+    xyz = ax.projection.transform_points(
+        ccrs.PlateCarree(), points[..., 0], points[..., 1])
+    return xyz[..., :2]
+
+
+def draw_streamlines(ax, lines, color='k', linewidth=1., arrows=True,
+                     arrowsize=1., zorder=None):
+    """
+    Draw streamlines as one line collection, with an arrow head in the
+    middle of every line.
+
+    :param ax: matplotlib axes, or cartopy GeoAxes instance.
+    :param lines: list of (n, 2) (lon, lat) arrays, see `streamlines`.
+    :param color: line color.
+    :param linewidth: line width.
+    :param arrows: draw arrow heads or not.
+    :param arrowsize: arrow head scale.
+    :param zorder: z-order.
+    :return: (LineCollection, Quiver or None).
+
+    >>> lc, arrows = draw_streamlines(ax, streamlines(lon, lat, u, v))
+    """
+    lines = [_map_points(ax, line) for line in lines]
+    lc = LineCollection(lines, colors=color, linewidths=linewidth,
+                        zorder=zorder, transform=ax.transData)
+    ax.add_collection(lc, autolim=False)
+    if not arrows or not lines:
+        return lc, None
+
+    # unit directions at the line centers
+    centers = np.array([line[len(line) // 2] for line in lines])
+    directions = np.array([line[len(line) // 2] - line[len(line) // 2 - 1]
+                           for line in lines])
+    directions /= np.hypot(directions[:, 0], directions[:, 1])[:, None]
+    width = linewidth * ax.figure.dpi / 72.
+    quiver = ax.quiver(
+        centers[:, 0], centers[:, 1], directions[:, 0], directions[:, 1],
+        color=color, angles='xy', pivot='mid', units='dots', width=width,
+        scale_units='dots', scale=1. / (6. * arrowsize * width),
+        headwidth=4. * arrowsize, headlength=5. * arrowsize,
+        headaxislength=4.5 * arrowsize, zorder=zorder,
+        transform=getattr(ax, 'projection', ax.transData))
+    return lc, quiver
+
+
+def draw_traces(ax, traces, color='k', linewidth=1., fade=True,
+                zorder=None):
+    """
+    Draw particle traces, fading from the start to the end.
+
+    :param ax: matplotlib axes, or cartopy GeoAxes instance.
+    :param traces: (nsteps + 1, n, 2) (lon, lat) positions, see
+                   `particle_traces`.
+    :param color: line color.
+    :param linewidth: line width.
+    :param fade: fade the traces from transparent at the start to
+                 opaque at the end, showing the motion.
+    :param zorder: z-order.
+    :return: LineCollection.
+
+    >>> lc = draw_traces(ax, particle_traces(lon, lat, u, v))
+    """
+    import matplotlib.colors as mcolors
+
+    points = _map_points(ax, traces)
+    segments = np.stack([points[:-1], points[1:]], axis=2).reshape(-1, 2, 2)
+    valid = np.isfinite(segments).all(axis=(1, 2))
+    colors = np.tile(mcolors.to_rgba(color), (len(segments), 1))
+    if fade:
+        alpha = np.linspace(0.1, 1., len(traces) - 1)
+        colors[:, 3] *= np.repeat(alpha, traces.shape[1])
+    lc = LineCollection(segments[valid], colors=colors[valid],
+                        linewidths=linewidth, zorder=zorder,
+                        transform=ax.transData, capstyle='round')
+    ax.add_collection(lc, autolim=False)
+    return lc
+
@@ -4,19 +4,106 @@
 Draw synoptic analysis graphics.
 """
 
+import functools
 import numpy as np
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
 from dk_met_graphics.plot.china_map import add_china_map_2cartopy
 from dk_met_graphics.cmap.cm import guide_cmaps
+from dk_met_graphics.plot.contour import draw_contour
+from dk_met_graphics.plot import barbs
+from dk_met_graphics.plot.streamlines import (
+    streamlines, particle_traces, draw_streamlines, draw_traces)
+from dk_met_graphics.plot.background import add_static_layers
+
+
+def _land_boundaries(ax, add_china=True):
+    """Static layers: land, coast lines and province boundaries."""
+    ax.add_feature(cfeature.LAND, facecolor='0.6')
+    ax.coastlines('50m', edgecolor='black', linewidth=0.75, zorder=100)
+    if add_china:
+        add_china_map_2cartopy(
+            ax, name='province', edgecolor='darkcyan', lw=1, zorder=100)
+
+
+def _boundaries(ax, coastline_color='black', add_china=True, lw=2):
+    """Static layers: coast lines and province boundaries."""
+    ax.coastlines('50m', edgecolor=coastline_color)
+    if add_china:
+        add_china_map_2cartopy(
+            ax, name='province', edgecolor='darkcyan', lw=lw)
+
+
+def _gridlines(ax):
+    """Static layers: grid lines every 15 degrees."""
+    gl = ax.gridlines(
+        crs=ccrs.PlateCarree(), linewidth=2, color='gray', alpha=0.5,
+        linestyle='--')
+    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
+    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
+
+
+def _labeled_gridlines(ax):
+    """Static layers: grid lines with longitude and latitude labels."""
+    gl = ax.gridlines(
+        crs=ccrs.PlateCarree(), draw_labels=True, linewidth=2,
+        color='gray', alpha=0.5, linestyle='--')
+    gl.xformatter = LONGITUDE_FORMATTER
+    gl.yformatter = LATITUDE_FORMATTER
+    gl.xlabels_top = False
+    gl.ylabels_right = False
+    gl.xlabel_style = {'size': 16}
+    gl.ylabel_style = {'size': 16}
+
+
+def _add_layers(ax, layers, cache_background):
+    """Add static layers, as cached images or as artists."""
+    if cache_background:
+        return add_static_layers(ax, layers)
+    for layer in layers:
+        layer(ax)
+
+
+def _draw_mslp(ax, mslp, cache=False):
+    """Mean sea level pressure filled contours."""
+    clevs = mslp.get('clevs')
+    if clevs is None:
+        clevs = np.arange(960, 1065, 5)
+    cmap = guide_cmaps(26)
+    return draw_contour(
+        ax, mslp['lon'], mslp['lat'], mslp['data'], clevs, filled=True,
+        cmap=cmap, alpha=0.8, zorder=10, transform=ccrs.PlateCarree(),
+        cache=cache)
+
+
+def _draw_barbs850(ax, uv850, regrid_shape):
+    """850-hPa wind barbs."""
+    u = np.squeeze(uv850['udata']) * 2.5
+    v = np.squeeze(uv850['vdata']) * 2.5
+    return barbs.draw_barbs(
+        ax, uv850['lon'], uv850['lat'], u, v, regrid_shape=regrid_shape,
+        length=6, fill_empty=False, sizes=dict(emptybarb=0.05), zorder=20)
+
+
+def _draw_gh500(ax, gh500, cache=False):
+    """500-hPa geopotential height contours with labels."""
+    clevs = gh500.get('clevs')
+    if clevs is None:
+        clevs = np.append(np.arange(480, 584, 8), np.arange(580, 604, 4))
+    cs = draw_contour(
+        ax, gh500['lon'], gh500['lat'], gh500['data'], clevs,
+        colors='purple', linewidths=2, transform=ccrs.PlateCarree(), zorder=30,
+        cache=cache)
+    ax.clabel(cs, inline=1, fontsize=16, fmt='%.0f')
+    return cs
 
 
 def draw_gh500_uv850_mslp(ax, gh500=None, uv850=None, mslp=None,
                           map_extent=(50, 150, 0, 65), add_china=True,
-                          regrid_shape=20):
+                          regrid_shape=20, cache_background=False,
+                          cache_contours=False):
     """
     Draw 500-hPa geopotential height contours, 850-hPa wind barbs
     and mean sea level pressure filled contours.
@@ -37,6 +124,15 @@ def draw_gh500_uv850_mslp(ax, gh500=None, uv850=None, mslp=None,
                        longitude and latitude range.
     :param add_china: add china map or not.
     :param regrid_shape: control the wind barbs density.
+    :param cache_background: draw the static map layers (land, coast
+                             lines, boundaries and grid lines) as images
+                             cached for the map projection, extent, axes
+                             size and DPI in raster outputs, for figures
+                             drawn many times, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
     :return: plots dictionary.
 
     :Examples:
@@ -48,59 +144,81 @@ def draw_gh500_uv850_mslp(ax, gh500=None, uv850=None, mslp=None,
 
     # plot map background
     ax.set_extent(map_extent, crs=datacrs)
-    ax.add_feature(cfeature.LAND, facecolor='0.6')
-    ax.coastlines('50m', edgecolor='black', linewidth=0.75, zorder=100)
-    if add_china:
-        add_china_map_2cartopy(
-            ax, name='province', edgecolor='darkcyan', lw=1, zorder=100)
+    _add_layers(ax, [functools.partial(_land_boundaries, add_china=add_china)],
+                cache_background)
 
     # define return plots
     plots = {}
 
     # draw mean sea level pressure
     if mslp is not None:
-        x, y = np.meshgrid(mslp['lon'], mslp['lat'])
-        clevs = mslp.get('clevs')
-        if clevs is None:
-            clevs = np.arange(960, 1065, 5)
-        cmap = guide_cmaps(26)
-        plots['mslp'] = ax.contourf(
-            x, y, np.squeeze(mslp['data']), clevs,
-            cmap=cmap, alpha=0.8, zorder=10, transform=datacrs)
+        plots['mslp'] = _draw_mslp(ax, mslp, cache=cache_contours)
 
     # draw 850-hPa wind bards
     if uv850 is not None:
-        x, y = np.meshgrid(uv850['lon'], uv850['lat'])
-        u = np.squeeze(uv850['udata']) * 2.5
-        v = np.squeeze(uv850['vdata']) * 2.5
-        plots['uv850'] = ax.barbs(
-            x, y, u, v, length=6, regrid_shape=regrid_shape,
-            transform=datacrs, fill_empty=False, sizes=dict(emptybarb=0.05),
-            zorder=20)
+        plots['uv850'] = _draw_barbs850(ax, uv850, regrid_shape)
 
     # draw 500-hPa geopotential height
     if gh500 is not None:
-        x, y = np.meshgrid(gh500['lon'], gh500['lat'])
-        clevs = gh500.get('clevs')
-        if clevs is None:
-            clevs = np.append(np.arange(480, 584, 8), np.arange(580, 604, 4))
-        plots['gh500'] = ax.contour(
-            x, y, np.squeeze(gh500['data']), clevs, colors='purple',
-            linewidths=2, transform=datacrs, zorder=30)
-        plt.clabel(plots['gh500'], inline=1, fontsize=16, fmt='%.0f')
+        plots['gh500'] = _draw_gh500(ax, gh500, cache=cache_contours)
 
     # grid lines
-    gl = ax.gridlines(
-        crs=datacrs, linewidth=2, color='gray', alpha=0.5, linestyle='--')
-    gl.xlocator = mpl.ticker.FixedLocator(np.arange(0, 360, 15))
-    gl.ylocator = mpl.ticker.FixedLocator(np.arange(-90, 90, 15))
+    _add_layers(ax, [_gridlines], cache_background)
 
     # return plots
     return plots
 
 
+def update_gh500_uv850_mslp(ax, plots, gh500=None, uv850=None, mslp=None,
+                            regrid_shape=20, cache_contours=False):
+    """
+    Replace the fields drawn by `draw_gh500_uv850_mslp` with the next
+    time step on the same grids, keeping the map and every other
+    artist, like for animation frames. Contour sets are redrawn and
+    the wind barbs updated in place.
+
+    :param ax: the `Axes` instance of `draw_gh500_uv850_mslp`.
+    :param plots: plots dictionary returned by `draw_gh500_uv850_mslp`.
+    :param gh500: 500-hPa gh, see `draw_gh500_uv850_mslp`.
+    :param uv850: 850-hPa wind, see `draw_gh500_uv850_mslp`.
+    :param mslp: MSLP, see `draw_gh500_uv850_mslp`.
+    :param regrid_shape: wind barbs density of `draw_gh500_uv850_mslp`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
+    :return: plots dictionary.
+
+    >>> plots = draw_gh500_uv850_mslp(ax, gh500=gh500[0], uv850=uv850[0],
+    >>>                               mslp=mslp[0])
+    >>> for i in range(1, len(gh500)):
+    >>>     update_gh500_uv850_mslp(ax, plots, gh500=gh500[i],
+    >>>                             uv850=uv850[i], mslp=mslp[i])
+    >>>     fig.savefig('frame_{:03d}.png'.format(i))
+    """
+
+    if mslp is not None:
+        if 'mslp' in plots:
+            plots['mslp'].remove()
+        plots['mslp'] = _draw_mslp(ax, mslp, cache=cache_contours)
+    if uv850 is not None:
+        if 'uv850' in plots:
+            _, _, u, v = barbs.barb_vectors(
+                ax, uv850['lon'], uv850['lat'],
+                np.squeeze(uv850['udata']) * 2.5,
+                np.squeeze(uv850['vdata']) * 2.5, regrid_shape=regrid_shape)
+            plots['uv850'].set_UVC(u, v)
+        else:
+            plots['uv850'] = _draw_barbs850(ax, uv850, regrid_shape)
+    if gh500 is not None:
+        if 'gh500' in plots:
+            plots['gh500'].remove()
+        plots['gh500'] = _draw_gh500(ax, gh500, cache=cache_contours)
+    return plots
+
+
 def draw_uv850(ax, uv850=None, gh850=None, map_extent=(73, 136, 18, 54),
-               add_china=True, regrid_shape=15):
+               add_china=True, regrid_shape=15, cache_background=False,
+               cache_contours=False):
     """
     Draw 850-hPa wind field.
 
@@ -114,6 +232,15 @@ def draw_uv850(ax, uv850=None, gh850=None, map_extent=(73, 136, 18, 54),
                        longitude and latitude range.
     :param add_china: add china map or not.
     :param regrid_shape: control the wind barbs density.
+    :param cache_background: draw the static map layers (land, coast
+                             lines, boundaries and grid lines) as images
+                             cached for the map projection, extent, axes
+                             size and DPI in raster outputs, for figures
+                             drawn many times, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
     :return: plots dictionary.
     """
 
@@ -122,51 +249,171 @@ def draw_uv850(ax, uv850=None, gh850=None, map_extent=(73, 136, 18, 54),
 
     # plot map background
     ax.set_extent(map_extent, crs=datacrs)
-    ax.add_feature(cfeature.LAND, facecolor='0.6')
-    ax.coastlines('50m', edgecolor='black', linewidth=0.75, zorder=100)
-    if add_china:
-        add_china_map_2cartopy(
-            ax, name='province', edgecolor='darkcyan', lw=1, zorder=100)
+    _add_layers(ax, [functools.partial(_land_boundaries, add_china=add_china)],
+                cache_background)
 
     # define return plots
     plots = {}
 
     # draw 850hPa wind speed and barbs
     if uv850 is not None:
-        x, y = np.meshgrid(uv850['lon'], uv850['lat'])
         u = np.squeeze(uv850['udata'])
         v = np.squeeze(uv850['vdata'])
         clevs = uv850.get('clevs')
         if clevs is None:
             clevs = np.arange(4, 40, 4)
         cmaps = guide_cmaps("2")
-        plots['uv850_cf'] = ax.contourf(
-            x, y, np.sqrt(u * u + v * v), clevs, cmap=cmaps, transform=datacrs)
-        plots['uv850_bb'] = ax.barbs(
-            x, y, u*2.5, v*2.5, length=7, regrid_shape=regrid_shape,
-            transform=datacrs, sizes=dict(emptybarb=0.05))
+        plots['uv850_cf'] = draw_contour(
+            ax, uv850['lon'], uv850['lat'], np.hypot(u, v), clevs,
+            filled=True, cmap=cmaps, transform=datacrs, cache=cache_contours)
+        plots['uv850_bb'] = barbs.draw_barbs(
+            ax, uv850['lon'], uv850['lat'], u*2.5, v*2.5,
+            regrid_shape=regrid_shape, length=7, sizes=dict(emptybarb=0.05))
 
     # draw 850hPa geopotential height
     if gh850 is not None:
-        x, y = np.meshgrid(gh850['lon'], gh850['lat'])
         clevs = gh850.get('clevs')
         if clevs is None:
             clevs = np.arange(80, 180, 4)
-        plots['gh850'] = ax.contour(
-            x, y, np.squeeze(gh850['data']), clevs, colors='purple',
-            linewidths=2, transform=datacrs, zorder=30)
-        plt.clabel(plots['gh850'], inline=1, fontsize=16, fmt='%.0f')
+        plots['gh850'] = draw_contour(
+            ax, gh850['lon'], gh850['lat'], gh850['data'], clevs,
+            colors='purple', linewidths=2, transform=datacrs, zorder=30,
+            cache=cache_contours)
+        ax.clabel(plots['gh850'], inline=1, fontsize=16, fmt='%.0f')
 
     # add grid lines
-    gl = ax.gridlines(
-        crs=ccrs.PlateCarree(), draw_labels=True, linewidth=2,
-        color='gray', alpha=0.5, linestyle='--')
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
-    gl.xlabels_top = False
-    gl.ylabels_right = False
-    gl.xlabel_style = {'size': 16}
-    gl.ylabel_style = {'size': 16}
+    _add_layers(ax, [_labeled_gridlines], cache_background)
+
+    # return
+    return plots
+
+
+def _draw_speed850(ax, uv850, u, v, cache=False):
+    """Filled contours of the 850-hPa wind speed."""
+    clevs = uv850.get('clevs')
+    if clevs is None:
+        clevs = np.arange(4, 40, 4)
+    return draw_contour(
+        ax, uv850['lon'], uv850['lat'], np.hypot(u, v), clevs,
+        filled=True, cmap=guide_cmaps("2"), transform=ccrs.PlateCarree(),
+        cache=cache)
+
+
+def draw_uv850_streamlines(ax, uv850, map_extent=(73, 136, 18, 54),
+                           add_china=True, density=1., add_speed=True,
+                           color='k', linewidth=1., cache_background=False,
+                           cache_contours=False):
+    """
+    Draw 850-hPa streamlines, integrated over the grid by
+    `streamlines.streamlines`.
+
+    :param ax: `matplotlib.axes.Axes`, the `Axes` instance used for plotting.
+    :param uv850: 850-hPa u-component and v-component wind, dictionary:
+                  necessary, {'lon': 1D array, 'lat': 1D array,
+                              'udata': 2D array, 'vdata': 2D array}
+                  optional, {'clevs': 1D array speed contour levels}
+    :param map_extent: [lonmin, lonmax, latmin, latmax],
+                       longitude and latitude range.
+    :param add_china: add china map or not.
+    :param density: streamline density, 1 is about 30 lines
+                    across the shorter side of the map extent.
+    :param add_speed: draw wind speed filled contours or not.
+    :param color: streamline color.
+    :param linewidth: streamline width.
+    :param cache_background: draw the static map layers as cached
+                             images in raster outputs, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
+    :return: plots dictionary.
+
+    >>> plots = draw_uv850_streamlines(ax, {'lon': lon, 'lat': lat,
+    >>>                                     'udata': u, 'vdata': v})
+    """
+
+    # plot map background
+    ax.set_extent(map_extent, crs=ccrs.PlateCarree())
+    _add_layers(ax, [functools.partial(_land_boundaries, add_china=add_china)],
+                cache_background)
+
+    # define return plots
+    plots = {}
+
+    # draw 850hPa wind speed and streamlines
+    u = np.squeeze(uv850['udata'])
+    v = np.squeeze(uv850['vdata'])
+    if add_speed:
+        plots['uv850_cf'] = _draw_speed850(
+            ax, uv850, u, v, cache=cache_contours)
+    lines = streamlines(uv850['lon'], uv850['lat'], u, v,
+                        extent=map_extent, density=density)
+    plots['uv850_sl'] = draw_streamlines(
+        ax, lines, color=color, linewidth=linewidth, zorder=50)
+
+    # add grid lines
+    _add_layers(ax, [_labeled_gridlines], cache_background)
+
+    # return
+    return plots
+
+
+def draw_uv850_traces(ax, uv850, map_extent=(73, 136, 18, 54),
+                      add_china=True, density=1., duration=6*3600.,
+                      add_speed=True, color='k', linewidth=1.,
+                      cache_background=False, cache_contours=False):
+    """
+    Draw the traces of particles advected by the (steady) 850-hPa wind,
+    integrated over the grid by `streamlines.particle_traces`.
+
+    :param ax: `matplotlib.axes.Axes`, the `Axes` instance used for plotting.
+    :param uv850: 850-hPa u-component and v-component wind, dictionary:
+                  necessary, {'lon': 1D array, 'lat': 1D array,
+                              'udata': 2D array, 'vdata': 2D array}
+                  optional, {'clevs': 1D array speed contour levels}
+    :param map_extent: [lonmin, lonmax, latmin, latmax],
+                       longitude and latitude range.
+    :param add_china: add china map or not.
+    :param density: particle density, 1 is about 40 particles
+                    across the shorter side of the map extent.
+    :param duration: advection time in seconds.
+    :param add_speed: draw wind speed filled contours or not.
+    :param color: trace color.
+    :param linewidth: trace width.
+    :param cache_background: draw the static map layers as cached
+                             images in raster outputs, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
+    :return: plots dictionary.
+
+    >>> plots = draw_uv850_traces(ax, {'lon': lon, 'lat': lat,
+    >>>                                'udata': u, 'vdata': v})
+    """
+
+    # plot map background
+    ax.set_extent(map_extent, crs=ccrs.PlateCarree())
+    _add_layers(ax, [functools.partial(_land_boundaries, add_china=add_china)],
+                cache_background)
+
+    # define return plots
+    plots = {}
+
+    # draw 850hPa wind speed and particle traces
+    u = np.squeeze(uv850['udata'])
+    v = np.squeeze(uv850['vdata'])
+    if add_speed:
+        plots['uv850_cf'] = _draw_speed850(
+            ax, uv850, u, v, cache=cache_contours)
+    traces = particle_traces(uv850['lon'], uv850['lat'], u, v,
+                             extent=map_extent, density=density,
+                             duration=duration)
+    plots['uv850_tr'] = draw_traces(
+        ax, traces, color=color, linewidth=linewidth, zorder=50)
+
+    # add grid lines
+    _add_layers(ax, [_labeled_gridlines], cache_background)
 
     # return
     return plots
@@ -180,7 +427,8 @@ def draw_wind850(ax, lon, lat, u, v, mslp=None, gh500=None,
                  thetae850_clev=np.arange(280, 360, 4),
                  draw_barbs=True, left_title="850hPa wind", right_title=None,
                  add_china=True, coastline_color='black', title_font=None,
-                 cax=None, cb_title='850hPa wind speed (m/s)', cb_font=None):
+                 cax=None, cb_title='850hPa wind speed (m/s)', cb_font=None,
+                 cache_background=False, cache_contours=False):
     """
     Draw 850hPa wind field.
 
@@ -210,6 +458,15 @@ def draw_wind850(ax, lon, lat, u, v, mslp=None, gh500=None,
                            fname='C:/Windows/Fonts/SIMYOU.TTF')
     :param cb_title: color bar title
     :param cb_font: color bar title font properties
+    :param cache_background: draw the static map layers (land, coast
+                             lines, boundaries and grid lines) as images
+                             cached for the map projection, extent, axes
+                             size and DPI in raster outputs, for figures
+                             drawn many times, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
     :return: wind filled contour cf and barbs bb object.
 
     """
@@ -224,19 +481,18 @@ def draw_wind850(ax, lon, lat, u, v, mslp=None, gh500=None,
     ax.set_extent(map_extent)
 
     # add map boundary
-    ax.coastlines('50m', edgecolor=coastline_color)
-    if add_china:
-        add_china_map_2cartopy(ax, name='province', edgecolor='darkcyan')
+    _add_layers(ax, [functools.partial(
+        _boundaries, coastline_color=coastline_color, add_china=add_china)],
+        cache_background)
 
     # draw 850hPa wind speed
-    x, y = np.meshgrid(lon, lat)
     if wind_cmap is None:
         wind_cmap = guide_cmaps("2")
-    cf = ax.contourf(
-        x, y, np.sqrt(u*u + v*v), wspeed_clev,
-        cmap=wind_cmap, transform=datacrs)
+    cf = draw_contour(
+        ax, lon, lat, np.hypot(u, v), wspeed_clev, filled=True,
+        cmap=wind_cmap, transform=datacrs, cache=cache_contours)
     if cax is not None:
-        cb = plt.colorbar(
+        cb = cax.figure.colorbar(
             cf, cax=cax, orientation='horizontal',
             extendrect=True, ticks=wspeed_clev)
         cb.set_label(
@@ -245,51 +501,43 @@ def draw_wind850(ax, lon, lat, u, v, mslp=None, gh500=None,
 
     # draw wind barbs
     if draw_barbs:
-        bb = ax.barbs(
-            x, y, u, v, length=7, regrid_shape=15, transform=datacrs,
+        bb = barbs.draw_barbs(
+            ax, lon, lat, u, v, regrid_shape=15, length=7,
             sizes=dict(emptybarb=0.05))
 
     # draw mean sea level pressure
     if mslp is not None:
-        x, y = np.meshgrid(mslp[0], mslp[1])
-        cs1 = ax.contour(
-            x, y, mslp[2], mslp_clev, colors='k',
-            linewidth=1.0, linestyles='solid', transform=datacrs)
-        plt.clabel(
+        cs1 = draw_contour(
+            ax, mslp[0], mslp[1], mslp[2], mslp_clev, colors='k',
+            linewidth=1.0, linestyles='solid', transform=datacrs,
+            cache=cache_contours)
+        ax.clabel(
             cs1, fontsize=10, inline=1, inline_spacing=10, fmt='%i',
             rightside_up=True, use_clabeltext=True)
 
     # draw 500hPa geopotential height
     if gh500 is not None:
-        x, y = np.meshgrid(gh500[0], gh500[1])
-        cs2 = ax.contour(
-            x, y, gh500[2], gh500_clev, colors='w',
-            linewidth=1.0, linestyles='dashed', transform=datacrs)
-        plt.clabel(
+        cs2 = draw_contour(
+            ax, gh500[0], gh500[1], gh500[2], gh500_clev, colors='w',
+            linewidth=1.0, linestyles='dashed', transform=datacrs,
+            cache=cache_contours)
+        ax.clabel(
             cs2, fontsize=10, inline=1, inline_spacing=10,
             fmt='%i', rightside_up=True, use_clabeltext=True)
 
     # draw 850hPa equivalent potential temperature
     if thetae850 is not None:
-        x, y = np.meshgrid(thetae850[0], thetae850[1])
-        cmap = plt.get_cmap("hsv")
-        cs3 = ax.contour(
-            x, y, thetae850[2], thetae850_clev, cmap=cmap,
-            linewidth=0.8, linestyles='solid', transform=datacrs)
-        plt.clabel(
+        cmap = mpl.cm.hsv
+        cs3 = draw_contour(
+            ax, thetae850[0], thetae850[1], thetae850[2], thetae850_clev,
+            cmap=cmap, linewidth=0.8, linestyles='solid', transform=datacrs,
+            cache=cache_contours)
+        ax.clabel(
             cs3, fontsize=10, inline=1, inline_spacing=10, fmt='%i',
             rightside_up=True, use_clabeltext=True)
 
     # add grid lines
-    gl = ax.gridlines(
-        crs=ccrs.PlateCarree(), draw_labels=True, linewidth=2,
-        color='gray', alpha=0.5, linestyle='--')
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
-    gl.xlabels_top = False
-    gl.ylabels_right = False
-    gl.xlabel_style = {'size': 16}
-    gl.ylabel_style = {'size': 16}
+    _add_layers(ax, [_labeled_gridlines], cache_background)
 
     # add title
     ax.set_title(
@@ -311,7 +559,8 @@ def draw_theta_on_pv(ax, lon, lat, theta, mslp=None, gh500=None,
                      mslp_clev=np.arange(960, 1060, 4),
                      gh500_clev=np.arange(480, 600, 2),
                      cax=None, left_title="850hPa wind", right_title=None,
-                     add_china=True, coastline_color='black'):
+                     add_china=True, coastline_color='black',
+                     cache_background=False, cache_contours=False):
     """
     Draw potential temperature on pv surface.
 
@@ -331,6 +580,15 @@ def draw_theta_on_pv(ax, lon, lat, theta, mslp=None, gh500=None,
     :param right_title: right title.
     :param add_china: draw china province map or not.
     :param coastline_color: coast lines color.
+    :param cache_background: draw the static map layers (land, coast
+                             lines, boundaries and grid lines) as images
+                             cached for the map projection, extent, axes
+                             size and DPI in raster outputs, for figures
+                             drawn many times, see
+                             `background.add_static_layers`.
+    :param cache_contours: keep the contour paths in the on-disk cache,
+                           for fields drawn again by later processes,
+                           see `contour.contour_paths`.
     :return: potential temperature filled contour cf object.
     """
 
@@ -344,19 +602,18 @@ def draw_theta_on_pv(ax, lon, lat, theta, mslp=None, gh500=None,
     ax.set_extent(map_extent)
 
     # add map boundary
-    ax.coastlines('50m', edgecolor=coastline_color)
-    if add_china:
-        add_china_map_2cartopy(
-            ax, name='province', edgecolor='darkcyan', lw=4)
+    _add_layers(ax, [functools.partial(
+        _boundaries, coastline_color=coastline_color, add_china=add_china,
+        lw=4)], cache_background)
 
     # draw potential temperature
-    x, y = np.meshgrid(lon, lat)
     cmap = guide_cmaps("27")
-    cf = ax.contourf(
-        x, y, theta, theta_clev, cmap=cmap, alpha=alpha,
-        antialiased=True, transform=datacrs)
+    cf = draw_contour(
+        ax, lon, lat, theta, theta_clev, filled=True, cmap=cmap,
+        alpha=alpha, antialiased=True, transform=datacrs,
+        cache=cache_contours)
     if cax is not None:
-        cb = plt.colorbar(
+        cb = cax.figure.colorbar(
             cf, cax=cax, orientation='horizontal',
             extendrect=True, ticks=theta_clev)
         cb.set_label(
@@ -365,34 +622,26 @@ def draw_theta_on_pv(ax, lon, lat, theta, mslp=None, gh500=None,
 
     # draw mean sea level pressure
     if mslp is not None:
-        x, y = np.meshgrid(mslp[0], mslp[1])
-        cs1 = ax.contour(
-            x, y, mslp[2], mslp_clev, colors='k', linewidth=1.0,
-            linestyles='solid', transform=datacrs)
-        plt.clabel(
+        cs1 = draw_contour(
+            ax, mslp[0], mslp[1], mslp[2], mslp_clev, colors='k',
+            linewidth=1.0, linestyles='solid', transform=datacrs,
+            cache=cache_contours)
+        ax.clabel(
             cs1, fontsize=10, inline=1, inline_spacing=10,
             fmt='%i', rightside_up=True, use_clabeltext=True)
 
     # draw 500hPa geopotential height
     if gh500 is not None:
-        x, y = np.meshgrid(gh500[0], gh500[1])
-        cs2 = ax.contour(
-            x, y, gh500[2], gh500_clev, colors='w', linewidth=1.0,
-            linestyles='dashed', transform=datacrs)
-        plt.clabel(
+        cs2 = draw_contour(
+            ax, gh500[0], gh500[1], gh500[2], gh500_clev, colors='w',
+            linewidth=1.0, linestyles='dashed', transform=datacrs,
+            cache=cache_contours)
+        ax.clabel(
             cs2, fontsize=10, inline=1, inline_spacing=10, fmt='%i',
             rightside_up=True, use_clabeltext=True)
 
     # add grid lines
-    gl = ax.gridlines(
-        crs=ccrs.PlateCarree(), draw_labels=True, linewidth=2,
-        color='gray', alpha=0.5, linestyle='--')
-    gl.xformatter = LONGITUDE_FORMATTER
-    gl.yformatter = LATITUDE_FORMATTER
-    gl.xlabels_top = False
-    gl.ylabels_right = False
-    gl.xlabel_style = {'size': 16}
-    gl.ylabel_style = {'size': 16}
+    _add_layers(ax, [_labeled_gridlines], cache_background)
 
     # add title
     ax.set_title(left_title, loc='left', fontsize=18)
@@ -0,0 +1,294 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Render gridded fields as XYZ web mercator map tiles.
+
+Tiles are colored directly with a color lookup table (see
+`cmap.cm.colormap_lut`) without matplotlib figures: the field is
+converted to color table indices once, then every 256x256 tile
+gathers the indices of the grid cells nearest to its pixel centers.
+Longitude only depends on the pixel column and latitude on the pixel
+row in web mercator, so the gather indices are two 1-D vectors.
+Tiles without visible pixels are skipped.
+"""
+
+import os
+import io
+import multiprocessing
+import numpy as np
+from PIL import Image
+from dk_met_graphics.cmap.cm import colormap_lut, apply_lut
+
+
+# tile size in pixels
+TILE_SIZE = 256
+
+# web mercator latitude limit
+MAX_LATITUDE = 85.0511287798066
+
+# tile rendering state of the worker processes
+_tile_state = {}
+
+
+def tile_bounds(z, x, y):
+    """
+    Get the longitude and latitude bounds of a tile.
+
+    :param z: zoom level.
+    :param x: tile column.
+    :param y: tile row, from the north.
+    :return: (lonmin, lonmax, latmin, latmax) tuple.
+    """
+    n = 2 ** z
+    lon0, lon1 = x / n * 360. - 180., (x + 1) / n * 360. - 180.
+    lat1 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2. * y / n))))
+    lat0 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2. * (y + 1) / n))))
+    return lon0, lon1, lat0, lat1
+
+
+def tile_range(z, extent):
+    """
+    Get the tiles of a zoom level covering an extent.
+
+    :param z: zoom level.
+    :param extent: (lonmin, lonmax, latmin, latmax) tuple.
+    :return: (x0, x1, y0, y1), inclusive tile column and row ranges.
+    """
+    n = 2 ** z
+    lat0 = np.clip(extent[2], -MAX_LATITUDE, MAX_LATITUDE)
+    lat1 = np.clip(extent[3], -MAX_LATITUDE, MAX_LATITUDE)
+
+    def row(lat):
+        lat = np.radians(lat)
+        return (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+
+    x0 = int(np.floor((extent[0] + 180.) / 360. * n))
+    x1 = int(np.floor((extent[1] + 180.) / 360. * n))
+    y0, y1 = int(np.floor(row(lat1))), int(np.floor(row(lat0)))
+    return (max(x0, 0), min(x1, n - 1), max(y0, 0), min(y1, n - 1))
+
+
+def nearest_index(coords, values):
+    """
+    Find the nearest coordinate of values in increasing 1-D coordinates.
+
+    :param coords: increasing 1-D grid coordinates.
+    :param values: array of values.
+    :return: indices, -1 for values outside the grid cells.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if coords.size < 2:
+        # a single coordinate is a cell of zero width
+        return np.where(values == coords[0], 0, -1) if coords.size else \
+            np.full(values.shape, -1, dtype=np.int64)
+    edges = np.concatenate([
+        [coords[0] - 0.5 * (coords[1] - coords[0])],
+        0.5 * (coords[:-1] + coords[1:]),
+        [coords[-1] + 0.5 * (coords[-1] - coords[-2])]])
+    index = np.searchsorted(edges, values, side='right') - 1
+    index[(index < 0) | (index >= coords.size)] = -1
+    return index
+
+
+def wrap_longitudes(lon, data):
+    """
+    Normalize the longitudes of a grid to [-180, 180), rolling the
+    field columns to keep the longitudes increasing. A global grid
+    gets one cyclic column on each side, so the tiles along the
+    dateline are filled.
+
+    :param lon: increasing 1-D grid longitudes, like 0 to 360.
+    :param data: 2-D (lat, lon) array.
+    :return: (lon, data), increasing longitudes and the field.
+
+    >>> lon, data = wrap_longitudes(np.arange(0, 360, 0.25), data)
+    """
+    wrapped = np.mod(lon + 180., 360.) - 180.
+    order = np.argsort(wrapped, kind='mergesort')
+    lon, data = wrapped[order], data[:, order]
+
+    # duplicated columns, like 0 and 360
+    keep = np.concatenate([[True], np.diff(lon) > 0])
+    lon, data = lon[keep], data[:, keep]
+
+    # cyclic columns of a global grid
+    if lon.size > 1:
+        step = np.min(np.diff(lon))
+        if lon[-1] - lon[0] + step >= 360. - 1e-6 * step:
+            lon = np.concatenate([[lon[-1] - 360.], lon, [lon[0] + 360.]])
+            data = np.concatenate(
+                [data[:, -1:], data, data[:, :1]], axis=1)
+    return lon, data
+
+
+def _pixel_indices(z, x, y, lon, lat):
+    """
+    Get the grid indices of the pixel centers of a tile.
+
+    :param z: zoom level.
+    :param x: tile column.
+    :param y: tile row.
+    :param lon: increasing 1-D grid longitudes.
+    :param lat: increasing 1-D grid latitudes.
+    :return: (rows, cols), 1-D grid row index of every pixel row and
+             column index of every pixel column, -1 outside the grid.
+    """
+    n = 2 ** z
+    pixel = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    plon = (x + pixel) / n * 360. - 180.
+    plat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2. * (y + pixel) / n))))
+    return nearest_index(lat, plat), nearest_index(lon, plon)
+
+
+def _render_tile(z, x, y):
+    """
+    Render one tile with the worker state.
+
+    :param z: zoom level.
+    :param x: tile column.
+    :param y: tile row.
+    :return: RGBA uint8 (256, 256, 4) array, None for an empty tile.
+    """
+    state = _tile_state
+    rows, cols = _pixel_indices(z, x, y, state['lon'], state['lat'])
+    if np.all(rows < 0) or np.all(cols < 0):
+        return None
+    indices = state['indices'][rows[:, None], cols[None, :]]
+    indices[(rows < 0)[:, None] | (cols < 0)[None, :]] = \
+        state['table'].shape[0] - 1
+    if not np.any(state['visible'][indices]):
+        return None
+    # gather packed 32-bit colors, faster than RGBA rows
+    return state['colors'][indices].view(np.uint8).reshape(
+        indices.shape + (4,))
+
+
+def _encode_tile(rgba, compress_level):
+    """Encode a tile to PNG bytes."""
+    buf = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(
+        buf, 'PNG', compress_level=compress_level)
+    return buf.getvalue()
+
+
+def _init_tiles(lon, lat, indices, table, outdir, compress_level):
+    """
+    Set the tile rendering state of a process.
+
+    :param lon: increasing 1-D grid longitudes.
+    :param lat: increasing 1-D grid latitudes.
+    :param indices: color table indices of the field.
+    :param table: RGBA color table.
+    :param outdir: output directory, None to return the PNG bytes.
+    :param compress_level: PNG compression level.
+    """
+    _tile_state.update({
+        'lon': lon, 'lat': lat, 'indices': indices, 'table': table,
+        'colors': np.ascontiguousarray(table).view(np.uint32).ravel(),
+        'visible': table[:, 3] > 0, 'outdir': outdir,
+        'compress_level': compress_level})
+
+
+def _render_tiles(tiles):
+    """
+    Render and save a chunk of tiles with the worker state.
+
+    :param tiles: list of (z, x, y) tuples.
+    :return: list of ((z, x, y), PNG bytes or file name) of the
+             rendered tiles.
+    """
+    state = _tile_state
+    results = []
+    for z, x, y in tiles:
+        rgba = _render_tile(z, x, y)
+        if rgba is None:
+            continue
+        png = _encode_tile(rgba, state['compress_level'])
+        if state['outdir'] is None:
+            results.append(((z, x, y), png))
+            continue
+        filename = os.path.join(
+            state['outdir'], str(z), str(x), '{}.png'.format(y))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'wb') as f:
+            f.write(png)
+        results.append(((z, x, y), filename))
+    return results
+
+
+def render_tiles(lon, lat, data, cmap, norm=None, zooms=(3, 8),
+                 outdir=None, vmin=None, vmax=None, mask_below=None,
+                 processes=0, chunksize=64, compress_level=1):
+    """
+    Render a field on a regular longitude and latitude grid as XYZ web
+    mercator tiles (256x256 RGBA PNG), colored by nearest grid cell.
+
+    :param lon: 1-D grid longitudes, in any 360 degree range like
+                -180 to 180 or 0 to 360, see `wrap_longitudes`.
+    :param lat: 1-D grid latitudes.
+    :param data: 2-D (lat, lon) field, NaN or masked values are
+                 transparent.
+    :param cmap: matplotlib color map, like from `cmap.ctables`.
+    :param norm: matplotlib normalization, or use vmin and vmax.
+    :param zooms: (first, last) zoom levels, inclusive.
+    :param outdir: write tiles as outdir/z/x/y.png, None to return
+                   the PNG bytes.
+    :param vmin: minimum value, if norm is None.
+    :param vmax: maximum value, if norm is None.
+    :param mask_below: values below this are transparent.
+    :param processes: number of worker processes, 0 to render in this
+                      process, None for the number of CPUs.
+    :param chunksize: number of tiles per worker task.
+    :param compress_level: PNG compression level.
+    :return: dictionary, {(z, x, y): file name or PNG bytes} of the
+             rendered (non empty) tiles.
+
+    >>> cmap, norm = cm_precipitation_nws()
+    >>> tiles = render_tiles(lon, lat, rain, cmap, norm, zooms=(3, 9),
+    >>>                      outdir='/data/tiles/rain', mask_below=0.1,
+    >>>                      processes=8)
+    """
+
+    # increasing coordinates, longitudes in [-180, 180)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    data = np.squeeze(data)
+    if lon.size < 2 or lat.size < 2:
+        raise ValueError("Tiles need at least two grid points along "
+                         "each axis, got {}x{}.".format(lat.size, lon.size))
+    if lat[0] > lat[-1]:
+        lat, data = lat[::-1], data[::-1, :]
+    lon, data = wrap_longitudes(lon, data)
+
+    # color the field once
+    edges, table = colormap_lut(cmap, norm=norm, vmin=vmin, vmax=vmax,
+                                mask_below=mask_below)
+    indices = apply_lut(data, (edges, table), index=True)
+
+    # tiles overlapping the grid
+    extent = (1.5 * lon[0] - 0.5 * lon[1], 1.5 * lon[-1] - 0.5 * lon[-2],
+              1.5 * lat[0] - 0.5 * lat[1], 1.5 * lat[-1] - 0.5 * lat[-2])
+    tiles = []
+    for z in range(zooms[0], zooms[1] + 1):
+        x0, x1, y0, y1 = tile_range(z, extent)
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1)
+                     for y in range(y0, y1 + 1))
+    chunks = [tiles[i:i + chunksize] for i in range(0, len(tiles), chunksize)]
+
+    args = (lon, lat, indices, table, outdir, compress_level)
+    results = {}
+    if processes == 0:
+        _init_tiles(*args)
+        for chunk in chunks:
+            results.update(_render_tiles(chunk))
+        return results
+    pool = multiprocessing.Pool(
+        processes=processes, initializer=_init_tiles, initargs=args)
+    try:
+        for chunk in pool.imap_unordered(_render_tiles, chunks):
+            results.update(chunk)
+    finally:
+        pool.close()
+        pool.join()
+    return results
@@ -4,6 +4,8 @@
 Utilities for use in making plots.
 """
 
+import io
+import weakref
 import itertools
 import string
 from datetime import datetime, timedelta
@@ -14,7 +16,16 @@ import cartopy.crs as ccrs
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as mpatheffects
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
 import matplotlib.ticker as mticker
+from dk_met_graphics.cache import array_hash
+
+
+# 2-D grid coordinates shared by the layers drawn on the same grid,
+# released when no artist uses them anymore
+_GRID_COORDS = weakref.WeakValueDictionary()
 
 
 def add_gridlines(ax, draw_labels=True, linewidth=2, color='gray', alpha=0.5,
@@ -132,7 +143,8 @@ def add_timestamp(ax, time=None, x=0.99, y=-0.04, ha='right',
 
 
 def add_model_title(title, initial_time, model='',
-                    fhour=0, fontsize=20, multilines=False, atime=0):
+                    fhour=0, fontsize=20, multilines=False, atime=0,
+                    ax=None):
     """
     Add the title information to the plot.
 
@@ -143,8 +155,11 @@ def add_model_title(title, initial_time, model='',
     :param fontsize: font size.
     :param multilines: multilines for title.
     :param atime: accumulating time.
+    :param ax: matplotlib axes, default is the pyplot current axes.
     :return: None.
     """
+    if ax is None:
+        ax = plt.gca()
     if isinstance(initial_time, np.datetime64):
         initial_time = pd.to_datetime(
             str(initial_time)).replace(tzinfo=None).to_pydatetime()
@@ -162,13 +177,155 @@ def add_model_title(title, initial_time, model='',
             fhour_str + 'h; ' + valid_str
         if model != '':
             title = '[' + model + '] ' + title
-        plt.title(title, loc='left', fontsize=fontsize)
+        ax.set_title(title, loc='left', fontsize=fontsize)
     else:
         time_str = initial_str + '\n' + fhour_str + 'h; ' + valid_str
         if model != '':
             title = '[' + model + '] ' + title
-        plt.title(title, loc='left', fontsize=fontsize)
-        plt.title(time_str, loc='right', fontsize=fontsize-2)
+        ax.set_title(title, loc='left', fontsize=fontsize)
+        ax.set_title(time_str, loc='right', fontsize=fontsize-2)
+
+
+def new_figure(figsize=None, dpi=None, pyplot=True, **kwargs):
+    """
+    Create a figure, managed by pyplot or standalone.
+    A standalone figure has its own Agg canvas and is not registered
+    with pyplot, so it can be drawn in any thread and is garbage
+    collected like any object.
+
+    :param figsize: figure size (width, height) in inches.
+    :param dpi: figure resolution.
+    :param pyplot: create the figure with pyplot or not.
+    :param kwargs: keywords passing to `matplotlib.figure.Figure`.
+    :return: `matplotlib.figure.Figure` instance.
+
+    >>> fig = new_figure(figsize=(12, 9), pyplot=False)
+    >>> ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    >>> fig.savefig('plot.png')
+    """
+    if pyplot:
+        return plt.figure(figsize=figsize, dpi=dpi, **kwargs)
+    fig = Figure(figsize=figsize, dpi=dpi, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def close_figure(fig):
+    """
+    Release a figure, closing it in pyplot if pyplot manages it.
+
+    :param fig: `matplotlib.figure.Figure` instance.
+    :return: None.
+    """
+    if getattr(fig.canvas, 'manager', None) is not None:
+        plt.close(fig)
+
+
+def figure_to_bytes(fig, format='png', compress_level=6, quantize=None,
+                    quality=80, lossless=False, dpi=None, draw=True):
+    """
+    Encode a figure to image bytes straight from the Agg buffer,
+    without temporary files.
+
+    :param fig: `matplotlib.figure.Figure` instance.
+    :param format: 'png' or 'webp'.
+    :param compress_level: PNG zlib compression level, 0 (none, fastest)
+                           to 9 (smallest).
+    :param quantize: number of palette colors (2 to 256) to reduce a
+                     PNG to an 8-bit palette image, None for RGBA.
+    :param quality: WebP quality, 0 to 100.
+    :param lossless: lossless WebP or not.
+    :param dpi: resolution, default is the figure dpi.
+    :param draw: draw the figure first, False to encode the canvas
+                 as last drawn.
+    :return: encoded image bytes.
+
+    >>> png = figure_to_bytes(fig, compress_level=1, quantize=256)
+    >>> webp = figure_to_bytes(fig, format='webp', quality=90)
+    """
+
+    # draw on an Agg canvas
+    canvas = fig.canvas
+    if not isinstance(canvas, FigureCanvasAgg):
+        canvas = FigureCanvasAgg(fig)
+    if not draw:
+        pass
+    elif dpi is not None and dpi != fig.dpi:
+        original_dpi = fig.dpi
+        fig.set_dpi(dpi)
+        try:
+            canvas.draw()
+        finally:
+            fig.set_dpi(original_dpi)
+    else:
+        canvas.draw()
+    image = Image.fromarray(np.asarray(canvas.buffer_rgba()), 'RGBA')
+
+    # encode
+    buf = io.BytesIO()
+    format = format.lower()
+    if format == 'png':
+        if quantize is not None:
+            image = image.quantize(
+                colors=quantize, method=Image.Quantize.FASTOCTREE)
+        image.save(buf, 'PNG', compress_level=compress_level)
+    elif format == 'webp':
+        image.save(buf, 'WEBP', quality=quality, lossless=lossless)
+    else:
+        raise ValueError("Unknown image format '{}', should be "
+                         "'png' or 'webp'.".format(format))
+    return buf.getvalue()
+
+
+def encode_figure(fig, encode):
+    """
+    Encode a figure with `figure_to_bytes` options.
+
+    :param fig: `matplotlib.figure.Figure` instance.
+    :param encode: format name like 'png', or a dictionary of
+                   `figure_to_bytes` keywords like
+                   {'format': 'png', 'quantize': 256}.
+    :return: encoded image bytes.
+    """
+    if isinstance(encode, str):
+        encode = {'format': encode}
+    return figure_to_bytes(fig, **encode)
+
+
+def grid_coords(lon, lat):
+    """
+    Get the 2-D coordinates of a longitude and latitude grid for
+    contour layers.
+
+    Contouring needs 2-D coordinates, and matplotlib would expand 1-D
+    coordinates with np.meshgrid for every layer, each contour set
+    keeping its own pair. The pair returned here is built once per grid
+    and shared (read-only) by all layers drawn on that grid while any
+    of them is alive. Other layers, like pcolormesh or barbs, should be
+    given the 1-D coordinates.
+
+    :param lon: 1-D grid longitudes (2-D coordinates are returned as is).
+    :param lat: 1-D grid latitudes.
+    :return: (x, y) read-only 2-D float64 arrays of shape (nlat, nlon).
+
+    >>> x, y = grid_coords(lon, lat)
+    >>> cf = ax.contourf(x, y, mslp, clevs, transform=datacrs)
+    >>> cs = ax.contour(x, y, gh500, clevs, transform=datacrs)
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    if lon.ndim != 1 or lat.ndim != 1:
+        return lon, lat
+    key = array_hash(lon, lat)
+    x = _GRID_COORDS.get(key + 'x')
+    y = _GRID_COORDS.get(key + 'y')
+    if x is None or y is None:
+        x, y = np.meshgrid(lon, lat)
+        x.flags.writeable = False
+        y.flags.writeable = False
+        _GRID_COORDS[key + 'x'] = x
+        _GRID_COORDS[key + 'y'] = y
+    return x, y
 
 
 def get_model_time_stamp(initial_time, fhour=0, atime=0):
@@ -0,0 +1,328 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Named regions (provinces, counties, river catchments) from the
+bundled shapefiles, and grid masks or label rasters built for them.
+"""
+
+import os
+from collections import OrderedDict
+import pkg_resources
+import numpy as np
+import shapefile
+import cartopy.crs as ccrs
+from shapely.geometry import shape
+from shapely.ops import unary_union, transform
+from dk_met_graphics.mask import (
+    shp_members, members_to_labels, shp_fraction, cached_grid_mask)
+
+
+_CATCHMENTS = ['changjiang', 'haihe', 'huaihe', 'huanghe', 'liaohe',
+               'songhuajiang', 'taihu', 'zhujiang']
+
+
+def _catchment_albers(central_latitude):
+    return ccrs.AlbersEqualArea(
+        central_longitude=105., central_latitude=central_latitude,
+        standard_parallels=(25., 47.), globe=ccrs.Globe(ellipse='krass'))
+
+
+# most catchment shapefiles are in Albers equal area projections
+# (Krasovsky ellipsoid) without .prj file, shapefiles not listed
+# here are in longitude and latitude.
+SHAPEFILE_CRS = {}
+for _name in _CATCHMENTS:
+    if _name in ('taihu', 'zhujiang'):
+        continue
+    for _suffix in ('', 'ziliuyu'):
+        SHAPEFILE_CRS['catchment/' + _name + _suffix] = _catchment_albers(
+            35. if _name == 'huaihe' else 0.)
+
+# region layers, shapefiles relative to resources/maps and how regions
+# are named ('record': by the name field of each record, 'file': one
+# region per shapefile named by the file).
+REGION_LAYERS = {
+    'nation': {'files': ['bou1_4p'], 'names': 'record'},
+    'province': {'files': ['bou2_4p'], 'names': 'record'},
+    'county': {'files': ['BOUNT_poly'], 'names': 'record'},
+    'catchment': {
+        'files': ['catchment/' + name for name in _CATCHMENTS],
+        'names': 'file'},
+    'subcatchment': {
+        'files': ['catchment/' + name + 'ziliuyu' for name in _CATCHMENTS
+                  if name != 'taihu'] + ['catchment/taihu'],
+        'names': 'record'}}
+
+# record fields holding the region name, searched in order
+_NAME_FIELDS = ['NAME', 'NAME99', 'ENNM']
+
+# geometries of the layers already read, {layer: {name: geometry}}
+_layer_geometries = {}
+
+
+def _layer_files(layer):
+    """
+    Get the shapefile names of a region layer.
+
+    :param layer: layer name, see `REGION_LAYERS`.
+    :return: list of (shapefile name, crs) tuples, crs is None
+             for longitude and latitude.
+    """
+
+    if layer not in REGION_LAYERS:
+        raise ValueError("Unknown region layer '{}', should be one of {}."
+                         .format(layer, sorted(REGION_LAYERS)))
+    return [(pkg_resources.resource_filename(
+        'dk_met_graphics', "resources/maps/" + name + ".shp"),
+        SHAPEFILE_CRS.get(name)) for name in REGION_LAYERS[layer]['files']]
+
+
+def _name_field(reader):
+    """
+    Find the index of the region name field of a shapefile.
+
+    :param reader: `shapefile.Reader` instance.
+    :return: record field index.
+    """
+
+    fields = [field[0].upper() for field in reader.fields[1:]]
+    for name in _NAME_FIELDS:
+        if name in fields:
+            return fields.index(name)
+    raise ValueError("No region name field in {}.".format(fields))
+
+
+def _lonlat_transformer(crs):
+    """
+    Coordinate transform function from a projection to longitude
+    and latitude, for `shapely.ops.transform`.
+
+    :param crs: source `cartopy.crs.CRS`.
+    :return: function.
+    """
+
+    def to_lonlat(x, y):
+        points = ccrs.PlateCarree().transform_points(
+            crs, np.asarray(x), np.asarray(y))
+        return points[..., 0], points[..., 1]
+    return to_lonlat
+
+
+def read_region_geometries(layer):
+    """
+    Read the region geometries of a layer in longitude and latitude.
+    Records of a shapefile sharing a name (islands of a province, for
+    example) are merged into one geometry, a name already used by
+    another shapefile is prefixed with the file name, like
+    'liaoheziliuyu:内流区'. Layers are read once per process.
+
+    :param layer: layer name, see `REGION_LAYERS`.
+    :return: ordered dictionary, {region name: shapely geometry}.
+
+    >>> geoms = read_region_geometries('province')
+    >>> print(list(geoms.keys()))
+    """
+
+    if layer in _layer_geometries:
+        return _layer_geometries[layer]
+
+    parts = OrderedDict()
+    owners = {}
+    for shpfile, crs in _layer_files(layer):
+        if not os.path.isfile(shpfile):
+            raise IOError("Region shapefile {} is missing.".format(shpfile))
+        reader = shapefile.Reader(shpfile, encoding='gbk')
+        basename = os.path.splitext(os.path.basename(shpfile))[0]
+        if REGION_LAYERS[layer]['names'] == 'file':
+            names = [basename] * len(reader)
+        else:
+            index = _name_field(reader)
+            names = [record[index].strip() for record in reader.records()]
+        for name, shp in zip(names, reader.shapes()):
+            if not name or not shp.points:
+                continue
+            if owners.setdefault(name, shpfile) != shpfile:
+                name = basename + ':' + name
+            geom = shape(shp.__geo_interface__).buffer(0)
+            if crs is not None:
+                geom = transform(_lonlat_transformer(crs), geom)
+            parts.setdefault(name, []).append(geom)
+
+    geoms = OrderedDict(
+        (name, geom[0] if len(geom) == 1 else unary_union(geom))
+        for name, geom in parts.items())
+    _layer_geometries[layer] = geoms
+    return geoms
+
+
+class RegionMasker(object):
+    """
+    Build grid masks for the named regions of a boundary layer.
+    All requested regions are rasterized together into the grid points
+    of every region (regions of a layer may overlap, like the
+    changjiang and taihu catchments), and the memberships and label
+    rasters are cached in memory and on disk (see
+    `mask.cached_grid_mask`).
+
+    >>> masker = RegionMasker('province')
+    >>> lon = np.arange(100, 125, 0.05)
+    >>> lat = np.arange(25, 45, 0.05)
+    >>> masks = masker.masks(lon, lat, ['北京市', '天津市', '河北省'])
+    >>> labels, names = masker.label_raster(lon, lat)
+    >>> basin = RegionMasker('catchment').mask(lon, lat, 'changjiang')
+    """
+
+    def __init__(self, layer='province'):
+        """
+        :param layer: region layer name, 'nation', 'province', 'county',
+                      'catchment' (changjiang, haihe, huaihe, huanghe,
+                      liaohe, songhuajiang, taihu, zhujiang) or
+                      'subcatchment'.
+        """
+        self.layer = layer
+        self.files = [name for name, _ in _layer_files(layer)]
+
+    @property
+    def geometries(self):
+        """Ordered dictionary of region geometries."""
+        return read_region_geometries(self.layer)
+
+    @property
+    def names(self):
+        """Names of all regions in the layer."""
+        return list(self.geometries.keys())
+
+    def _match(self, region):
+        """
+        Resolve a region name, a unique prefix (like '河北' for
+        '河北省') is accepted.
+
+        :param region: region name.
+        :return: full region name.
+        """
+        if region in self.geometries:
+            return region
+        matches = [name for name in self.geometries if
+                   name.startswith(region)]
+        if len(matches) != 1:
+            raise KeyError("Region '{}' {} in layer '{}'.".format(
+                region, 'is ambiguous' if matches else 'not found',
+                self.layer))
+        return matches[0]
+
+    def _names(self, regions):
+        """
+        Resolve region names, None for all regions.
+
+        :param regions: region name or list of region names.
+        :return: list of full region names.
+        """
+        if regions is None:
+            return self.names
+        if isinstance(regions, str):
+            regions = [regions]
+        return [self._match(region) for region in regions]
+
+    def members(self, lon, lat, regions=None, cache=True):
+        """
+        Find the grid points inside every region, see
+        `mask.shp_members`. A grid point inside overlapping regions
+        belongs to all of them.
+
+        :param lon: grid longitude coordinates.
+        :param lat: grid latitude coordinates.
+        :param regions: list of region names, None for all regions.
+        :param cache: use the on-disk cache or not.
+        :return: (zones, cells, names), the index in names and the
+                 flat grid index of every membership, zones ascending.
+        """
+        names = self._names(regions)
+
+        def builder():
+            return np.stack(shp_members(
+                [self.geometries[name] for name in names], lon, lat))
+
+        zones, cells = cached_grid_mask(
+            self.files, (self.layer, names, 'members'), lon, lat, builder,
+            cache=cache)
+        return zones, cells, names
+
+    def label_raster(self, lon, lat, regions=None, overlap='first',
+                     cache=True):
+        """
+        Build the integer label raster of regions.
+
+        :param lon: grid longitude coordinates.
+        :param lat: grid latitude coordinates.
+        :param regions: list of region names, None for all regions.
+        :param overlap: label of the grid points inside several
+                        regions, 'first' (the region listed first),
+                        'last' (the region listed last) or 'raise'
+                        (ValueError if regions overlap).
+        :param cache: use the on-disk cache or not.
+        :return: (labels, names), labels is an int32 2-D array with
+                 0 outside all regions and i+1 inside names[i].
+        """
+        zones, cells, names = self.members(lon, lat, regions, cache=cache)
+        labels = members_to_labels(
+            zones, cells, (np.size(lat), np.size(lon)), overlap=overlap,
+            names=names)
+        return labels, names
+
+    def masks(self, lon, lat, regions=None, cache=True):
+        """
+        Build boolean grid masks of regions, overlapping regions
+        share their common grid points.
+
+        :param lon: grid longitude coordinates.
+        :param lat: grid latitude coordinates.
+        :param regions: list of region names, None for all regions.
+        :param cache: use the on-disk cache or not.
+        :return: ordered dictionary, {region name: boolean 2-D array}.
+        """
+        zones, cells, names = self.members(lon, lat, regions, cache=cache)
+        starts = np.searchsorted(zones, np.arange(len(names) + 1))
+        masks = OrderedDict()
+        for i, name in enumerate(names):
+            mask = np.zeros((np.size(lat), np.size(lon)), dtype=bool)
+            mask.flat[cells[starts[i]:starts[i + 1]]] = True
+            masks[name] = mask
+        return masks
+
+    def mask(self, lon, lat, regions, cache=True):
+        """
+        Build one boolean grid mask covering all given regions.
+
+        :param lon: grid longitude coordinates.
+        :param lat: grid latitude coordinates.
+        :param regions: region name or list of region names.
+        :param cache: use the on-disk cache or not.
+        :return: boolean 2-D array, True inside the regions.
+        """
+        _, cells, _ = self.members(lon, lat, regions, cache=cache)
+        mask = np.zeros((np.size(lat), np.size(lon)), dtype=bool)
+        mask.flat[cells] = True
+        return mask
+
+    def fraction(self, lon, lat, regions, cache=True):
+        """
+        Compute the fraction of each grid cell covered by regions,
+        see `mask.shp_fraction`. Suited to coarse model grids.
+
+        :param lon: grid longitude coordinates.
+        :param lat: grid latitude coordinates.
+        :param regions: region name or list of region names.
+        :param cache: use the on-disk cache or not.
+        :return: float32 2-D array, covered fraction from 0 to 1.
+        """
+        names = self._names(regions)
+
+        def builder():
+            geoms = [self.geometries[name] for name in names]
+            return shp_fraction(
+                geoms[0] if len(geoms) == 1 else unary_union(geoms),
+                lon, lat)
+
+        return cached_grid_mask(
+            self.files, (self.layer, names, 'fraction'), lon, lat, builder,
+            cache=cache)
@@ -0,0 +1,568 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Compiled boundary store.
+
+The bundled shapefiles under resources/maps are converted once into
+memory-mappable numpy files: a flat float32 (N, 2) coordinate array
+and offset indices from records to polygons (or lines), polygons to
+rings and rings to coordinates. Loading a layer maps the files
+without parsing, and rings are served as views of the coordinates.
+A packed R-tree over the polygon (or line) bounding boxes is built at
+load time for extent queries.
+
+Every layer is also stored at coarser levels of detail, simplified so
+that borders shared by neighbouring polygons stay coincident: rings
+are cut into chains at the vertices where the set of sharing rings
+changes, and each chain is simplified on its own, in a canonical
+direction, so both sides of a border get the same vertices.
+"""
+
+import os
+import json
+import pkg_resources
+import numpy as np
+import shapefile
+from shapely.geometry import (
+    Polygon, MultiPolygon, LineString, MultiLineString)
+from dk_met_graphics.cache import get_cache_dir, shapefile_hash
+
+
+# shapefiles under resources/maps compiled by `build_boundary_store`
+BOUNDARY_NAMES = ['bou1_4l', 'bou1_4p', 'bou2_4l', 'bou2_4p', 'BOUNT_line',
+                  'BOUNT_poly', 'country1', 'hyd1_4l', 'hyd1_4p', 'hyd2_4l',
+                  'hyd2_4p', 'HuRB']
+
+# arrays of a compiled layer
+_STORE_ARRAYS = ['coords', 'ring_offsets', 'part_offsets',
+                 'geom_offsets', 'bounds']
+
+# simplification tolerance (degrees) of each level of detail,
+# level 0 is the original shapefile
+LOD_TOLERANCES = [0., 0.005, 0.02, 0.08]
+
+# number of parts per node of the packed R-tree
+INDEX_NODE_SIZE = 16
+
+# layers already loaded, {store directory: BoundaryLayer}
+_loaded_layers = {}
+
+
+def _boundary_shpfile(name):
+    """
+    Get the shapefile of a boundary name.
+
+    :param name: shapefile name under resources/maps without
+                 extension, or a shapefile path.
+    :return: shapefile path.
+    """
+
+    if os.path.splitext(name)[1] == '.shp' or os.path.isabs(name):
+        return name
+    return pkg_resources.resource_filename(
+        'dk_met_graphics', "resources/maps/" + name + ".shp")
+
+
+def _store_dir(shpfile, store_dir=None, level=0):
+    """
+    Get the compiled store directory of a shapefile, named by the
+    shapefile and its content hash so a changed file is recompiled.
+
+    :param shpfile: shapefile path.
+    :param store_dir: root directory of the store, default is
+                      `dk_met_graphics.cache.get_cache_dir('boundary')`.
+    :param level: level of detail, see `LOD_TOLERANCES`.
+    :return: directory path.
+    """
+
+    if store_dir is None:
+        store_dir = get_cache_dir('boundary')
+    name = os.path.splitext(os.path.basename(shpfile))[0]
+    name = name + '-' + shapefile_hash(shpfile)[:16]
+    if level > 0:
+        name = name + '-lod{}'.format(level)
+    return os.path.join(store_dir, name)
+
+
+def _write_store(arrays, meta, outdir):
+    """
+    Write the arrays of a compiled layer.
+
+    :param arrays: dictionary of the `_STORE_ARRAYS` arrays.
+    :param meta: dictionary saved as meta.json.
+    :param outdir: output directory.
+    :return: output directory.
+    """
+
+    # write to a temporary directory, then move in place
+    os.makedirs(os.path.dirname(os.path.abspath(outdir)), exist_ok=True)
+    tmpdir = outdir + '.tmp{}'.format(os.getpid())
+    os.makedirs(tmpdir, exist_ok=True)
+    for name in _STORE_ARRAYS:
+        np.save(os.path.join(tmpdir, name + '.npy'), arrays[name])
+    with open(os.path.join(tmpdir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmpdir, outdir)
+    except OSError:
+        # compiled meanwhile by another process
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+    return outdir
+
+
+def compile_shapefile(shpfile, outdir):
+    """
+    Compile a shapefile into the boundary store format.
+
+    :param shpfile: shapefile path.
+    :param outdir: output directory.
+    :return: output directory.
+    """
+
+    if not os.path.isfile(shpfile):
+        raise IOError("Boundary shapefile {} is missing.".format(shpfile))
+
+    reader = shapefile.Reader(shpfile)
+    coords, ring_offsets, part_offsets = [], [0], [0]
+    geom_offsets, bounds = [0], []
+    kind = None
+    for shp in reader.shapes():
+        if shp.shapeType == shapefile.NULL or not shp.points:
+            parts = []
+        elif shp.shapeType in (shapefile.POLYGON, shapefile.POLYGONZ,
+                               shapefile.POLYGONM):
+            kind = 'Polygon'
+            geo = shp.__geo_interface__
+            parts = (geo['coordinates'] if geo['type'] == 'MultiPolygon'
+                     else [geo['coordinates']])
+        elif shp.shapeType in (shapefile.POLYLINE, shapefile.POLYLINEZ,
+                               shapefile.POLYLINEM):
+            kind = 'LineString'
+            geo = shp.__geo_interface__
+            parts = ([[line] for line in geo['coordinates']]
+                     if geo['type'] == 'MultiLineString'
+                     else [[geo['coordinates']]])
+        else:
+            raise ValueError("Only polygon and line shapefiles can be "
+                             "compiled, {} is not.".format(shpfile))
+
+        for rings in parts:
+            for ring in rings:
+                ring = np.asarray(ring, dtype=np.float32)[:, :2]
+                coords.append(ring)
+                ring_offsets.append(ring_offsets[-1] + ring.shape[0])
+            part_offsets.append(part_offsets[-1] + len(rings))
+        geom_offsets.append(len(part_offsets) - 1)
+        bounds.append(shp.bbox if parts else [np.nan] * 4)
+
+    arrays = {
+        'coords': (np.concatenate(coords) if coords else
+                   np.zeros((0, 2), dtype=np.float32)),
+        'ring_offsets': np.asarray(ring_offsets, dtype=np.int64),
+        'part_offsets': np.asarray(part_offsets, dtype=np.int64),
+        'geom_offsets': np.asarray(geom_offsets, dtype=np.int64),
+        'bounds': np.asarray(bounds, dtype=np.float64).reshape(-1, 4)}
+    return _write_store(arrays, {'geom_type': kind or 'Polygon',
+                                 'source': os.path.basename(shpfile),
+                                 'tolerance': 0.}, outdir)
+
+
+def _simplify_chain(chain, tolerance):
+    """
+    Douglas-Peucker simplification of a chain keeping its end points,
+    run in a canonical direction so a chain shared by two rings in
+    opposite directions is simplified the same way.
+
+    :param chain: (n, 2) array.
+    :param tolerance: simplification tolerance.
+    :return: (m, 2) array.
+    """
+    if chain.shape[0] <= 2:
+        return chain
+    reverse = tuple(chain[-1]) < tuple(chain[0])
+    if reverse:
+        chain = chain[::-1]
+    simplified = np.asarray(LineString(chain).simplify(
+        tolerance, preserve_topology=False).coords, dtype=chain.dtype)
+    if simplified.shape[0] < 2:
+        simplified = chain[[0, -1]]
+    return simplified[::-1] if reverse else simplified
+
+
+def _simplify_ring(ring, share, tolerance, closed):
+    """
+    Simplify a ring (or line) chain by chain, the chains are cut at
+    the vertices where the number of sharing rings changes.
+
+    :param ring: (n, 2) ring coordinates, closed rings repeat the
+                 first vertex at the end.
+    :param share: number of rings sharing each vertex.
+    :param tolerance: simplification tolerance.
+    :param closed: the ring is a polygon ring or not.
+    :return: (m, 2) array, None if the ring collapsed.
+    """
+
+    if closed:
+        points, share = ring[:-1], share[:-1]
+        if points.shape[0] < 3:
+            return None
+        pinned = (share != np.roll(share, 1)) | (share != np.roll(share, -1))
+    else:
+        points = ring
+        if points.shape[0] < 2:
+            return None
+        pinned = np.zeros(points.shape[0], dtype=bool)
+        pinned[[0, -1]] = True
+        pinned[1:] |= share[1:] != share[:-1]
+        pinned[:-1] |= share[:-1] != share[1:]
+    pins = list(np.flatnonzero(pinned))
+
+    # a ring without junctions is cut at its first and farthest vertex
+    if closed and len(pins) < 2:
+        first = pins[0] if pins else 0
+        distance = np.sum((points - points[first]) ** 2, axis=1)
+        pins = sorted([first, int(np.argmax(distance))])
+        if pins[0] == pins[1]:
+            return None
+
+    # simplify the chains between pins
+    if closed:
+        n = points.shape[0]
+        points = np.concatenate([points, points])
+        pins = pins + [pins[0] + n]
+    chains = [_simplify_chain(points[a:b + 1], tolerance)[:-1]
+              for a, b in zip(pins[:-1], pins[1:])]
+    chains.append(points[pins[-1]][None, :])
+    if closed:
+        chains = chains[:-1] + [chains[0][:1]]
+    result = np.concatenate(chains)
+    if result.shape[0] < (4 if closed else 2):
+        return None
+    return result
+
+
+def simplify_layer(layer, tolerance):
+    """
+    Derive a simplified level of detail from a compiled layer. Borders
+    shared by neighbouring polygons stay coincident, rings collapsing
+    below the tolerance are dropped.
+
+    :param layer: `BoundaryLayer` instance.
+    :param tolerance: simplification tolerance in degrees.
+    :return: dictionary of the `_STORE_ARRAYS` arrays.
+    """
+
+    coords = np.ascontiguousarray(layer.coords, dtype=np.float32)
+    ring_offsets = np.asarray(layer.ring_offsets)
+    part_offsets = np.asarray(layer.part_offsets)
+    geom_offsets = np.asarray(layer.geom_offsets)
+    closed = layer.geom_type == 'Polygon'
+
+    # number of distinct rings sharing each vertex
+    rings = np.repeat(np.arange(ring_offsets.size - 1), np.diff(ring_offsets))
+    vertex = coords.view(np.int64).ravel()
+    pairs = np.unique(np.stack([vertex, rings], axis=1), axis=0)
+    unique, counts = np.unique(pairs[:, 0], return_counts=True)
+    share = counts[np.searchsorted(unique, vertex)]
+
+    new_coords, new_rings, new_parts, new_geoms = [], [0], [0], [0]
+    for g in range(geom_offsets.size - 1):
+        for p in range(geom_offsets[g], geom_offsets[g + 1]):
+            nring = 0
+            for r in range(part_offsets[p], part_offsets[p + 1]):
+                r0, r1 = ring_offsets[r], ring_offsets[r + 1]
+                ring = _simplify_ring(
+                    coords[r0:r1], share[r0:r1], tolerance, closed)
+                if ring is None:
+                    # polygons without exterior are dropped
+                    if nring == 0 and closed:
+                        break
+                    continue
+                new_coords.append(ring)
+                new_rings.append(new_rings[-1] + ring.shape[0])
+                nring += 1
+            if nring > 0:
+                new_parts.append(new_parts[-1] + nring)
+        new_geoms.append(len(new_parts) - 1)
+
+    return {
+        'coords': (np.concatenate(new_coords) if new_coords else
+                   np.zeros((0, 2), dtype=np.float32)),
+        'ring_offsets': np.asarray(new_rings, dtype=np.int64),
+        'part_offsets': np.asarray(new_parts, dtype=np.int64),
+        'geom_offsets': np.asarray(new_geoms, dtype=np.int64),
+        'bounds': np.asarray(layer.bounds, dtype=np.float64)}
+
+
+def compile_levels(shpfile, store_dir=None):
+    """
+    Compile a shapefile and all its levels of detail, levels already
+    in the store are skipped.
+
+    :param shpfile: shapefile path.
+    :param store_dir: root directory of the store.
+    :return: list of compiled layer directories, one per level.
+    """
+
+    outdir = _store_dir(shpfile, store_dir)
+    if not os.path.isdir(outdir):
+        compile_shapefile(shpfile, outdir)
+    outdirs = [outdir]
+    for level in range(1, len(LOD_TOLERANCES)):
+        leveldir = _store_dir(shpfile, store_dir, level)
+        if not os.path.isdir(leveldir):
+            layer = BoundaryLayer(outdir)
+            _write_store(
+                simplify_layer(layer, LOD_TOLERANCES[level]),
+                {'geom_type': layer.geom_type, 'source': layer.source,
+                 'tolerance': LOD_TOLERANCES[level]}, leveldir)
+        outdirs.append(leveldir)
+    return outdirs
+
+
+def select_level(tolerance):
+    """
+    Select the coarsest level of detail whose simplification
+    tolerance does not exceed a drawing tolerance.
+
+    :param tolerance: drawing tolerance in degrees, like the size
+                      of half a pixel.
+    :return: level index of `LOD_TOLERANCES`.
+    """
+    return max(level for level, value in enumerate(LOD_TOLERANCES)
+               if value <= tolerance)
+
+
+def build_boundary_store(names=None, store_dir=None):
+    """
+    One-time build step compiling the bundled boundary shapefiles
+    at all levels of detail, missing shapefiles are skipped.
+
+    :param names: shapefile names under resources/maps, default is
+                  `BOUNDARY_NAMES`.
+    :param store_dir: root directory of the store.
+    :return: list of compiled layer directories.
+
+    >>> build_boundary_store()
+    """
+
+    outdirs = []
+    for name in (BOUNDARY_NAMES if names is None else names):
+        shpfile = _boundary_shpfile(name)
+        if not os.path.isfile(shpfile):
+            continue
+        outdirs.extend(compile_levels(shpfile, store_dir))
+    return outdirs
+
+
+def _extent_overlaps(bounds, extent):
+    """
+    Test bounding boxes against an extent, NaN boxes never overlap.
+
+    :param bounds: (n, 4) array of (xmin, ymin, xmax, ymax).
+    :param extent: (xmin, xmax, ymin, ymax) tuple.
+    :return: boolean array.
+    """
+    with np.errstate(invalid='ignore'):
+        return ((bounds[:, 0] <= extent[1]) & (bounds[:, 2] >= extent[0]) &
+                (bounds[:, 1] <= extent[3]) & (bounds[:, 3] >= extent[2]))
+
+
+def pack_rtree(bounds, node_size=INDEX_NODE_SIZE):
+    """
+    Build a one-level packed R-tree (sort-tile-recursive order) over
+    bounding boxes.
+
+    :param bounds: (n, 4) array of (xmin, ymin, xmax, ymax).
+    :param node_size: number of boxes per node.
+    :return: (order, node_bounds), the box indices in tree order and
+             the (nnode, 4) bounds of every run of node_size boxes.
+    """
+
+    n = bounds.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4))
+    cx = np.nan_to_num(bounds[:, 0] + bounds[:, 2])
+    cy = np.nan_to_num(bounds[:, 1] + bounds[:, 3])
+
+    # sort by x into vertical slices, then by y inside each slice
+    nslice = int(np.ceil(np.sqrt(np.ceil(n / float(node_size)))))
+    slice_size = nslice * node_size
+    order = np.argsort(cx, kind='mergesort')
+    slices = np.arange(n) // slice_size
+    order = order[np.lexsort((cy[order], slices))]
+
+    # node bounds, empty boxes are ignored
+    starts = np.arange(0, n, node_size)
+    sorted_bounds = bounds[order]
+    lo = np.where(np.isnan(sorted_bounds[:, :2]), np.inf, sorted_bounds[:, :2])
+    hi = np.where(np.isnan(sorted_bounds[:, 2:]), -np.inf,
+                  sorted_bounds[:, 2:])
+    node_bounds = np.hstack([np.minimum.reduceat(lo, starts, axis=0),
+                             np.maximum.reduceat(hi, starts, axis=0)])
+    return order, node_bounds
+
+
+class BoundaryLayer(object):
+    """
+    A compiled boundary layer, arrays are memory-mapped read-only.
+
+    >>> layer = load_boundary('bou2_4p')
+    >>> ring = layer.ring(0)          # (n, 2) float32 view
+    >>> geoms = list(layer.geometries())
+    >>> parts = layer.query((107, 123, 28, 43))
+    >>> polygons = [layer.part_geometry(p) for p in parts]
+    """
+
+    def __init__(self, path):
+        """
+        :param path: compiled layer directory.
+        """
+        self.path = path
+        for name in _STORE_ARRAYS:
+            setattr(self, name, np.load(
+                os.path.join(path, name + '.npy'), mmap_mode='r'))
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.geom_type = meta['geom_type']
+        self.source = meta['source']
+        self.tolerance = meta.get('tolerance', 0.)
+
+        # bounding box of every part from its first (exterior) ring,
+        # rings are contiguous so one reduceat covers them all
+        ring_offsets = np.asarray(self.ring_offsets)
+        filled = np.diff(ring_offsets) > 0
+        ring_bounds = np.full((ring_offsets.size - 1, 4), np.nan)
+        if np.any(filled):
+            coords = np.asarray(self.coords, dtype=np.float64)
+            starts = ring_offsets[:-1][filled]
+            ring_bounds[filled, :2] = np.minimum.reduceat(coords, starts, 0)
+            ring_bounds[filled, 2:] = np.maximum.reduceat(coords, starts, 0)
+        self.part_bounds = ring_bounds[np.asarray(self.part_offsets)[:-1]]
+        self.part_records = np.repeat(
+            np.arange(len(self)), np.diff(self.geom_offsets))
+
+        # packed R-tree over the parts
+        self.index_order, self.index_bounds = pack_rtree(self.part_bounds)
+
+    def __len__(self):
+        return self.geom_offsets.size - 1
+
+    def ring(self, i):
+        """
+        Coordinates of a ring (or line), a view of the store.
+
+        :param i: ring index.
+        :return: (n, 2) float32 array.
+        """
+        return self.coords[self.ring_offsets[i]:self.ring_offsets[i + 1]]
+
+    def parts(self, i):
+        """
+        Rings of each part (polygon or line) of a record.
+
+        :param i: record index.
+        :return: list of lists of (n, 2) float32 arrays, the first ring
+                 of a polygon is the exterior and the others holes.
+        """
+        p0, p1 = self.geom_offsets[i], self.geom_offsets[i + 1]
+        return [[self.ring(r) for r in range(
+            self.part_offsets[p], self.part_offsets[p + 1])]
+            for p in range(p0, p1)]
+
+    def geometry(self, i):
+        """
+        Build the shapely geometry of a record.
+
+        :param i: record index.
+        :return: shapely geometry, None for empty records.
+        """
+        parts = self.parts(i)
+        if not parts:
+            return None
+        if self.geom_type == 'Polygon':
+            polygons = [Polygon(rings[0], rings[1:]) for rings in parts]
+            return polygons[0] if len(polygons) == 1 else \
+                MultiPolygon(polygons)
+        lines = [LineString(rings[0]) for rings in parts]
+        return lines[0] if len(lines) == 1 else MultiLineString(lines)
+
+    def query(self, extent):
+        """
+        Find the parts (polygons or lines) whose bounding boxes overlap
+        an extent, with the packed R-tree.
+
+        :param extent: (lonmin, lonmax, latmin, latmax) tuple.
+        :return: sorted array of part indices.
+        """
+        nodes = np.flatnonzero(_extent_overlaps(self.index_bounds, extent))
+        if nodes.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.concatenate([self.index_order[
+            i * INDEX_NODE_SIZE:(i + 1) * INDEX_NODE_SIZE] for i in nodes])
+        return np.sort(candidates[_extent_overlaps(
+            self.part_bounds[candidates], extent)])
+
+    def part_geometry(self, p):
+        """
+        Build the shapely geometry of a part.
+
+        :param p: part index.
+        :return: shapely Polygon or LineString.
+        """
+        rings = [self.ring(r) for r in range(
+            self.part_offsets[p], self.part_offsets[p + 1])]
+        if self.geom_type == 'Polygon':
+            return Polygon(rings[0], rings[1:])
+        return LineString(rings[0])
+
+    def geometries(self, indices=None):
+        """
+        Iterate over the shapely geometries of records.
+
+        :param indices: record indices, None for all records.
+        :return: generator of shapely geometries.
+        """
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            geom = self.geometry(i)
+            if geom is not None:
+                yield geom
+
+
+def load_boundary(name, store_dir=None, level=0):
+    """
+    Load a compiled boundary layer, compiling the shapefile first if
+    it is not in the store yet. Layers are loaded once per process.
+
+    :param name: shapefile name under resources/maps without extension,
+                 like 'bou2_4p', or a shapefile path.
+    :param store_dir: root directory of the store.
+    :param level: level of detail, 0 for the original geometries,
+                  see `LOD_TOLERANCES` and `select_level`.
+    :return: `BoundaryLayer` instance.
+
+    >>> layer = load_boundary('hyd1_4l')
+    >>> thumbnail = load_boundary('bou2_4p', level=3)
+    """
+
+    shpfile = _boundary_shpfile(name)
+    if not os.path.isfile(shpfile):
+        raise IOError("Boundary shapefile {} is missing.".format(shpfile))
+    path = _store_dir(shpfile, store_dir, level)
+    if path not in _loaded_layers:
+        if not os.path.isdir(path):
+            if level == 0:
+                compile_shapefile(shpfile, path)
+            else:
+                compile_levels(shpfile, store_dir)
+        _loaded_layers[path] = BoundaryLayer(path)
+    return _loaded_layers[path]
+
+
+if __name__ == '__main__':
+    for outdir in build_boundary_store():
+        print(outdir)
@@ -0,0 +1,247 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Zonal statistics of gridded fields over label rasters, like the
+province or catchment label rasters of `region.RegionMasker`.
+"""
+
+import numpy as np
+import pandas as pd
+from dk_met_graphics.region import RegionMasker
+
+
+ZONAL_STATS = ('mean', 'sum', 'max', 'min', 'count', 'std')
+
+
+def _zone_order(labels, nzones):
+    """
+    Sort the grid cells of the zones by zone.
+
+    :param labels: flat integer label array.
+    :param nzones: number of zones.
+    :return: (order, starts, counts), the flat indices of the cells
+             inside zones grouped by zone, the start position and the
+             number of cells of every zone in that order.
+    """
+
+    inside = np.flatnonzero((labels > 0) & (labels <= nzones))
+    order = inside[np.argsort(labels[inside], kind='mergesort')]
+    counts = np.bincount(labels[order] - 1, minlength=nzones)
+    starts = np.cumsum(counts) - counts
+    return order, starts, counts
+
+
+def _member_order(zones, cells, nzones):
+    """
+    Sort zone memberships by zone, a cell may belong to several zones.
+
+    :param zones: zone index of every membership.
+    :param cells: flat cell index of every membership.
+    :param nzones: number of zones.
+    :return: (order, starts, counts), see `_zone_order`.
+    """
+
+    zones = np.asarray(zones, dtype=np.int64)
+    cells = np.asarray(cells, dtype=np.int64)
+    keep = (zones >= 0) & (zones < nzones)
+    zones, cells = zones[keep], cells[keep]
+    sort = np.argsort(zones, kind='mergesort')
+    counts = np.bincount(zones, minlength=nzones)
+    starts = np.cumsum(counts) - counts
+    return cells[sort], starts, counts
+
+
+def _segment_reduce(ufunc, values, starts, counts, empty):
+    """
+    Reduce each zone segment of the rows of a 2-D array.
+
+    :param ufunc: numpy ufunc, like np.maximum.
+    :param values: (nfield, ncell) array sorted by zone.
+    :param starts: start position of every zone.
+    :param counts: number of cells of every zone.
+    :param empty: value for zones without cells.
+    :return: (nfield, nzones) array.
+    """
+
+    result = np.full((values.shape[0], starts.size), empty)
+    filled = counts > 0
+    if values.shape[1] > 0 and np.any(filled):
+        result[:, filled] = ufunc.reduceat(values, starts[filled], axis=1)
+    return result
+
+
+def zonal_stats(data, labels, nzones=None, stats=('mean', 'max', 'sum'),
+                percentiles=None, lat=None, weighted=False):
+    """
+    Compute statistics of fields for all zones of a label raster in
+    one pass, missing values (NaN or masked) are ignored.
+
+    :param data: 2-D (lat, lon) field or 3-D (time, lat, lon) stack.
+    :param labels: integer 2-D label array, 0 outside all zones and
+                   i+1 inside zone i, see `region.RegionMasker`; or a
+                   (zones, cells) tuple of the zone index and flat
+                   grid index of every membership, for zones that
+                   overlap, see `region.RegionMasker.members`.
+    :param nzones: number of zones, default is the largest label
+                   (or zone index + 1).
+    :param stats: statistics names, from 'mean', 'sum', 'max', 'min',
+                  'count' and 'std'.
+    :param percentiles: percentiles to compute, like [50, 90, 99].
+    :param lat: 1-D grid latitudes, needed if weighted is True.
+    :param weighted: weight the mean and standard deviation with the
+                     cell area, proportional to cos(lat).
+    :return: dictionary, {statistics name: array}, the arrays have
+             shape (nzones,) for a 2-D field and (ntime, nzones) for a
+             stack; percentiles are named like 'p90'.
+
+    >>> labels, names = RegionMasker('province').label_raster(lon, lat)
+    >>> result = zonal_stats(rain, labels, nzones=len(names),
+    >>>                      stats=['mean', 'max'], percentiles=[90],
+    >>>                      lat=lat, weighted=True)
+    """
+
+    for name in stats:
+        if name not in ZONAL_STATS:
+            raise ValueError("Unknown statistics '{}', should be in {}."
+                             .format(name, ZONAL_STATS))
+
+    # flatten the fields to (nfield, ncell)
+    data = np.ma.filled(np.ma.asarray(data, dtype=np.float64), np.nan)
+    single = data.ndim == 2
+    ncell = int(np.prod(data.shape[-2:]))
+    values = data.reshape(-1, ncell)
+    if isinstance(labels, tuple):
+        zones, cells = labels
+        if np.size(cells) > 0 and (np.min(cells) < 0 or
+                                   np.max(cells) >= ncell):
+            raise ValueError("Membership cells are outside the field "
+                             "shape {}.".format(data.shape))
+        if nzones is None:
+            nzones = int(np.max(zones)) + 1 if np.size(zones) > 0 else 0
+        order, starts, counts = _member_order(zones, cells, nzones)
+    else:
+        labels = np.asarray(labels)
+        if data.shape[-2:] != labels.shape:
+            raise ValueError("Field shape {} does not match labels shape "
+                             "{}.".format(data.shape, labels.shape))
+        labels = labels.ravel()
+        if nzones is None:
+            nzones = int(labels.max()) if labels.size > 0 else 0
+        order, starts, counts = _zone_order(labels, nzones)
+
+    # cell weights
+    if weighted:
+        if lat is None:
+            raise ValueError("Area weighting needs the grid latitudes.")
+        weights = np.broadcast_to(
+            np.cos(np.deg2rad(np.asarray(lat, dtype=np.float64)))[:, None],
+            data.shape[-2:]).ravel()
+    else:
+        weights = None
+
+    # group the cells by zone once for all fields
+    values = values[:, order]
+    valid = ~np.isnan(values)
+    zero = np.where(valid, values, 0.)
+    w = valid.astype(np.float64)
+    if weights is not None:
+        w *= weights[order]
+
+    result = {}
+    count = _segment_reduce(np.add, valid.astype(np.int64),
+                            starts, counts, 0)
+    wsum = _segment_reduce(np.add, w, starts, counts, 0.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'count' in stats:
+            result['count'] = count
+        if 'sum' in stats:
+            total = _segment_reduce(np.add, zero, starts, counts, 0.)
+            result['sum'] = np.where(count > 0, total, np.nan)
+        if 'mean' in stats or 'std' in stats:
+            mean = _segment_reduce(
+                np.add, zero * w, starts, counts, 0.) / wsum
+            if 'mean' in stats:
+                result['mean'] = mean
+            if 'std' in stats:
+                zone = np.repeat(np.arange(nzones), counts)
+                anomaly = np.where(valid, values - mean[:, zone], 0.)
+                result['std'] = np.sqrt(_segment_reduce(
+                    np.add, anomaly * anomaly * w, starts, counts, 0.) / wsum)
+        if 'max' in stats:
+            result['max'] = np.where(count > 0, _segment_reduce(
+                np.maximum, np.where(valid, values, -np.inf),
+                starts, counts, -np.inf), np.nan)
+        if 'min' in stats:
+            result['min'] = np.where(count > 0, _segment_reduce(
+                np.minimum, np.where(valid, values, np.inf),
+                starts, counts, np.inf), np.nan)
+
+    # percentiles, sort the values inside every zone segment
+    if percentiles is not None:
+        zone = np.repeat(np.arange(nzones), counts)
+        q = np.asarray(percentiles, dtype=np.float64) / 100.
+        pvalues = np.full((len(q), values.shape[0], nzones), np.nan)
+        for i, row in enumerate(values):
+            # NaN sort to the end of every zone segment
+            segment = np.lexsort((row, zone))
+            row = row[segment]
+            nvalid = count[i]
+            filled = nvalid > 0
+            for j, qj in enumerate(q):
+                # linear interpolation between closest ranks
+                pos = starts + qj * (nvalid - 1)
+                lo = np.floor(pos).astype(np.int64)
+                hi = np.minimum(lo + 1, starts + nvalid - 1)
+                frac = pos - lo
+                pvalues[j, i, filled] = (
+                    row[lo[filled]] * (1 - frac[filled]) +
+                    row[hi[filled]] * frac[filled])
+        for qj, pv in zip(percentiles, pvalues):
+            result['p{:g}'.format(qj)] = pv
+
+    if single:
+        result = {name: value[0] for name, value in result.items()}
+    return result
+
+
+def region_stats(data, lon, lat, layer='province', regions=None,
+                 stats=('mean', 'max', 'sum'), percentiles=None,
+                 weighted=True, cache=True):
+    """
+    Compute statistics of fields over the named regions of a boundary
+    layer, like per-province or per-basin areal mean precipitation.
+    Every region gets all its grid cells, also where regions overlap.
+
+    :param data: 2-D (lat, lon) field or 3-D (time, lat, lon) stack.
+    :param lon: 1-D grid longitudes.
+    :param lat: 1-D grid latitudes.
+    :param layer: region layer, see `region.REGION_LAYERS`.
+    :param regions: list of region names, None for all regions.
+    :param stats: statistics names, see `zonal_stats`.
+    :param percentiles: percentiles to compute, like [50, 90, 99].
+    :param weighted: weight the mean with the cell area.
+    :param cache: use the on-disk label raster cache or not.
+    :return: pandas data frame, statistics columns indexed by region
+             name, or by (time index, region name) for a stack.
+
+    >>> df = region_stats(rain, lon, lat, layer='catchment',
+    >>>                   stats=['mean', 'max'], percentiles=[90])
+    """
+
+    if np.shape(data)[-2:] != (np.size(lat), np.size(lon)):
+        raise ValueError("Field shape {} does not match the grid ({}, {})."
+                         .format(np.shape(data), np.size(lat), np.size(lon)))
+    zones, cells, names = RegionMasker(layer).members(
+        lon, lat, regions, cache=cache)
+    result = zonal_stats(
+        data, (zones, cells), nzones=len(names), stats=stats,
+        percentiles=percentiles, lat=lat, weighted=weighted)
+
+    if np.ndim(data) == 2:
+        index = pd.Index(names, name='region')
+    else:
+        index = pd.MultiIndex.from_product(
+            [range(np.shape(data)[0]), names], names=['time', 'region'])
+    return pd.DataFrame(
+        {name: np.ravel(value) for name, value in result.items()},
+        index=index)
@@ -47,13 +47,15 @@ setup(
     exclude_package_data={'': ['.gitignore']},
 
     install_requires=['numpy>=1.12.1',
-                      'matplotlib>=2.0.2',
+                      'matplotlib>=3.8.0',
+                      'contourpy>=1.3.0',
                       'basemap>=1.0.7',
                       'netCDF4>=1.3.0',
                       'pandas>=0.22.0',
-                      'pyshp>=1.2.0',
+                      'pyshp>=2.0.0',
                       'cartopy>=0.15.1',
-                      'Shapely>=1.6.0'],
+                      'Shapely>=1.6.0',
+                      'Pillow>=9.1.0'],
     python_requires='>=3'
 )
 
@@ -0,0 +1,18 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Shared test settings: the non-interactive backend and a temporary
+on-disk cache directory.
+"""
+
+import matplotlib
+matplotlib.use('Agg')
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the on-disk caches of every test in a temporary directory."""
+    monkeypatch.setenv('DK_MET_GRAPHICS_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
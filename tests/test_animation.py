@@ -0,0 +1,81 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the animations.
+"""
+
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+from dk_met_graphics.plot import animation
+from dk_met_graphics.plot.util import new_figure, close_figure
+
+
+COLORS = [(255, 0, 0), (0, 128, 0), (0, 0, 255)]
+
+
+@pytest.fixture
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(animation, 'ffmpeg_path', lambda: None)
+
+
+def color_loop(outfile, **kwargs):
+    """Animate a figure filled with one color per frame."""
+    fig = new_figure(figsize=(1, 0.5), dpi=40, pyplot=False)
+
+    def update(i, color):
+        fig.patch.set_facecolor(np.divide(color, 255.))
+
+    try:
+        return animation.animate(fig, update, COLORS, outfile, **kwargs)
+    finally:
+        close_figure(fig)
+
+
+@pytest.mark.parametrize('format', ['gif', 'webp'])
+def test_pillow_frames(tmp_path, no_ffmpeg, format):
+    outfile = str(tmp_path / ('loop.' + format))
+    stats = color_loop(outfile, fps=5)
+    assert stats['frames'] == len(COLORS)
+    with Image.open(outfile) as image:
+        assert image.size == (40, 20)
+        assert image.n_frames == len(COLORS)
+        for i, color in enumerate(COLORS):
+            image.seek(i)
+            pixels = np.asarray(image.convert('RGB')).reshape(-1, 3)
+            assert (pixels == color).all()
+        assert image.info['duration'] == 200
+
+
+def test_max_rss_optional(tmp_path, no_ffmpeg, monkeypatch):
+    stats = color_loop(str(tmp_path / 'loop.gif'))
+    assert stats['max_rss_mb'] is None or stats['max_rss_mb'] > 0
+    # the resource module is missing on Windows
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    stats = color_loop(str(tmp_path / 'loop.gif'))
+    assert stats['max_rss_mb'] is None
+
+
+def test_bad_format(tmp_path, no_ffmpeg):
+    with pytest.raises(ValueError):
+        color_loop(str(tmp_path / 'loop.avi'))
+    with pytest.raises(RuntimeError):
+        color_loop(str(tmp_path / 'loop.mp4'))
+
+
+def test_precipitation_loop(tmp_path, no_ffmpeg):
+    lon = np.linspace(73, 136, 64)
+    lat = np.linspace(17, 54, 38)
+    data = np.maximum(0, 60 * np.sin(lon[None, :] / 4.) *
+                      np.cos(lat[:, None] / 3.))
+    frames = [{'lon': lon, 'lat': lat, 'data': data}, data * 0.5, data * 2]
+    outfile = str(tmp_path / 'rain.gif')
+    stats = animation.animate_precipitation_nws(
+        frames, outfile, titles=['a', 'b', 'c'], figsize=(4.3, 3.1), dpi=50)
+    assert stats['frames'] == 3
+    with Image.open(outfile) as image:
+        assert image.n_frames == 3
+        first = np.asarray(image.convert('RGB')).copy()
+        image.seek(2)
+        assert not np.array_equal(first, np.asarray(image.convert('RGB')))
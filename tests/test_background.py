@@ -0,0 +1,107 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the cached static map layers.
+"""
+
+import io
+import functools
+import numpy as np
+import pytest
+import cartopy.crs as ccrs
+from PIL import Image
+from dk_met_graphics.plot.util import new_figure, close_figure, add_gridlines
+from dk_met_graphics.plot.china_map import add_china_map_2cartopy
+from dk_met_graphics.plot.background import (
+    StaticLayers, add_static_layers, background_cache_stats,
+    clear_background_cache)
+
+
+LAYERS = [functools.partial(add_china_map_2cartopy, name='province',
+                            edgecolor='k', lw=1),
+          add_gridlines]
+
+
+def map_figure(cache, position=(0.1, 0.12, 0.85, 0.8), figsize=(6, 4.3)):
+    """A map with the static layers, cached or drawn directly."""
+    fig = new_figure(figsize=figsize, dpi=72, pyplot=False)
+    ax = fig.add_axes(position, projection=ccrs.PlateCarree())
+    ax.set_extent((73, 136, 17, 54), crs=ccrs.PlateCarree())
+    if cache:
+        add_static_layers(ax, LAYERS)
+    else:
+        for layer in LAYERS:
+            layer(ax)
+    return fig
+
+
+def save(fig, format='png', **kwargs):
+    """Save and close a figure, return the file content."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format=format, **kwargs)
+    close_figure(fig)
+    return buf.getvalue()
+
+
+def pixels(content):
+    return np.asarray(Image.open(io.BytesIO(content))).astype(int)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_background_cache()
+    yield
+    clear_background_cache()
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'dpi': 144}, {'bbox_inches': 'tight'},
+    {'dpi': 144, 'bbox_inches': 'tight'}])
+def test_cached_layers_align(kwargs):
+    direct = pixels(save(map_figure(False), **kwargs))
+    cached = pixels(save(map_figure(True), **kwargs))
+    assert cached.shape == direct.shape
+    # compositing the z-orders separately only rounds the blending
+    diff = np.abs(cached - direct).max(axis=-1)
+    assert diff.max() <= 40
+    assert (diff > 0).mean() < 0.05
+    # while a pixel of misalignment is far off
+    shifted = np.abs(cached[:, 1:] - direct[:, :-1]).max(axis=-1)
+    assert (shifted > 40).mean() > 0.01
+
+
+def test_cache_keyed_on_axes_size():
+    start = background_cache_stats()
+    save(map_figure(True))
+    assert background_cache_stats()['misses'] == start['misses'] + 1
+    # same axes size in pixels in a larger figure
+    save(map_figure(True, position=(0.05, 0.06, 0.425, 0.4),
+                    figsize=(12, 8.6)))
+    save(map_figure(True), dpi=144)
+    stats = background_cache_stats()
+    assert stats['misses'] == start['misses'] + 2
+    assert stats['entries'] == 2
+
+
+@pytest.mark.parametrize('format,tag', [
+    ('pdf', b'/Subtype /Image'), ('svg', b'<image')])
+def test_vector_outputs_draw_layers(format, tag):
+    start = background_cache_stats()
+    direct = save(map_figure(False), format=format)
+    cached = save(map_figure(True), format=format)
+    assert cached.count(tag) == direct.count(tag)
+    assert abs(len(cached) - len(direct)) < 0.01 * len(direct)
+    assert background_cache_stats()['misses'] == start['misses']
+
+
+def test_products_draw_layers_by_default():
+    from dk_met_graphics.plot.precipitation import draw_precipitation_nws
+    lon = np.arange(73, 136.1, 0.5)
+    lat = np.arange(17, 54.1, 0.5)
+    prep = {'lon': lon, 'lat': lat,
+            'data': np.full((lat.size, lon.size), 5.)}
+    fig = new_figure(figsize=(6, 4.3), pyplot=False)
+    ax = fig.add_axes((0.1, 0.12, 0.85, 0.8), projection=ccrs.PlateCarree())
+    draw_precipitation_nws(ax, prep)
+    assert not any(isinstance(a, StaticLayers) for a in ax.get_children())
+    close_figure(fig)
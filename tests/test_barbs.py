@@ -0,0 +1,101 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the cached barb samplers.
+"""
+
+import numpy as np
+import pytest
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.barbs import (
+    draw_barbs, barb_vectors, cached_sampler, clear_sampler_cache,
+    sampler_cache_stats)
+
+
+LON = np.arange(70, 140.1, 0.5)
+LAT = np.arange(60, 9.9, -0.5)
+U = 20 * np.cos(np.radians(LAT)[:, None] * 3) + \
+    5 * np.sin(np.radians(LON)[None, :] * 6)
+V = 10 * np.sin(np.radians(LON)[None, :] * 4) + \
+    3 * np.cos(np.radians(LAT)[:, None] * 5)
+PROJECTION = ccrs.LambertConformal(central_longitude=105,
+                                   standard_parallels=(25, 47))
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_sampler_cache()
+    yield
+    clear_sampler_cache()
+
+
+def map_axes(projection=PROJECTION):
+    fig = new_figure(figsize=(6, 5), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=projection)
+    ax.set_extent((85, 125, 20, 50), crs=ccrs.PlateCarree())
+    return fig, ax
+
+
+def barb_samples(bb):
+    """Barb positions and components, ordered by position."""
+    xy = np.asarray(bb.get_offsets())
+    uv = np.stack([np.ma.filled(bb.u, np.nan), np.ma.filled(bb.v, np.nan)],
+                  axis=1)
+    valid = np.isfinite(uv).all(axis=1)
+    xy, uv = xy[valid], uv[valid]
+    order = np.lexsort((xy[:, 0], xy[:, 1]))
+    return xy[order], uv[order]
+
+
+@pytest.mark.parametrize('projection', [PROJECTION, ccrs.PlateCarree()])
+def test_regrid_matches_cartopy(projection):
+    fig, ax = map_axes(projection)
+    expected = ax.barbs(LON, LAT, U, V, regrid_shape=12,
+                        transform=ccrs.PlateCarree())
+    bb = draw_barbs(ax, LON, LAT, U, V, regrid_shape=12, cache=False)
+    xy, uv = barb_samples(bb)
+    exy, euv = barb_samples(expected)
+    close_figure(fig)
+    assert len(xy) == len(exy) > 100
+    scale = np.abs(np.diff(ax.get_extent())).max()
+    assert np.allclose(xy, exy, atol=1e-6 * scale)
+    # bilinear interpolation of the grid cells against the linear
+    # interpolation of a triangulation
+    assert np.abs(uv - euv).max() < 0.2
+
+
+def test_thinning_keeps_grid_values():
+    fig, ax = map_axes()
+    x, y, u, v = barb_vectors(ax, LON, LAT, U, V, spacing=25, cache=False)
+    close_figure(fig)
+    assert len(x) > 20
+    # the magnitudes of grid points, rotated to the map
+    lonlat = ccrs.PlateCarree().transform_points(PROJECTION, x, y)
+    i = np.rint((lonlat[:, 0] - LON[0]) / 0.5).astype(int)
+    j = np.rint((LAT[0] - lonlat[:, 1]) / 0.5).astype(int)
+    assert np.allclose(np.hypot(u, v), np.hypot(U[j, i], V[j, i]))
+    # at least the spacing apart, in points
+    extent = ax.get_extent()
+    points = 72. * 6 * ax.get_position().width / (extent[1] - extent[0])
+    xy = np.stack([x, y], axis=1) * points
+    distance = np.hypot(*(xy[:, None] - xy[None, :]).transpose(2, 0, 1))
+    assert np.min(distance + np.eye(len(x)) * 1e9) > 0.3 * 25
+
+
+def test_sampler_cache(cache_dir):
+    extent = (-2e6, 2e6, 1e6, 4e6)
+    start = sampler_cache_stats()
+    sampler = cached_sampler(LON, LAT, PROJECTION, extent,
+                             regrid_shape=(10, 8))
+    assert cached_sampler(LON, LAT, PROJECTION, extent,
+                          regrid_shape=(10, 8)) is sampler
+    assert sampler_cache_stats()['hits'] == start['hits'] + 1
+    assert len(list(cache_dir.rglob('*.npz'))) == 1
+
+    clear_sampler_cache()
+    loaded = cached_sampler(LON, LAT, PROJECTION, extent,
+                            regrid_shape=(10, 8))
+    assert sorted(loaded) == sorted(sampler)
+    for name in sampler:
+        assert np.array_equal(loaded[name], sampler[name])
@@ -0,0 +1,116 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the china map overlays.
+"""
+
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.china_map import add_china_map_2cartopy
+
+
+def china_map_paths(extent, before, figsize=(6, 4)):
+    """Draw the province map before or after setting the extent."""
+    fig = new_figure(figsize=figsize, pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    if before:
+        collection = add_china_map_2cartopy(ax, name='province')
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    if not before:
+        collection = add_china_map_2cartopy(ax, name='province')
+    fig.canvas.draw()
+    paths = collection.get_paths()
+    close_figure(fig)
+    return paths
+
+
+def test_extent_set_after_adding():
+    extent = (110, 120, 30, 40)
+    before = china_map_paths(extent, before=True)
+    after = china_map_paths(extent, before=False)
+    assert len(before) > 0
+    assert len(before) == len(after)
+    for p, q in zip(before, after):
+        assert np.array_equal(p.vertices, q.vertices)
+
+
+def test_detail_follows_extent():
+    regional = china_map_paths((110, 120, 30, 40), before=True)
+    national = china_map_paths((70, 140, 15, 55), before=True)
+    # the regional map is clipped to its extent
+    assert all(np.all(p.vertices[:, 0] >= 110 - 1e-6) for p in regional)
+    # and keeps more vertices per square degree
+    density = sum(len(p.vertices) for p in regional) / 100.
+    assert density > sum(len(p.vertices) for p in national) / 2800.
+
+
+def test_paths_keep_shared_borders():
+    from collections import Counter
+    from dk_met_graphics.plot.china_map import _projected_paths
+    from dk_met_graphics.resources.boundary import load_boundary
+
+    # the whole layer inside the extent, nothing is clipped
+    extent = (70., 140., 15., 55.)
+    layer = load_boundary('bou2_4p', level=2)
+    paths = _projected_paths('bou2_4p', ccrs.PlateCarree(), extent,
+                             tolerance=0.03)
+
+    def sharing(parts):
+        # number of parts using each vertex
+        return Counter(v for part in parts for v in set(map(tuple, part)))
+
+    stored = sharing(np.asarray(layer.coords[layer.ring_offsets[r]:
+                                             layer.ring_offsets[r + 1]],
+                                dtype=np.float64)
+                     for r in range(layer.ring_offsets.size - 1))
+    drawn = sharing(p.vertices for p in paths)
+    # every drawn vertex is a stored one, used by the same number of
+    # parts, so both sides of a border get the same vertices
+    assert all(stored.get(v) == n for v, n in drawn.items())
+    assert sum(n > 1 for n in drawn.values()) > 1000
+
+
+class LonLatMap(object):
+    """Basemap-like longitude and latitude map for the basemap overlay."""
+
+    llcrnrlon, urcrnrlon, llcrnrlat, urcrnrlat = 100., 125., 20., 45.
+
+    def __call__(self, x, y):
+        return x, y
+
+    def set_axes_limits(self, ax=None):
+        ax.set_xlim(self.llcrnrlon, self.urcrnrlon)
+        ax.set_ylim(self.llcrnrlat, self.urcrnrlat)
+
+
+def test_basemap_overlay():
+    from dk_met_graphics.plot.china_map import add_china_map_2basemap
+
+    fig = new_figure(figsize=(6, 6), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1)
+    polys = add_china_map_2basemap(LonLatMap(), ax, name='province',
+                                   edgecolor='k', lw=1)
+    assert len(polys) > 0 and len(ax.patches) == len(polys)
+    # drawbounds adds the boundary lines and the map limits
+    assert len(ax.collections) == 1
+    assert len(ax.collections[0].get_segments()) == len(polys)
+    assert ax.get_xlim() == (100., 125.)
+
+    ax = fig.add_subplot(1, 2, 1)
+    add_china_map_2basemap(LonLatMap(), ax, drawbounds=False)
+    assert len(ax.collections) == 0
+    fig.canvas.draw()
+    close_figure(fig)
+
+
+def test_simplified_parts_clip():
+    from dk_met_graphics.plot.china_map import _projected_paths
+
+    # simplified polygons crossing themselves are repaired before
+    # clipping, at every level of detail
+    for tolerance in (0.005, 0.02, 0.08):
+        paths = _projected_paths('bou2_4p', ccrs.PlateCarree(),
+                                 (100., 125., 15., 45.), tolerance=tolerance)
+        assert len(paths) > 0
+        assert all(np.all(p.vertices[:, 0] >= 100 - 1e-6) for p in paths)
@@ -0,0 +1,82 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the CLDAS maps.
+"""
+
+import datetime
+import numpy as np
+import pytest
+from dk_met_graphics.plot import cldas
+
+
+LON = np.arange(100, 125.01, 0.25)
+LAT = np.arange(25, 45.01, 0.25)
+TIMES = [datetime.datetime(2019, 7, 1, h) for h in (0, 1, 2)]
+
+
+def fields():
+    return [25 + 10 * np.sin(np.radians(LON)[None, :] * (6 + i)) *
+            np.cos(np.radians(LAT)[:, None] * 4) for i in range(3)]
+
+
+@pytest.mark.parametrize('raster', [True, False])
+def test_batch_updates_one_figure(monkeypatch, raster):
+    built = []
+    frames = []
+    build = cldas._cldas_figure
+    encode = cldas.encode_figure
+
+    def spy_figure(*args, **kwargs):
+        fig, pm, time_title = build(*args, **kwargs)
+        built.append((fig, pm, time_title))
+        return fig, pm, time_title
+
+    def spy_encode(fig, fmt):
+        _, pm, time_title = built[-1]
+        # the raster keeps the field, the mesh holds it as its array
+        values = pm.field if raster else pm.get_array()
+        frames.append((fig, len(fig.axes), np.array(values),
+                       time_title.get_text()))
+        return encode(fig, fmt)
+
+    monkeypatch.setattr(cldas, '_cldas_figure', spy_figure)
+    monkeypatch.setattr(cldas, 'encode_figure', spy_encode)
+    data = fields()
+    batch = [{'lon': LON, 'lat': LAT, 'data': data[0]}] + data[1:]
+    images = cldas.fig_cldas_batch(
+        batch, None, product='temp', times=TIMES, figsize=4, encode='png',
+        raster=raster)
+    monkeypatch.undo()
+
+    # one figure with one color bar, only the field and time change
+    assert len(built) == 1
+    assert len(images) == len(frames) == 3
+    assert all(fig is built[0][0] and naxes == 2
+               for fig, naxes, _, _ in frames)
+    for (_, _, values, text), field, time in zip(frames, data, TIMES):
+        assert np.array_equal(np.ravel(values), np.ravel(field))
+        assert text == time.strftime("%Y-%m-%dT%H")
+
+    # the same images as single figures
+    for image, field, time in zip(images, data, TIMES):
+        single = cldas.fig_cldas_temp(
+            {'lon': LON, 'lat': LAT, 'data': field}, figsize=4, time=time,
+            pyplot=False, encode='png', raster=raster)
+        assert image == single
+
+
+def test_batch_file_names(tmp_path):
+    data = fields()[:2]
+    outfiles = cldas.fig_cldas_batch(
+        [{'lon': LON, 'lat': LAT, 'data': data[0]}, data[1]],
+        str(tmp_path / 'rain_{time:%H}_{index}.png'), product='rain01',
+        times=TIMES[:2], figsize=4)
+    assert [p.rsplit('/', 1)[-1] for p in outfiles] == \
+        ['rain_00_0.png', 'rain_01_1.png']
+    assert all((tmp_path / p.rsplit('/', 1)[-1]).stat().st_size > 0
+               for p in outfiles)
+    with pytest.raises(ValueError):
+        cldas.fig_cldas_batch(data, None)
+    with pytest.raises(ValueError):
+        cldas.fig_cldas_batch(data, 'x.png', product='wind')
@@ -0,0 +1,37 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the color lookup tables.
+"""
+
+import numpy as np
+from matplotlib import colormaps
+from dk_met_graphics.cmap.cm import colormap_lut, apply_lut
+from dk_met_graphics.cmap.ctables import cm_precipitation_nws
+
+
+def test_float32_bins_match_float64():
+    cmap, norm = cm_precipitation_nws()
+    lut = colormap_lut(cmap, norm, mask_below=0.1)
+    edges = np.asarray(norm.boundaries, dtype=np.float64)
+    # values at, just below and just above every edge
+    values = np.concatenate([edges, np.nextafter(edges, -np.inf),
+                             np.nextafter(edges, np.inf),
+                             np.linspace(-1, 1000, 5000)])
+    field32 = values.astype(np.float32)
+    expected = apply_lut(field32.astype(np.float64), lut, index=True)
+    assert np.array_equal(apply_lut(field32, lut, index=True), expected)
+    # and the same colors as matplotlib on the float64 values
+    rgba = apply_lut(field32, lut)
+    mpl = (cmap(norm(field32.astype(np.float64))) * 255).round()
+    visible = field32 >= 0.1
+    assert np.array_equal(rgba[visible], mpl[visible].astype(np.uint8))
+
+
+def test_missing_values():
+    lut = colormap_lut(colormaps['viridis'], vmin=0, vmax=1)
+    field = np.ma.masked_array(np.array([0.5, np.nan, 0.2], np.float32),
+                               mask=[False, False, True])
+    indices = apply_lut(field, lut, index=True)
+    missing = lut[1].shape[0] - 1
+    assert indices[0] != missing and list(indices[1:]) == [missing] * 2
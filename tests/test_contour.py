@@ -0,0 +1,122 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the cached contour paths.
+"""
+
+import numpy as np
+import pytest
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.contour import (
+    contour_paths, draw_contour, clear_contour_cache, contour_cache_stats)
+
+
+LON = np.linspace(100, 130, 61)
+LAT = np.linspace(20, 45, 51)
+FIELD = 5700 + 100 * (np.sin(np.radians(LON)[None, :] * 12) *
+                      np.cos(np.radians(LAT)[:, None] * 9))
+FIELD[10:14, 20:26] = np.nan
+LEVELS = np.arange(5620, 5800, 20.)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_contour_cache()
+    yield
+    clear_contour_cache()
+
+
+def level_vertices(path):
+    """Sorted unique rounded vertices of the drawn path segments."""
+    if len(path.vertices) == 0:
+        return np.empty((0, 2))
+    vertices = path.cleaned(simplify=False).vertices
+    return np.unique(np.round(vertices, 6), axis=0)
+
+
+def band_area(path):
+    """Area of a filled contour band, holes counted negative."""
+    area = 0.
+    for polygon in path.to_polygons(closed_only=True):
+        x, y = polygon[:, 0], polygon[:, 1]
+        area += 0.5 * np.sum(x[:-1] * y[1:] - x[1:] * y[:-1])
+    return area
+
+
+def matplotlib_paths(filled):
+    fig = new_figure(figsize=(4, 3), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1)
+    cs = (ax.contourf if filled else ax.contour)(LON, LAT, FIELD, LEVELS)
+    paths = cs.get_paths()
+    close_figure(fig)
+    return paths
+
+
+def test_lines_match_matplotlib():
+    paths = contour_paths(LON, LAT, FIELD, LEVELS, cache=False)
+    expected = matplotlib_paths(filled=False)
+    assert len(paths) == len(expected) == len(LEVELS)
+    for path, other in zip(paths, expected):
+        assert np.array_equal(level_vertices(path), level_vertices(other))
+
+
+def test_bands_match_matplotlib():
+    paths = contour_paths(LON, LAT, FIELD, LEVELS, filled=True, cache=False)
+    expected = matplotlib_paths(filled=True)
+    assert len(paths) == len(expected) == len(LEVELS) - 1
+    areas = [abs(band_area(path)) for path in paths]
+    assert sum(areas) > 0
+    assert np.allclose(areas, [abs(band_area(p)) for p in expected])
+
+
+def test_cache(cache_dir):
+    start = contour_cache_stats()
+    paths = contour_paths(LON, LAT, FIELD, LEVELS, cache=True)
+    assert contour_paths(LON, LAT, FIELD, LEVELS, cache=True) is paths
+    assert contour_cache_stats()['hits'] == start['hits'] + 1
+    assert len(list(cache_dir.rglob('*.npz'))) == 1
+
+    # a new process reads the on-disk cache
+    clear_contour_cache()
+    loaded = contour_paths(LON, LAT, FIELD, LEVELS, cache=True)
+    assert loaded is not paths
+    for path, other in zip(paths, loaded):
+        assert np.array_equal(path.vertices, other.vertices)
+        assert np.array_equal(path.codes, other.codes)
+
+    # another field misses, and is not written to the disk by default
+    contour_paths(LON, LAT, FIELD + 1, LEVELS)
+    assert contour_cache_stats()['entries'] == 2
+    assert len(list(cache_dir.rglob('*.npz'))) == 1
+
+
+def test_draw_contour_uses_cached_paths():
+    fig = new_figure(figsize=(4, 3), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent((100, 130, 20, 45), crs=ccrs.PlateCarree())
+    cs = draw_contour(ax, LON, LAT, FIELD, LEVELS, colors='k')
+    paths = contour_paths(LON, LAT, FIELD, LEVELS)
+    assert all(p is q for p, q in zip(cs.get_paths(), paths))
+    assert np.array_equal(cs.levels, LEVELS)
+    labels = ax.clabel(cs, inline=1, fontsize=8, fmt='%.0f')
+    assert len(labels) > 0
+    fig.canvas.draw()
+    close_figure(fig)
+
+
+@pytest.mark.parametrize('cache_contours', [False, True])
+def test_product_disk_cache(cache_dir, cache_contours):
+    from dk_met_graphics.plot.synoptic import draw_gh500_uv850_mslp
+
+    fig = new_figure(figsize=(4, 3), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    draw_gh500_uv850_mslp(
+        ax, gh500={'lon': LON, 'lat': LAT, 'data': FIELD / 10.},
+        mslp={'lon': LON, 'lat': LAT, 'data': FIELD - 4700},
+        map_extent=(100, 130, 20, 45), add_china=False,
+        cache_contours=cache_contours)
+    close_figure(fig)
+    # field-keyed paths only reach the disk when asked for
+    npz = list(cache_dir.rglob('*.npz'))
+    assert len(npz) == (2 if cache_contours else 0)
@@ -0,0 +1,366 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the grid masks and label rasters.
+"""
+
+import os
+import numpy as np
+import pytest
+import shapely
+import cartopy.crs as ccrs
+from cartopy.io import shapereader
+from matplotlib.path import Path
+from shapely.geometry import Point, Polygon, MultiPolygon, box
+from shapely.prepared import prep
+import dk_met_graphics
+from dk_met_graphics.mask import (
+    shp_mask, shp_members, members_to_labels, shp_labels, _pack_mask,
+    _unpack_mask, mask_cache_key, cached_grid_mask, grid_mask_china,
+    mask_cache_stats, clear_mask_cache, shp_fraction, shp_clip_path,
+    contour_shp_clip)
+
+
+X = np.arange(0, 10.01, 0.25)
+Y = np.arange(0, 8.01, 0.25)
+
+
+def contains(shp, x, y):
+    """Reference mask of shapely."""
+    gx, gy = np.meshgrid(x, y)
+    return shapely.contains_xy(shp, gx, gy)
+
+
+def holed():
+    """A polygon with two holes, one touching grid points."""
+    return Polygon([(0.3, 0.2), (9.1, 1.1), (8.4, 7.6), (1.2, 6.9)],
+                   holes=[[(2, 2), (4, 2), (4, 4), (2, 4)],
+                          [(5.1, 3.3), (7.3, 3.9), (6.2, 5.8)]])
+
+
+@pytest.mark.parametrize('shp', [
+    box(1, 1, 5, 5),
+    box(1.1, 0.9, 6.3, 4.45),
+    holed(),
+    MultiPolygon([box(0.5, 0.5, 2.6, 3), Point(6, 5).buffer(2.2),
+                  box(6.5, 0.2, 9.75, 2.9).difference(box(7, 1, 8.5, 2))]),
+    Point(4.9, 3.3).buffer(3.7, 3)])
+def test_mask_matches_shapely(shp):
+    expected = contains(shp, X, Y)
+    assert expected.any() and not expected.all()
+    assert np.array_equal(shp_mask(shp, X, Y), expected)
+    # descending latitudes (and longitudes) give the flipped mask
+    assert np.array_equal(shp_mask(shp, X, Y[::-1]), expected[::-1])
+    assert np.array_equal(shp_mask(shp, X[::-1], Y[::-1]),
+                          expected[::-1, ::-1])
+
+
+def test_mask_fills_given_array():
+    m = np.ones((Y.size, X.size), dtype=bool)
+    out = shp_mask(holed(), X, Y, m=m)
+    assert out is m
+    assert np.array_equal(m, contains(holed(), X, Y))
+
+
+def test_mask_quadtree_fallback():
+    # shapes without polygon rings, like prepared geometries, with
+    # no grid point on the boundary (the quadtree takes in the points
+    # on the boundary of blocks inside the shape)
+    shp = Point(4.9, 3.3).buffer(3.7, 3).difference(
+        box(2.1, 2.1, 3.9, 3.9))
+    assert np.array_equal(shp_mask(prep(shp), X, Y), contains(shp, X, Y))
+    line = shapely.LineString([(0, 0), (10, 8)])
+    assert not shp_mask(line, X, Y).any()
+
+
+def overlapping():
+    """Two overlapping polygons and a disjoint one."""
+    return [box(1, 1, 5, 5), Point(5, 4).buffer(2), box(8, 0.5, 9.5, 2)]
+
+
+def test_members_match_masks():
+    shps = overlapping()
+    zones, cells = shp_members(shps, X, Y)
+    assert np.all(np.diff(zones) >= 0)
+    for i, shp in enumerate(shps):
+        mask = np.zeros((Y.size, X.size), dtype=bool)
+        mask.flat[cells[zones == i]] = True
+        # the grid points on the borders follow the half-open rule
+        interior = shp_mask(shp, X, Y)
+        assert np.all(mask[interior])
+        assert np.all(shp_mask(shp.buffer(1e-9), X, Y)[mask])
+
+
+def test_labels_overlap_rules():
+    shps = overlapping()
+    zones, cells = shp_members(shps, X, Y)
+    both = np.bincount(cells, minlength=X.size * Y.size).reshape(
+        Y.size, X.size) > 1
+    assert both.sum() > 0
+    assert np.all((shp_mask(shps[0], X, Y) & shp_mask(shps[1], X, Y))
+                  <= both)
+
+    first = shp_labels(shps, X, Y, overlap='first')
+    last = shp_labels(shps, X, Y, overlap='last')
+    assert np.all(first[both] == 1)
+    assert np.all(last[both] == 2)
+    assert np.array_equal(first[~both], last[~both])
+    assert set(np.unique(first)) == {0, 1, 2, 3}
+
+    with pytest.raises(ValueError, match='a/b'):
+        members_to_labels(zones, cells, (Y.size, X.size), overlap='raise',
+                          names=['a', 'b', 'c'])
+
+
+def test_labels_shared_border():
+    # adjacent boxes sharing an edge on a grid column
+    shps = [box(1, 1, 4, 5), box(4, 1, 7, 5)]
+    labels = shp_labels(shps, X, Y, overlap='raise')
+    union = shp_mask(box(1, 1, 7, 5).buffer(-1e-9), X, Y)
+    assert np.all(labels[union] > 0)
+    assert np.all(labels[:, X == 4][union[:, X == 4]] == 1)
+
+
+def test_labels_descending_coordinates():
+    shps = overlapping()
+    labels = shp_labels(shps, X, Y)
+    assert np.array_equal(shp_labels(shps, X, Y[::-1]), labels[::-1])
+    assert np.array_equal(shp_labels(shps, X[::-1], Y), labels[:, ::-1])
+
+
+def test_labels_reject_lines():
+    with pytest.raises(ValueError):
+        shp_labels([Point(1, 1)], X, Y)
+
+
+def test_mask_china_boundary():
+    shpfile = os.path.join(os.path.dirname(dk_met_graphics.__file__),
+                           'resources', 'maps', 'bou1_4p.shp')
+    shp = MultiPolygon([
+        part for geom in shapereader.Reader(shpfile).geometries()
+        for part in getattr(geom, 'geoms', [geom])])
+    shapely.prepare(shp)
+    lon = np.arange(70, 140.01, 0.5)
+    lat = np.arange(60, 14.99, -0.5)
+    assert np.array_equal(shp_mask(shp, lon, lat), contains(shp, lon, lat))
+
+
+def write_box_shapefile(name, bounds):
+    """Write a one record polygon shapefile."""
+    import shapefile
+    x0, y0, x1, y1 = bounds
+    with shapefile.Writer(name, shapeType=shapefile.POLYGON) as w:
+        w.field('NAME', 'C')
+        w.poly([[(x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)]])
+        w.record('box')
+
+
+@pytest.fixture
+def mask_cache():
+    clear_mask_cache()
+    yield
+    clear_mask_cache()
+
+
+def test_packbits_round_trip():
+    mask = np.random.RandomState(0).rand(7, 13) > 0.5
+    packed = _pack_mask(mask)
+    assert packed['bits'].size == (mask.size + 7) // 8
+    unpacked = _unpack_mask(packed)
+    assert unpacked.dtype == bool
+    assert np.array_equal(unpacked, mask)
+    labels = np.arange(91, dtype=np.int16).reshape(7, 13)
+    assert np.array_equal(_unpack_mask(_pack_mask(labels)), labels)
+
+
+def test_cached_grid_mask_hits(tmp_path, mask_cache, cache_dir):
+    shpfile = str(tmp_path / 'box')
+    write_box_shapefile(shpfile, (1, 1, 5, 4))
+    lon, lat = X[:13], Y[:11]
+    expected = shp_mask(box(1, 1, 5, 4), lon, lat)
+    calls = []
+
+    def builder():
+        calls.append(1)
+        return shp_mask(box(1, 1, 5, 4), lon, lat)
+
+    mask = cached_grid_mask(shpfile, 'box', lon, lat, builder)
+    assert np.array_equal(mask, expected) and len(calls) == 1
+    files = list(cache_dir.rglob('*.npz'))
+    assert len(files) == 1
+
+    # memory hit, without the disk
+    files[0].unlink()
+    start = mask_cache_stats()
+    mask = cached_grid_mask(shpfile, 'box', lon, lat, builder)
+    assert np.array_equal(mask, expected) and len(calls) == 1
+    assert mask_cache_stats()['hits'] == start['hits'] + 1
+
+    # rebuilt without either, then a disk hit without the memory
+    clear_mask_cache()
+    cached_grid_mask(shpfile, 'box', lon, lat, builder)
+    assert len(calls) == 2 and files[0].exists()
+    clear_mask_cache()
+    mask = cached_grid_mask(shpfile, 'box', lon, lat, builder)
+    assert np.array_equal(mask, expected) and len(calls) == 2
+    # the returned masks are copies
+    mask[:] = False
+    assert np.array_equal(
+        cached_grid_mask(shpfile, 'box', lon, lat, builder), expected)
+
+
+def test_mask_key_follows_shapefile(tmp_path, mask_cache):
+    shpfile = str(tmp_path / 'box')
+    write_box_shapefile(shpfile, (1, 1, 5, 4))
+    key = mask_cache_key(shpfile, 'box', X, Y)
+    assert mask_cache_key(shpfile, 'box', X, Y) == key
+    assert mask_cache_key(shpfile, 'box', X, Y[1:]) != key
+
+    # the same file size, another box
+    stat = os.stat(shpfile + '.shp')
+    write_box_shapefile(shpfile, (2, 1, 6, 4))
+    os.utime(shpfile + '.shp', ns=(stat.st_atime_ns,
+                                   stat.st_mtime_ns + 10 ** 9))
+    assert os.stat(shpfile + '.shp').st_size == stat.st_size
+    assert mask_cache_key(shpfile, 'box', X, Y) != key
+    mask = cached_grid_mask(shpfile, 'box', X, Y,
+                            lambda: shp_mask(box(2, 1, 6, 4), X, Y))
+    assert np.array_equal(mask, shp_mask(box(2, 1, 6, 4), X, Y))
+
+
+def test_grid_mask_china(mask_cache):
+    lon = np.arange(70, 140.01, 1.)
+    lat = np.arange(60, 14.99, -1.)
+    mask = grid_mask_china(lon, lat)
+    assert mask.dtype == bool
+    assert mask[lat == 30][0, lon == 110][0]
+    assert not mask[lat == 20][0, lon == 80][0]
+    frac = grid_mask_china(lon, lat, fraction=True)
+    assert frac.dtype == np.float32
+    assert np.all(frac[mask] > 0)
+
+
+def box_fraction(bounds, x, y):
+    """Analytic covered fractions of unit cells by a box."""
+    x0, y0, x1, y1 = bounds
+    fx = np.clip(np.minimum(x + 0.5, x1) - np.maximum(x - 0.5, x0), 0, 1)
+    fy = np.clip(np.minimum(y + 0.5, y1) - np.maximum(y - 0.5, y0), 0, 1)
+    return fy[:, None] * fx[None, :]
+
+
+def test_fraction_of_a_box():
+    x = np.arange(0., 5.)
+    y = np.arange(0., 4.)
+    frac = shp_fraction(box(0.2, 0.2, 2.2, 1.7), x, y)
+    assert frac.dtype == np.float32
+    assert np.allclose(frac[0, 0], 0.09)
+    assert np.allclose(frac[1, 0], 0.3)
+    assert np.allclose(frac[1, 2], 0.7)
+    assert np.allclose(frac[2, 1], 0.2)
+    assert frac[1, 1] == 1 and frac[3, 3] == 0
+    assert np.allclose(frac, box_fraction((0.2, 0.2, 2.2, 1.7), x, y))
+    # descending latitudes
+    assert np.array_equal(shp_fraction(box(0.2, 0.2, 2.2, 1.7), x, y[::-1]),
+                          frac[::-1])
+
+
+def test_fraction_agrees_with_mask():
+    x = np.arange(0., 20.)
+    y = np.arange(0., 16.)
+    shp = Point(9.3, 7.6).buffer(6.2).difference(Point(9, 8).buffer(2))
+    frac = shp_fraction(shp, x, y)
+    mask = shp_mask(shp, x, y)
+    assert frac.min() >= 0 and frac.max() <= 1
+    assert (frac == 1).any() and (frac == 0).any()
+    # cells fully inside have their centres inside, and empty
+    # cells outside
+    assert np.all(mask[frac == 1])
+    assert not np.any(mask[frac == 0])
+    # the covered area
+    assert np.isclose(frac.sum(), shp.area, rtol=1e-5)
+
+
+def resource_map(name):
+    return os.path.join(os.path.dirname(dk_met_graphics.__file__),
+                        'resources', 'maps', name)
+
+
+def record_parts(shpfile, region_index, names, encoding):
+    """Vertices and parts of all matching records, by pyshp."""
+    import shapefile
+    sf = shapefile.Reader(shpfile, encoding=encoding)
+    points, parts = 0, 0
+    for sr in sf.shapeRecords():
+        if sr.record[region_index] in names:
+            points += len(sr.shape.points)
+            parts += len(sr.shape.parts)
+    return points, parts
+
+
+@pytest.mark.parametrize('shpfile,region_index,names,encoding', [
+    (resource_map('country1.shp'), 3, ['China', 'Mongolia'], 'utf-8'),
+    # provinces made of many records, islands each
+    (resource_map('bou2_4p.shp'), 6, [u'浙江省', u'台湾省'], 'gbk')])
+def test_clip_path_keeps_all_regions(shpfile, region_index, names, encoding):
+    path = shp_clip_path(shpfile, region_index=region_index,
+                         region_name=names, encoding=encoding)
+    points, parts = record_parts(shpfile, region_index, names, encoding)
+    single = [shp_clip_path(shpfile, region_index=region_index,
+                            region_name=name, encoding=encoding)
+              for name in names]
+    assert len(path.vertices) == points
+    assert np.sum(path.codes == Path.MOVETO) == parts
+    assert len(path.vertices) == sum(len(p.vertices) for p in single)
+    assert all(len(p.vertices) > 0 for p in single)
+
+
+def test_clip_path_cache_and_projection():
+    china = shp_clip_path(region_name=['China'])
+    assert shp_clip_path(region_name='China') is china
+    # country1 draws Taiwan in the China record
+    both = shp_clip_path(region_name=['China', 'Taiwan'])
+    assert np.array_equal(both.vertices, china.vertices)
+    assert both.contains_point((121., 23.7))
+    assert both.contains_point((110., 19.2))
+    assert shp_clip_path(region_name=['Nowhere']) is None
+    crs = ccrs.LambertConformal(central_longitude=105,
+                                standard_parallels=(25, 47))
+    projected = shp_clip_path(region_name=['China'], crs=crs)
+    assert projected is not china
+    assert np.array_equal(projected.codes, china.codes)
+    assert np.allclose(projected.vertices, crs.transform_points(
+        ccrs.PlateCarree(), china.vertices[:, 0],
+        china.vertices[:, 1])[:, :2])
+    assert shp_clip_path(region_name=['China'], crs=crs) is projected
+
+
+def test_contour_shp_clip():
+    from dk_met_graphics.plot.util import new_figure, close_figure
+    lon = np.arange(70, 140.1, 0.5)
+    lat = np.arange(10, 60.1, 0.5)
+    data = np.ones((lat.size, lon.size))
+    fig = new_figure(figsize=(4, 3), dpi=50, pyplot=False)
+    ax = fig.add_axes((0, 0, 1, 1), projection=ccrs.PlateCarree())
+    ax.set_extent((70, 140, 10, 60), crs=ccrs.PlateCarree())
+    cs = ax.contourf(lon, lat, data, [0, 2], colors='red',
+                     transform=ccrs.PlateCarree())
+    mesh = ax.pcolormesh(lon, lat, data, cmap='Blues', vmin=0, vmax=1,
+                         transform=ccrs.PlateCarree())
+    clip = contour_shp_clip([cs, mesh], ax, region_name=['China'])
+    assert cs.get_clip_path() is not None and \
+        mesh.get_clip_path() is not None
+    assert shp_clip_path(region_name=['China'], crs=ax.projection) is \
+        clip.get_path()
+    fig.canvas.draw()
+    image = np.asarray(fig.canvas.buffer_rgba())
+    close_figure(fig)
+
+    def pixel(lon, lat):
+        x, y = ax.transData.transform((lon, lat))
+        return image[int(image.shape[0] - y), int(x), :3]
+
+    # inside China (Hubei) and outside (India, the Pacific)
+    assert not np.all(pixel(112, 31) == 255)
+    assert np.all(pixel(78, 20) == 255)
+    assert np.all(pixel(135, 20) == 255)
+    assert contour_shp_clip(cs, ax, shpfile='missing.shp') is None
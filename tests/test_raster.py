@@ -0,0 +1,211 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the raster fields.
+"""
+
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.raster import draw_raster
+
+
+# render wind speed from float32 or float64 winds, printing the peak
+# resident memory growth (kilobytes) after the imports. The peak is
+# read from /proc, ru_maxrss of a child process on Linux starts from
+# the peak of its parent, the test process.
+PIPELINE = """
+import sys
+import numpy as np
+import cartopy.crs as ccrs
+from dk_met_graphics.plot.util import new_figure, figure_to_bytes
+from dk_met_graphics.plot.raster import draw_raster
+
+
+def peak():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+
+
+shape, dtype = (1500, 2600), sys.argv[1]
+fig = new_figure(figsize=(6, 4), dpi=100, pyplot=False)
+ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+ax.set_extent((70, 140, 15, 55), crs=ccrs.PlateCarree())
+fig.canvas.draw()
+base = peak()
+
+lon = np.linspace(70., 140., shape[1])
+lat = np.linspace(15., 55., shape[0])
+u = np.empty(shape, dtype=dtype)
+v = np.empty(shape, dtype=dtype)
+np.multiply(np.sin(lon[None, :] / 3.), 20. * np.cos(lat[:, None] / 2.),
+            out=u, casting='unsafe')
+np.multiply(np.cos(lon[None, :] / 5.), 15. * np.sin(lat[:, None] / 3.),
+            out=v, casting='unsafe')
+speed = np.hypot(u, v)
+assert speed.dtype == dtype
+draw_raster(ax, lon, lat, speed, cmap='viridis', vmin=0, vmax=40,
+            cache=False)
+figure_to_bytes(fig, compress_level=1)
+print(peak() - base)
+"""
+
+
+def pipeline_peak(dtype):
+    """Peak memory growth of the pipeline in a fresh process."""
+    output = subprocess.run(
+        [sys.executable, '-c', PIPELINE, dtype], check=True,
+        stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return int(output.split()[-1])
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'),
+                    reason='needs /proc/self/status')
+def test_float32_peak_rss():
+    peak32 = pipeline_peak('float32')
+    peak64 = pipeline_peak('float64')
+    # the float64 pipeline holds three 8-byte fields (u, v and speed),
+    # the float32 one three 4-byte fields and no float64 copy
+    cells = 1500 * 2600
+    assert peak64 - peak32 > 0.5 * 12 * cells / 1024.
+    assert peak32 < 0.8 * peak64
+
+
+def test_raster_keeps_float32():
+    fig = new_figure(figsize=(3, 2), dpi=50, pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent((100, 120, 20, 40), crs=ccrs.PlateCarree())
+    lon = np.linspace(100, 120, 81)
+    lat = np.linspace(20, 40, 81)
+    field = np.random.RandomState(0).rand(81, 81).astype(np.float32)
+    field[0, 0] = np.nan
+    im = draw_raster(ax, lon, lat, field, cmap='viridis', cache=False)
+    # the field is used as it is, without a float64 copy
+    assert im.field is field and im.field.dtype == np.float32
+    assert im.norm.vmin == np.nanmin(field)
+    fig.canvas.draw()
+    close_figure(fig)
+
+
+def raster_map(extent, before=True, transform=None, lon=None, dpi=50):
+    """Draw a field raster, setting the extent before or after."""
+    fig = new_figure(figsize=(3, 2), dpi=dpi, pyplot=False)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    if before:
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
+    if lon is None:
+        lon = np.linspace(100, 120, 81)
+    lat = np.linspace(20, 40, 81)
+    field = np.add.outer(np.arange(81.), np.arange(81.) * 2)
+    im = draw_raster(ax, lon, lat, field, cmap='viridis', vmin=0,
+                     vmax=240, transform=transform, cache=False)
+    if not before:
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
+    return fig, ax, im
+
+
+def test_raster_follows_extent():
+    extent = (105, 115, 25, 35)
+    fig, ax, im = raster_map(extent, before=True)
+    fig.canvas.draw()
+    expected = np.array(im.get_array())
+    close_figure(fig)
+
+    # the extent set after drawing once and after adding the raster
+    fig, ax, im = raster_map((100, 120, 20, 40), before=True)
+    fig.canvas.draw()
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    fig.canvas.draw()
+    assert np.allclose(im.get_extent(), ax.get_extent())
+    assert np.array_equal(im.get_array(), expected)
+    close_figure(fig)
+    fig, ax, im = raster_map(extent, before=False)
+    fig.canvas.draw()
+    assert np.array_equal(im.get_array(), expected)
+    close_figure(fig)
+
+
+def test_raster_follows_savefig_dpi():
+    import io
+
+    fig, ax, im = raster_map((105, 115, 25, 35))
+    fig.canvas.draw()
+    low = im.get_array().shape
+    fig.savefig(io.BytesIO(), format='png', dpi=300)
+    high = im.get_array().shape
+    # warped at the savefig resolution, not upsampled
+    assert high[0] >= 6 * low[0] - 6 and high[1] >= 6 * low[1] - 6
+    fig.canvas.draw()
+    assert im.get_array().shape == low
+    close_figure(fig)
+
+
+def test_raster_central_longitude():
+    extent = (105, 115, 25, 35)
+    fig, ax, im = raster_map(extent)
+    fig.canvas.draw()
+    expected = np.array(im.get_array())
+    close_figure(fig)
+
+    # the same grid in coordinates shifted by 180 degrees
+    fig, ax, im = raster_map(
+        extent, transform=ccrs.PlateCarree(central_longitude=180),
+        lon=np.linspace(100, 120, 81) - 180)
+    fig.canvas.draw()
+    assert np.array_equal(im.get_array(), expected)
+    close_figure(fig)
+
+
+def test_warp_cache_round_trip(cache_dir, monkeypatch):
+    from dk_met_graphics.plot import raster
+    from dk_met_graphics.plot.raster import (
+        cached_warp_indices, warp_indices, warp_cache_key,
+        clear_warp_cache)
+
+    lon = np.linspace(100, 120, 41)
+    lat = np.linspace(20, 40, 41)
+    projection = ccrs.LambertConformal(central_longitude=110)
+    extent = projection.transform_points(
+        ccrs.PlateCarree(), np.array([102., 118.]),
+        np.array([22., 38.]))[:, :2].T.ravel()
+    shape = (30, 40)
+
+    clear_warp_cache()
+    first = cached_warp_indices(lon, lat, projection, extent, shape)
+    # int32 halves the index size, the values are those of the warp
+    assert first.dtype == np.int32
+    assert np.array_equal(
+        first, warp_indices(lon, lat, projection, extent, shape))
+    files = list(cache_dir.rglob('*.npy'))
+    assert len(files) == 1
+
+    # a new process starts with an empty memory cache and loads the
+    # indices from the disk, without warping
+    clear_warp_cache()
+    with monkeypatch.context() as m:
+        m.setattr(raster, 'warp_indices', None)
+        second = cached_warp_indices(lon, lat, projection, extent, shape)
+    assert second is not first and np.array_equal(second, first)
+    assert second.dtype == np.int32
+    assert list(cache_dir.rglob('*.npy')) == files
+
+    # the key follows the raster shape, projection and grid transform
+    key = warp_cache_key(lon, lat, projection, extent, shape)
+    assert files[0].name == key + '.npy'
+    assert key != warp_cache_key(lon, lat, projection, extent, (40, 30))
+    assert key != warp_cache_key(
+        lon, lat, ccrs.LambertConformal(central_longitude=111), extent,
+        shape)
+    assert key != warp_cache_key(
+        lon, lat, projection, extent, shape,
+        transform=ccrs.PlateCarree(central_longitude=180))
+    assert key == warp_cache_key(
+        lon.copy(), lat.copy(), ccrs.LambertConformal(central_longitude=110),
+        list(extent), list(shape))
+    clear_warp_cache()
@@ -0,0 +1,54 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the region masks on the bundled boundary layers.
+"""
+
+import numpy as np
+import pytest
+from dk_met_graphics.mask import shp_mask
+from dk_met_graphics.region import RegionMasker
+
+
+LON = np.arange(110, 123, 0.1)
+LAT = np.arange(25, 36, 0.1)
+
+
+def test_overlapping_catchments():
+    masker = RegionMasker('catchment')
+    regions = ['changjiang', 'taihu', 'huaihe']
+    masks = masker.masks(LON, LAT, regions)
+    for name in regions:
+        assert np.all(masks[name][shp_mask(
+            masker.geometries[name], LON, LAT)])
+    # taihu lies partly inside the changjiang catchment polygon
+    both = masks['changjiang'] & masks['taihu']
+    assert both.sum() > 0
+
+    labels, names = masker.label_raster(LON, LAT, regions)
+    assert names == regions
+    assert np.all(labels[both] == 1)
+    labels, _ = masker.label_raster(LON, LAT, regions, overlap='last')
+    assert np.all(labels[both] == 2)
+    for i, name in enumerate(names, start=1):
+        assert np.all(masks[name][labels == i])
+
+    union = masker.mask(LON, LAT, regions)
+    assert np.array_equal(union, masks['changjiang'] | masks['taihu'] |
+                          masks['huaihe'])
+    with pytest.raises(ValueError, match='changjiang/taihu'):
+        masker.label_raster(LON, LAT, regions, overlap='raise')
+
+
+def test_members_cached(cache_dir):
+    masker = RegionMasker('catchment')
+    zones, cells, names = masker.members(LON, LAT, ['taihu'])
+    assert list(cache_dir.rglob('*.npz'))
+    again = masker.members(LON, LAT, ['taihu'])
+    assert np.array_equal(again[1], cells)
+    assert names == ['taihu'] and np.all(zones == 0)
+
+
+def test_unknown_region():
+    with pytest.raises(KeyError):
+        RegionMasker('catchment').mask(LON, LAT, 'nowhere')
@@ -0,0 +1,154 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the plot job renderer.
+"""
+
+import json
+import datetime
+from multiprocessing import shared_memory
+import numpy as np
+import matplotlib
+import pytest
+from dk_met_graphics.plot import render
+from dk_met_graphics.plot.render import (
+    render_jobs, render_report, load_jobs, share_jobs, release_blocks,
+    load_data)
+
+
+def china_map_job(tmp_path, name='province'):
+    """A job drawing the china map on a cartopy axes."""
+    return {'function': 'dk_met_graphics.plot.china_map.'
+                        'add_china_map_2cartopy',
+            'kwargs': {'name': name},
+            'figure': {'figsize': [4, 3]},
+            'outfile': str(tmp_path / (name + '.png')), 'id': name}
+
+
+@pytest.fixture
+def pdf_backend():
+    """Switch to another backend than Agg during the test."""
+    matplotlib.use('pdf')
+    yield
+    matplotlib.use('Agg')
+
+
+def test_in_process_keeps_backend(tmp_path, pdf_backend):
+    results = render_jobs([china_map_job(tmp_path)], processes=0,
+                          layers=['bou2_4p'])
+    assert matplotlib.get_backend() == 'pdf'
+    assert results[0]['ok'], results[0]['error']
+    assert (tmp_path / 'province.png').stat().st_size > 0
+
+
+def test_pool_reports_failures(tmp_path):
+    jobs = [china_map_job(tmp_path), china_map_job(tmp_path, 'nowhere')]
+    report = render_report(render_jobs(jobs, processes=1, warm=False))
+    assert list(report['ok']) == [True, False]
+    assert 'KeyError' in report.loc['nowhere', 'error']
+
+
+def test_load_jobs_decodes_times(tmp_path):
+    time = datetime.datetime(2019, 7, 1, 8)
+    jobs = [{'function': 'dk_met_graphics.plot.util.add_timestamp',
+             'kwargs': {'time': '2019-07-01T08:00'},
+             'outfile': str(tmp_path / 'stamp.png'), 'id': 'stamp'},
+            {'function': 'fig_cldas_batch',
+             'kwargs': {'times': ['2019-07-01T08', '2019-07-01 09:00'],
+                        'initial_time': {'$datetime': '2019-07-01T08'},
+                        'title': '2019-07-01T08:00'}}]
+    filename = tmp_path / 'jobs.jsonl'
+    filename.write_text('\n'.join(json.dumps(job) for job in jobs))
+    loaded = load_jobs(str(filename))
+    assert loaded[0]['kwargs']['time'] == time
+    assert loaded[1]['kwargs']['times'] == [
+        time, time + datetime.timedelta(hours=1)]
+    assert loaded[1]['kwargs']['initial_time'] == time
+    # other strings are left as they are
+    assert loaded[1]['kwargs']['title'] == '2019-07-01T08:00'
+
+    # a JSON list gives the same jobs, which render
+    filename.write_text(json.dumps(jobs))
+    assert load_jobs(str(filename)) == loaded
+    results = render_jobs(loaded[:1], processes=0, warm=False)
+    assert results[0]['ok'], results[0]['error']
+
+
+def shared_view(field, lon, outfile):
+    """Job function writing how its arrays reach the worker."""
+    buffers = [np.ndarray(block.size, dtype=np.uint8, buffer=block.buf)
+               for block in render._attached_blocks.values()]
+    with open(outfile, 'w') as f:
+        json.dump({'owndata': [field.flags.owndata, lon.flags.owndata],
+                   'shared': [any(np.shares_memory(a, b) for b in buffers)
+                              for a in (field, lon)],
+                   'dtype': [field.dtype.str, lon.dtype.str],
+                   'sum': [float(field.sum()), float(lon.sum())]}, f)
+
+
+def shared_jobs(tmp_path, field, lon):
+    """A job reading shared arrays and a failing job."""
+    return [{'function': __name__ + '.shared_view',
+             'data': {'field': field, 'lon': lon},
+             'outfile': str(tmp_path / 'view.json'), 'id': 'view'},
+            {'function': __name__ + '.shared_view',
+             'data': {'field': field, 'lon': None},
+             'outfile': str(tmp_path / 'fail.json'), 'id': 'fail'}]
+
+
+def test_share_jobs_attaches_views():
+    field = np.arange(300 * 500, dtype=np.float32).reshape(300, 500)
+    lon = np.linspace(70., 140., 300)
+    jobs, blocks = share_jobs(
+        [{'data': {'field': field, 'lon': lon}}, {'data': {'field': field}}],
+        min_bytes=10000)
+    try:
+        # an array used by several jobs is shared once, small ones
+        # stay inline
+        assert len(blocks) == 1
+        assert jobs[0]['data']['field'] == jobs[1]['data']['field']
+        assert jobs[0]['data']['lon'] is lon
+        view = load_data(jobs[1]['data'])['field']
+        assert not view.flags.owndata and not view.flags.writeable
+        assert np.shares_memory(view, np.ndarray(
+            blocks[0].size, dtype=np.uint8,
+            buffer=render._attached_blocks[blocks[0].name].buf))
+        assert view.dtype == field.dtype and np.array_equal(view, field)
+    finally:
+        view = None
+        render._detach_blocks()
+        release_blocks(blocks)
+    assert not render._attached_blocks
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=blocks[0].name)
+
+
+def test_pool_shares_and_releases(tmp_path, monkeypatch):
+    created = []
+
+    def spy_share(jobs, min_bytes=render.SHARE_MIN_BYTES):
+        jobs, blocks = share_jobs(jobs, min_bytes=1000)
+        created.extend(blocks)
+        return jobs, blocks
+
+    monkeypatch.setattr(render, 'share_jobs', spy_share)
+    field = np.random.RandomState(0).rand(200, 300).astype(np.float32)
+    lon = np.linspace(70., 140., 300)
+    results = render_jobs(shared_jobs(tmp_path, field, lon), processes=1,
+                          warm=False)
+    assert results[0]['ok'], results[0]['error']
+    assert not results[1]['ok']
+
+    # the worker got zero-copy views with the right values
+    with open(str(tmp_path / 'view.json')) as f:
+        view = json.load(f)
+    assert view['owndata'] == [False, False]
+    assert view['shared'] == [True, True]
+    assert view['dtype'] == [field.dtype.str, lon.dtype.str]
+    assert view['sum'] == [float(field.sum()), float(lon.sum())]
+
+    # the blocks are removed, although a job failed
+    assert len(created) == 2
+    for block in created:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
@@ -0,0 +1,91 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the vectorized streamlines and particle traces.
+"""
+
+import numpy as np
+import pytest
+from dk_met_graphics.plot.util import new_figure, close_figure
+from dk_met_graphics.plot.streamlines import (
+    bilinear_sampler, integrate, streamlines, particle_traces,
+    draw_streamlines, EARTH_RADIUS)
+
+
+LON = np.arange(70, 140.1, 0.5)
+LAT = np.arange(10, 60.1, 0.5)
+X, Y = np.radians(LON)[None, :] * 6, np.radians(LAT)[:, None] * 6
+U = 15 * np.sin(X) * np.cos(Y) + 5
+V = -15 * np.cos(X) * np.sin(Y)
+
+
+def test_bilinear_sampler():
+    sample = bilinear_sampler(LON, LAT, U, V)
+    # grid points and a point outside
+    uv = sample(np.array([LON[3], 200.]), np.array([LAT[5], 30.]))
+    assert uv[0] == U[5, 3] + 1j * V[5, 3]
+    assert np.isnan(uv[1])
+    # the same on decreasing latitudes
+    flipped = bilinear_sampler(LON, LAT[::-1], U[::-1], V[::-1])
+    points = (np.array([100.3, 121.7]), np.array([33.1, 45.9]))
+    assert np.allclose(flipped(*points), sample(*points))
+    with pytest.raises(ValueError):
+        bilinear_sampler(np.r_[LON[:-1], 150.], LAT, U, V)
+
+
+def test_particles_move_with_the_wind():
+    lat = np.full(3, 30.)
+    u = np.full((LAT.size, LON.size), 10.)
+    traces = particle_traces(LON, LAT, u, 0 * u, duration=6 * 3600.,
+                             nsteps=12)
+    assert traces.shape[0] == 13 and traces.shape[2] == 2
+    traces = integrate(LON, LAT, u, 0 * u, np.full(3, 100.), lat,
+                       1800., 12, normalize=False)
+    distance = np.degrees(10. * 6 * 3600. / EARTH_RADIUS) / \
+        np.cos(np.radians(lat))
+    assert np.allclose(traces[-1, :, 0] - 100., distance)
+    assert np.allclose(traces[-1, :, 1], lat)
+
+
+def test_streamlines_inside_and_apart():
+    extent = (80, 130, 20, 50)
+    lines = streamlines(LON, LAT, U, V, extent=extent)
+    assert len(lines) > 50
+
+    # the seed cells of `streamlines`
+    spacing = min(extent[1] - extent[0], extent[3] - extent[2]) / 30.
+    nx = int(np.ceil((extent[1] - extent[0]) / spacing))
+    taken = np.zeros(nx * int(np.ceil((extent[3] - extent[2]) / spacing)),
+                     dtype=int)
+    sample = bilinear_sampler(LON, LAT, U, V)
+    for line in lines:
+        assert np.isfinite(line).all()
+        assert (line[:, 0] >= extent[0]).all()
+        assert (line[:, 0] <= extent[1]).all()
+        assert (line[:, 1] >= extent[2]).all()
+        assert (line[:, 1] <= extent[3]).all()
+        cells = np.unique(
+            np.floor((line[:, 1] - extent[2]) / spacing) * nx +
+            np.floor((line[:, 0] - extent[0]) / spacing)).astype(int)
+        assert cells.size >= 3
+        taken[cells] += 1
+
+        # in the wind direction
+        middle = 0.5 * (line[1:] + line[:-1])
+        wind = sample(middle[:, 0], middle[:, 1])
+        step = np.diff(line, axis=0)
+        assert np.all(step[:, 0] * wind.real + step[:, 1] * wind.imag > 0)
+
+    # no two lines share a cell
+    assert taken.max() == 1
+
+
+def test_draw_streamlines():
+    lines = streamlines(LON, LAT, U, V, density=0.5)
+    fig = new_figure(figsize=(4, 3), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1)
+    lc, arrows = draw_streamlines(ax, lines)
+    assert len(lc.get_paths()) == len(lines)
+    assert arrows.N == len(lines)
+    fig.canvas.draw()
+    close_figure(fig)
@@ -0,0 +1,66 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the XYZ tile renderer.
+"""
+
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from matplotlib import colormaps
+from dk_met_graphics.plot.tiles import (
+    render_tiles, nearest_index, wrap_longitudes)
+
+
+def decode(png):
+    return np.asarray(Image.open(io.BytesIO(png)))
+
+
+def global_field(lon, lat):
+    return np.cos(np.radians(lat))[:, None] * np.sin(np.radians(lon))[None, :]
+
+
+def test_global_grid_0_360():
+    lat = np.arange(-90, 90.1, 1.)
+    lon360 = np.arange(0, 360, 1.)
+    lon180 = np.arange(-180, 180, 1.)
+    kwargs = dict(cmap=colormaps['viridis'], vmin=-1, vmax=1, zooms=(0, 2))
+    data180 = global_field(lon180, lat)
+    # the same values, rolled to start at 0 degree
+    data360 = np.roll(data180, 180, axis=1)
+    tiles360 = render_tiles(lon360, lat, data360, **kwargs)
+    tiles180 = render_tiles(lon180, lat, data180, **kwargs)
+    assert sorted(tiles360) == sorted(tiles180)
+    assert len(tiles360) == 1 + 4 + 16
+    for key, png in tiles360.items():
+        assert np.array_equal(decode(png), decode(tiles180[key]))
+
+    # the western hemisphere and the dateline are filled
+    for key in [(1, 0, 0), (1, 0, 1), (0, 0, 0), (2, 0, 1), (2, 3, 2)]:
+        assert np.all(decode(tiles360[key])[..., 3] == 255), key
+
+
+def test_regional_grid_across_0():
+    lon = np.arange(-20, 20.1, 0.5)
+    lat = np.arange(30, 60.1, 0.5)
+    data = np.ones((lat.size, lon.size))
+    tiles = render_tiles(lon % 360, lat, data, colormaps['viridis'],
+                         vmin=0, vmax=2, zooms=(2, 2))
+    # tiles on both sides of the prime meridian
+    assert {(2, 1, 1), (2, 2, 1)} <= set(tiles)
+
+
+def test_wrap_longitudes():
+    lon = np.arange(0, 360.1, 90.)
+    data = np.arange(lon.size, dtype=float)[None, :]
+    wrapped, field = wrap_longitudes(lon, data)
+    assert list(wrapped) == [-270., -180., -90., 0., 90., 180.]
+    assert list(field[0]) == [1., 2., 3., 0., 1., 2.]
+
+
+def test_single_point_axis():
+    assert list(nearest_index([5.], [4., 5., 6.])) == [-1, 0, -1]
+    with pytest.raises(ValueError):
+        render_tiles(np.array([100.]), np.arange(20, 30.), np.ones((10, 1)),
+                     colormaps['viridis'])
@@ -0,0 +1,99 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the plot utilities.
+"""
+
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from dk_met_graphics.plot.util import (
+    new_figure, close_figure, figure_to_bytes, encode_figure)
+
+
+@pytest.fixture
+def figure():
+    fig = new_figure(figsize=(3, 2), dpi=50, pyplot=False)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.pcolormesh(np.arange(64.).reshape(8, 8), cmap='viridis')
+    yield fig
+    close_figure(fig)
+
+
+def decode(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_png_matches_savefig(figure):
+    image = decode(figure_to_bytes(figure, compress_level=1))
+    buf = io.BytesIO()
+    figure.savefig(buf, format='png')
+    reference = Image.open(buf)
+    assert image.size == (150, 100)
+    assert np.array_equal(np.asarray(image.convert('RGBA')),
+                          np.asarray(reference.convert('RGBA')))
+
+
+def test_png_quantize_and_dpi(figure):
+    image = decode(figure_to_bytes(figure, quantize=16, dpi=100))
+    assert image.mode == 'P' and image.size == (300, 200)
+    assert len(image.getcolors()) <= 16
+    # the figure resolution is restored
+    assert figure.dpi == 50
+
+
+def test_webp_and_options(figure):
+    image = decode(encode_figure(figure, 'webp'))
+    assert image.format == 'WEBP' and image.size == (150, 100)
+    lossless = decode(encode_figure(
+        figure, {'format': 'webp', 'lossless': True}))
+    assert np.array_equal(
+        np.asarray(lossless.convert('RGBA')),
+        np.asarray(decode(figure_to_bytes(figure)).convert('RGBA')))
+    with pytest.raises(ValueError):
+        figure_to_bytes(figure, format='gif')
+
+
+def test_grid_coords_shared():
+    import gc
+    from dk_met_graphics.plot import util
+
+    lon = np.arange(70., 140., 0.5)
+    lat = np.arange(15., 55., 0.5)
+    x, y = util.grid_coords(lon, lat)
+    assert x.shape == y.shape == (lat.size, lon.size)
+    assert np.array_equal(x[0], lon) and np.array_equal(y[:, 0], lat)
+    assert not x.flags.writeable and not y.flags.writeable
+
+    # the same grid reuses the arrays, equal copies of the coordinates
+    # too, another grid does not
+    x2, y2 = util.grid_coords(lon.copy(), list(lat))
+    assert x2 is x and y2 is y
+    assert util.grid_coords(lon, lat + 1)[1] is not y
+
+    # released when no layer uses them anymore
+    count = len(util._GRID_COORDS)
+    del x, y, x2, y2
+    gc.collect()
+    assert len(util._GRID_COORDS) < count
+
+    # 2-D coordinates are returned as they are
+    x, y = np.meshgrid(lon, lat)
+    assert util.grid_coords(x, y)[0] is x
+
+
+def test_grid_coords_contour_layers():
+    from dk_met_graphics.plot.util import grid_coords
+    fig = new_figure(figsize=(3, 2), pyplot=False)
+    ax = fig.add_subplot(1, 1, 1)
+    lon = np.linspace(0, 10, 50)
+    lat = np.linspace(0, 5, 40)
+    x, y = grid_coords(lon, lat)
+    field = np.sin(x) * np.cos(y)
+    # layers drawn on the shared read-only arrays
+    ax.contourf(x, y, field, 5)
+    ax.contour(*grid_coords(lon, lat), -field, 5)
+    fig.canvas.draw()
+    assert grid_coords(lon, lat)[0] is x
+    close_figure(fig)
@@ -0,0 +1,124 @@
+# _*_ coding: utf-8 _*_
+
+"""
+Tests of the zonal statistics against a brute-force loop over zones.
+"""
+
+import numpy as np
+import pytest
+from dk_met_graphics.zonal import zonal_stats, region_stats
+from dk_met_graphics.region import RegionMasker
+
+
+STATS = ('mean', 'sum', 'max', 'min', 'count', 'std')
+
+
+def brute_force(field, masks, weights=None):
+    """Statistics of every zone mask with numpy nan-functions."""
+    result = {name: [] for name in STATS + ('p50', 'p90')}
+    for mask in masks:
+        values = field[mask]
+        valid = ~np.isnan(values)
+        w = np.ones(values.size) if weights is None else weights[mask]
+        if not valid.any():
+            for name in result:
+                result[name].append(0 if name == 'count' else np.nan)
+            continue
+        v, w = values[valid], w[valid]
+        mean = np.sum(v * w) / np.sum(w)
+        result['mean'].append(mean)
+        result['sum'].append(np.sum(v))
+        result['max'].append(np.max(v))
+        result['min'].append(np.min(v))
+        result['count'].append(v.size)
+        result['std'].append(np.sqrt(np.sum((v - mean) ** 2 * w) /
+                                     np.sum(w)))
+        result['p50'].append(np.percentile(v, 50))
+        result['p90'].append(np.percentile(v, 90))
+    return {name: np.array(value) for name, value in result.items()}
+
+
+def check(result, expected):
+    for name, value in expected.items():
+        np.testing.assert_allclose(result[name], value, rtol=1e-10,
+                                   err_msg=name)
+
+
+def sample():
+    rng = np.random.RandomState(0)
+    field = rng.gamma(0.5, 10., size=(40, 60))
+    field[rng.random_sample(field.shape) < 0.1] = np.nan
+    labels = rng.randint(0, 5, size=field.shape)
+    # zone 3 has only missing values, zone 5 has no cells
+    field[labels == 3] = np.nan
+    return field, labels
+
+
+def test_labels_match_brute_force():
+    field, labels = sample()
+    masks = [labels == i for i in range(1, 6)]
+    result = zonal_stats(field, labels, nzones=5, stats=STATS,
+                         percentiles=[50, 90])
+    check(result, brute_force(field, masks))
+    assert result['count'][2] == 0 and result['count'][4] == 0
+    assert np.isnan(result['mean'][4]) and np.isnan(result['p90'][2])
+
+
+def test_weighted_stack():
+    field, labels = sample()
+    lat = np.linspace(10, 60, field.shape[0])
+    stack = np.stack([field, field * 2, np.flipud(field)])
+    result = zonal_stats(stack, labels, nzones=5, stats=STATS,
+                         percentiles=[50, 90], lat=lat, weighted=True)
+    weights = np.broadcast_to(np.cos(np.deg2rad(lat))[:, None],
+                              field.shape)
+    masks = [labels == i for i in range(1, 6)]
+    for t, f in enumerate(stack):
+        check({name: value[t] for name, value in result.items()},
+              brute_force(f, masks, weights))
+
+
+def test_overlapping_members():
+    field, _ = sample()
+    ny, nx = field.shape
+    masks = np.zeros((4, ny, nx), dtype=bool)
+    masks[0, 5:30, 5:40] = True
+    masks[1, 20:35, 30:55] = True
+    masks[2, 20:35, 30:55] = True
+    # zone 3 is empty
+    zones, cells = np.nonzero(masks.reshape(4, -1))
+    result = zonal_stats(field, (zones, cells), nzones=4, stats=STATS,
+                         percentiles=[50, 90])
+    check(result, brute_force(field, masks))
+    assert result['count'][3] == 0
+
+
+def test_shape_mismatch():
+    field, labels = sample()
+    with pytest.raises(ValueError):
+        zonal_stats(field, labels[:-1])
+    with pytest.raises(ValueError):
+        zonal_stats(field, (np.array([0]), np.array([field.size])))
+    with pytest.raises(ValueError):
+        zonal_stats(field, labels, stats=['median'])
+
+
+def test_region_stats_overlapping_catchments():
+    lon = np.arange(110, 123, 0.1)
+    lat = np.arange(25, 36, 0.1)
+    rng = np.random.RandomState(1)
+    rain = rng.gamma(0.5, 10., size=(lat.size, lon.size))
+    regions = ['changjiang', 'taihu', 'huaihe', 'liaohe']
+    df = region_stats(rain, lon, lat, layer='catchment', regions=regions,
+                      stats=STATS, weighted=False)
+    masks = RegionMasker('catchment').masks(lon, lat, regions)
+    expected = brute_force(rain, list(masks.values()))
+    assert list(df.index) == regions
+    for name in STATS:
+        np.testing.assert_allclose(df[name].values, expected[name],
+                                   rtol=1e-10, err_msg=name)
+    # taihu overlaps changjiang, both keep their common cells
+    assert (masks['changjiang'] & masks['taihu']).sum() > 0
+    assert df.loc['taihu', 'count'] == masks['taihu'].sum()
+    # liaohe is outside the grid
+    assert df.loc['liaohe', 'count'] == 0